@@ -1,43 +1,91 @@
 import requests
 from collections import defaultdict
 from datetime import datetime
+import functools
 import json
-import itertools
 import argparse
-
-from twilio.rest import Client
-
-import smtplib
-import ssl
-
+from concurrent.futures import ThreadPoolExecutor
+
+from availability_matrix import AvailabilityMatrix
+from intervals import IntervalIndex, days_to_intervals, intervals_to_days
+from month_stream import CHUNK_SIZE, iter_available, collect_available
+from snapshot_store import SnapshotStore
+from fetch_cache import MonthCache, is_past_month
+from metrics import TimedHTTPAdapter, export, timed
+from rate_limit import RateLimitedAdapter, get_retry_after, is_throttled
+from notifiers import DEFAULT_RETRIES, NotificationDispatcher, add_notifier_args, build_notifiers, check_notifier_args
+from notification_pipeline import (DEFAULT_DEBOUNCE, DEFAULT_MAX_DELAY, DEFAULT_TTL, Notice, NotificationCache,
+        NotificationPipeline)
+
+
+# URL templates, formatted with a campground ID
+RECREATION_URL = "https://www.recreation.gov/"
+CAMPGROUND_URL = RECREATION_URL + "camping/campgrounds/{}"
+REFERRER_URL = CAMPGROUND_URL + "/availability"
+MONTH_URL = RECREATION_URL + "api/camps/availability/campground/{}/month"
+DEFAULT_CAMPGROUND_ID = 232199
 
 REQUEST_HEADERS = {"user-agent": "Chrome/71.0.3578.98",
         "origin": "https://www.recreation.gov",
         "authority":"www.recreation.gov",
-        "referrer":"https://www.recreation.gov/camping/campgrounds/232199/availability",
+        "referrer":REFERRER_URL.format(DEFAULT_CAMPGROUND_ID),
         "content-type":"application/json;charset=UTF-8"}
-BASE_URL = "https://www.recreation.gov/api/camps/availability/campground/232199/month"
+BASE_URL = MONTH_URL.format(DEFAULT_CAMPGROUND_ID)
 JUNE_PARAMS = {"start_date": "2026-06-01T00:00:00.000Z"}
 JULY_PARAMS = {"start_date": "2026-07-01T00:00:00.000Z"}
 AUG_PARAMS = {"start_date": "2026-08-01T00:00:00.000Z"}
+# The format of the start_date param for the month endpoint
+MONTH_PARAM_FORMAT = "%Y-%m-01T00:00:00.000Z"
+DEFAULT_MONTHS = [datetime(2026,7,1), datetime(2026,8,1)]
+# How many month requests are allowed in flight at once
+DEFAULT_MAX_WORKERS = 8
 # The format used in dates returned by recreation.gov
 WEB_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 # Easier to read date format.
 SHORT_DATE_FORMAT = "%m/%d"
 # Reference point for counting number of days since start of the year
 REF_DATE = datetime(2026,1,1)
+REF_ORDINAL = REF_DATE.toordinal()
+# Days before the first of each month, for common and leap years
+DAYS_BEFORE_MONTH = (
+        (0, 0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334),
+        (0, 0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335))
 
-BOOKING_URL = "https://www.recreation.gov/camping/campgrounds/232199"
+BOOKING_URL = CAMPGROUND_URL.format(DEFAULT_CAMPGROUND_ID)
 
 DEFAULT_JSON = "available.json"
+DEFAULT_STORE = "available.snapshot"
 DEFAULT_MIN_STAY_LENGTH = 1
 
 
-def to_datetime(datestr):
-        return datetime.strptime(datestr, SHORT_DATE_FORMAT)
+# Availability is kept as integer days since REF_DATE. Dates are only turned
+# into SHORT_DATE_FORMAT strings when they're shown to someone.
+
+@functools.lru_cache(maxsize=None)
+def year_to_day(year):
+        return datetime(year, 1, 1).toordinal() - REF_ORDINAL
 
+def is_leap(year):
+        return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+@functools.lru_cache(maxsize=4096)
 def normalize_date(datestr):
-        return datetime.strptime(datestr, WEB_DATE_FORMAT).strftime(SHORT_DATE_FORMAT)
+        # WEB_DATE_FORMAT string to days since REF_DATE, read straight from the
+        # fixed offsets of "YYYY-MM-DD" instead of going through strptime.
+        year = int(datestr[0:4])
+        return year_to_day(year) + DAYS_BEFORE_MONTH[is_leap(year)][int(datestr[5:7])] + int(datestr[8:10]) - 1
+
+def short_date_to_day(datestr):
+        # "MM/DD" (or "M/D") to days since REF_DATE, assuming REF_DATE's year
+        month, day = datestr.split("/")
+        return DAYS_BEFORE_MONTH[is_leap(REF_DATE.year)][int(month)] + int(day) - 1
+
+@functools.lru_cache(maxsize=4096)
+def format_day(day):
+        return datetime.fromordinal(REF_ORDINAL + day).strftime(SHORT_DATE_FORMAT)
+
+def format_days(days):
+        return ", ".join(format_day(d) for d in days)
 
 def in_first_loop(site_number):
         return int(site_number) <= 11
@@ -47,17 +95,168 @@ def in_first_or_second_loop(site_number):
 
 def print_availability(d):
         for k,v in sorted(d.items(), key=lambda x: x[0]):
-                print("Site {} is available on {}".format(k,", ".join(v)))
-
-def get_jsons():
+                print("Site {} is available on {}".format(k, format_days(v)))
+
+def set_base_url(base_url):
+        # Point every request somewhere else, e.g. fake_recreation_server.py
+        global RECREATION_URL, CAMPGROUND_URL, REFERRER_URL, MONTH_URL
+        RECREATION_URL = base_url
+        CAMPGROUND_URL = RECREATION_URL + "camping/campgrounds/{}"
+        REFERRER_URL = CAMPGROUND_URL + "/availability"
+        MONTH_URL = RECREATION_URL + "api/camps/availability/campground/{}/month"
+
+def get_month_url(campground_id):
+        return MONTH_URL.format(campground_id)
+
+def get_booking_url(campground_id):
+        return CAMPGROUND_URL.format(campground_id)
+
+def get_request_headers(campground_id):
+        headers = dict(REQUEST_HEADERS)
+        headers["referrer"] = REFERRER_URL.format(campground_id)
+        return headers
+
+def get_month_params(month):
+        return {"start_date": month.strftime(MONTH_PARAM_FORMAT)}
+
+class FetchError(Exception):
+
+        def __init__(self, message, status=None, retry_after=None):
+                Exception.__init__(self, message)
+                self.status = status
+                self.retry_after = retry_after
+
+def check_response(resp):
+        # Error statuses and error pages raise FetchError rather than
+        # failing later on in parsing
+        if resp.status_code >= 400:
+                retry_after = get_retry_after(resp) if is_throttled(resp.status_code) else None
+                raise FetchError("{} from {}".format(resp.status_code, resp.url), resp.status_code, retry_after)
+        content_type = resp.headers.get("Content-Type", "")
+        if "json" not in content_type:
+                raise FetchError("Expected json from {}, got {}".format(resp.url, content_type or "no content type"), resp.status_code)
+
+def make_session(max_workers=DEFAULT_MAX_WORKERS, bucket=None):
+        # One keep-alive connection pool shared by every fetch, sized so that
+        # each worker thread can hold its own connection. With a TokenBucket
+        # every request waits for its budget.
+        session = requests.Session()
+        if bucket is None:
+                adapter = TimedHTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        else:
+                adapter = RateLimitedAdapter(bucket, pool_connections=max_workers, pool_maxsize=max_workers)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(REQUEST_HEADERS)
+        return session
+
+def fetch_month(session, campground_id, month):
+        with session.get(get_month_url(campground_id), params=get_month_params(month),
+                        headers={"referrer": REFERRER_URL.format(campground_id)}, stream=True) as resp:
+                check_response(resp)
+                with timed("availability_phase_seconds", phase="body"):
+                        body = resp.content
+        with timed("availability_phase_seconds", phase="parse"):
+                return json.loads(body)
+
+def fetch_month_available(session, campground_id, month, site_filter=in_first_loop):
+        # Stream the month payload and keep only (site, day) pairs, without
+        # ever holding the whole document.
+        with session.get(get_month_url(campground_id), params=get_month_params(month),
+                        headers={"referrer": REFERRER_URL.format(campground_id)}, stream=True) as resp:
+                check_response(resp)
+                # Parsed as it's read, so this is body and parse together
+                with timed("availability_phase_seconds", phase="body"):
+                        return list(iter_available(resp.iter_content(CHUNK_SIZE), site_filter, normalize_date))
+
+def map_pairs(func, pairs, session=None, max_workers=DEFAULT_MAX_WORKERS):
+        # Run func(session, campground_id, month) for every pair concurrently.
+        # The returned list is in the same order as 'pairs'.
+        pairs = list(pairs)
+        if not pairs:
+                return []
+        own_session = session is None
+        if own_session:
+                session = make_session(max_workers)
+        try:
+                with ThreadPoolExecutor(max_workers=min(max_workers, len(pairs))) as executor:
+                        futures = [executor.submit(func, session, c, m) for c, m in pairs]
+                        return [f.result() for f in futures]
+        finally:
+                if own_session:
+                        session.close()
+
+def fetch_months(pairs, session=None, max_workers=DEFAULT_MAX_WORKERS):
+        return map_pairs(fetch_month, pairs, session=session, max_workers=max_workers)
+
+def fetch_available(pairs, session=None, max_workers=DEFAULT_MAX_WORKERS, site_filter=in_first_loop):
+        # Streaming equivalent of load_latest_available(fetch_months(pairs))
+        func = lambda session, c, m: fetch_month_available(session, c, m, site_filter)
+        months = map_pairs(func, pairs, session=session, max_workers=max_workers)
+        return collect_available(pair for month in months for pair in month)
+
+def fetch_month_cached(session, cache, campground_id, month):
+        # (site, day) pairs for every numbered site in a month, and whether
+        # it changed since the last fetch. Months that are over aren't fetched.
+        if is_past_month(month):
+                return [], False
+        entry = cache.get(campground_id, month)
+        headers = cache.validators(campground_id, month)
+        headers["referrer"] = REFERRER_URL.format(campground_id)
+        with session.get(get_month_url(campground_id), params=get_month_params(month), headers=headers, stream=True) as resp:
+                if resp.status_code == 304 and entry is not None:
+                        return entry["pairs"], False
+                check_response(resp)
+                etag = resp.headers.get("ETag")
+                last_modified = resp.headers.get("Last-Modified")
+                # Hashed, parsed and written to the cache as it's read, so
+                # this is body and parse together
+                body = cache.stream_body(campground_id, month, resp.iter_content(CHUNK_SIZE))
+                try:
+                        with timed("availability_phase_seconds", phase="body"):
+                                pairs = list(iter_available(body.chunks(), lambda s: True, normalize_date))
+                                digest = body.finish()
+                except Exception:
+                        body.discard()
+                        raise
+        if entry is not None and entry["hash"] == digest:
+                # Same body, keep the pairs as they were
+                if (etag, last_modified) != (entry["etag"], entry["last_modified"]):
+                        cache.put(campground_id, month, etag, last_modified, digest, entry["pairs"])
+                else:
+                        body.discard()
+                return entry["pairs"], False
+        cache.put(campground_id, month, etag, last_modified, digest, pairs)
+        return pairs, True
+
+def fetch_available_cached(pairs, cache, session=None, max_workers=DEFAULT_MAX_WORKERS, site_filter=in_first_loop):
+        # fetch_available through a MonthCache. Also returns whether any
+        # month changed, when none did there's nothing new to diff.
+        func = lambda session, c, m: fetch_month_cached(session, cache, c, m)
+        months = map_pairs(func, pairs, session=session, max_workers=max_workers)
+        available = collect_available((site, day) for month, _ in months for site, day in month if site_filter(site))
+        return available, any(changed for _, changed in months)
+
+def get_jsons(session=None, max_workers=DEFAULT_MAX_WORKERS, cache=None):
         # Get latest data from recreation.gov
-        # june_resp = requests.get(BASE_URL, params=JUNE_PARAMS, headers=REQUEST_HEADERS)
-        july_resp = requests.get(BASE_URL, params=JULY_PARAMS, headers=REQUEST_HEADERS)
-        aug_resp = requests.get(BASE_URL, params=AUG_PARAMS, headers=REQUEST_HEADERS)
-        return [july_resp.json(), aug_resp.json()]
+        pairs = [(DEFAULT_CAMPGROUND_ID, month) for month in DEFAULT_MONTHS]
+        if cache is None:
+                return fetch_months(pairs, session=session, max_workers=max_workers)
+        map_pairs(lambda session, c, m: fetch_month_cached(session, cache, c, m), pairs, session=session, max_workers=max_workers)
+        return [{"campsites": {}} if is_past_month(m) else cache.load_json(c, m) for c, m in pairs]
+
+def get_latest_available(session=None, max_workers=DEFAULT_MAX_WORKERS, cache=None):
+        pairs = [(DEFAULT_CAMPGROUND_ID, month) for month in DEFAULT_MONTHS]
+        if cache is None:
+                return fetch_available(pairs, session=session, max_workers=max_workers)
+        return fetch_available_cached(pairs, cache, session=session, max_workers=max_workers)[0]
 
 
-def load_latest_available(jsons):
+def load_latest_available(jsons, site_filter=in_first_loop):
+        with timed("availability_phase_seconds", phase="filter"):
+                return filter_available(jsons, site_filter)
+
+def filter_available(jsons, site_filter):
         latest_availability = defaultdict(list)
         for j in jsons:
                 campsites = j["campsites"]
@@ -66,7 +265,7 @@ def load_latest_available(jsons):
                                 # Not a numbered site
                                 continue
                         site_number = campsite["site"]
-                        if not in_first_loop(site_number):
+                        if not site_filter(site_number):
                                 # Not a site we're interested in
                                 continue
                         dates = campsite["availabilities"]
@@ -75,60 +274,83 @@ def load_latest_available(jsons):
                                 latest_availability[site_number].extend(sorted(available_dates))
         return latest_availability
 
+def to_matrices(prev, latest, sites=None):
+        # Matrices for both snapshots over 'sites' (by default the sites in
+        # 'latest'), sharing the first day seen as their day 0.
+        if sites is None:
+                sites = sorted(latest)
+        all_days = [d for v in latest.values() for d in v] + [d for k in sites for d in prev.get(k, [])]
+        first_day = min(all_days, default=0)
+        num_days = max(all_days, default=0) - first_day + 1
+        def to_matrix(availability):
+                site_days = {k: [d - first_day for d in availability[k]] for k in sites if k in availability}
+                return AvailabilityMatrix.from_days(site_days, sites=sites, days=num_days)
+        return to_matrix(prev), to_matrix(latest), first_day
+
+def from_matrix(matrix, first_day):
+        return {k: [d + first_day for d in v] for k, v in matrix.to_days().items()}
+
 def get_new_availability(prev, latest, min_length=1):
-        new_availability = {}
-        for k, v in latest.items():
-                if k not in prev:
-                        new_availability[k] = v
-                else:
-                        new_dates = set(latest[k]).difference(set(prev[k]))
-                        if len(new_dates) > 0:
-                                new_availability[k] = new_dates
-        return new_availability
+        prev_matrix, latest_matrix, first_day = to_matrices(prev, latest)
+        return from_matrix(latest_matrix.new_days(prev_matrix), first_day)
 
 def get_new_availability_interval(prev, latest, min_length=1):
-        new_availability = {}
-        new_dates = []
-        for k, v in latest.items():
-                if k not in prev:
-                        new_dates = get_site_new_availability([],v, min_length)
-                else:
-                        new_dates = get_site_new_availability(prev[k], v, min_length)
-                if len(new_dates) > 0:
-                        new_availability[k] = new_dates
-        return new_availability
+        with timed("availability_phase_seconds", phase="diff"):
+                prev_matrix, latest_matrix, first_day = to_matrices(prev, latest)
+                return from_matrix(latest_matrix.new_runs(prev_matrix, min_length), first_day)
 
+def get_new_intervals(prev, latest, min_length=1):
+        # Same as get_new_availability_interval, as [start, end) runs of days
+        return {k: days_to_intervals(v) for k, v in get_new_availability_interval(prev, latest, min_length).items()}
+
+def get_changed_days(prev, latest):
+        # Days added and removed for every site in either snapshot
+        sites = sorted(set(prev) | set(latest))
+        prev_matrix, latest_matrix, first_day = to_matrices(prev, latest, sites)
+        added = from_matrix(latest_matrix.new_days(prev_matrix), first_day)
+        removed = from_matrix(prev_matrix.new_days(latest_matrix), first_day)
+        return added, removed
 
-def get_site_new_availability(prev_dates, latest_dates, min_length):
-        prev_dates_set = set(prev_dates)
-        latest_dates_sorted = sorted(latest_dates)
-        new_dates = []
-        new_intervals = []
 
-        grouping_func = lambda date, c=itertools.count() : (to_datetime(date) - REF_DATE).days - next(c)
-        grouped_latest_dates = itertools.groupby(sorted(latest_dates), grouping_func)
+def get_site_new_intervals(prev_dates, latest_dates, min_length):
+        index = IntervalIndex(prev_dates)
+        index.snapshot()
+        index.update(latest_dates)
+        return index.changes(min_length)
+
+def get_site_new_availability(prev_dates, latest_dates, min_length):
+        return intervals_to_days(get_site_new_intervals(prev_dates, latest_dates, min_length))
 
-        for item in grouped_latest_dates:
-                dates = list(item[1])
-                if len(dates) < min_length:
-                        continue
-                if any(date not in prev_dates_set for date in dates):
-                        new_dates.extend(dates)
-                        new_intervals.append(dates)
 
-        return new_dates #new_intervals
+def load_store(store, json_file=None):
+        # Previous availability from a SnapshotStore, falling back to the json
+        # file older versions wrote when the store is still empty.
+        if store.is_empty() and json_file is not None:
+                return load_previous(json_file)
+        return store.load()
 
+def save_store(store, prev, latest, changes=None):
+        # An empty store gets a full first record so its history can be replayed
+        if store.is_empty():
+                changes = None
+        elif changes is None:
+                changes = get_changed_days(prev, latest)
+        store.commit(latest, changes=changes)
 
 def load_previous(filename):
         try:
                 with open(filename, 'r') as jsonfile:
-                        return json.load(jsonfile)
+                        previous = json.load(jsonfile)
         except Exception:
                 print("Couldn't load json")
                 return {}
+        # Files saved before dates were stored as day numbers hold "MM/DD" strings
+        return {k: [short_date_to_day(d) if isinstance(d, str) else d for d in v] for k, v in previous.items()}
 
-def send_sms(message, account_sid, auth_token, phone_from="", phone_list_to=[]):
-        client = Client(account_sid, auth_token)
+def send_sms(message, account_sid, auth_token, phone_from="", phone_list_to=[], client=None):
+        if client is None:
+                from twilio.rest import Client
+                client = Client(account_sid, auth_token)
         for phone_to in phone_list_to:
                 print("Sending sms to {}".format(phone_to))
                 try:
@@ -140,6 +362,8 @@ def send_sms(message, account_sid, auth_token, phone_from="", phone_list_to=[]):
                         print("Unable to send sms to {}: {}".format(phone_to, e))
 
 def send_email(subject, message_body, email_from, email_from_password, email_list_to=[]):
+        import smtplib
+        import ssl
         port = 465
         context = ssl.create_default_context()
         message = """\
@@ -155,9 +379,9 @@ Subject: {}
                         except Exception as e:
                                 print("Unable to send email to {0}: {1}".format(email_to, e))
 
-def send_pushover(message, user_key, api_token):
+def send_pushover(message, user_key, api_token, session=requests):
         try:
-                response = requests.post("https://api.pushover.net/1/messages.json", data={"token": api_token, "user": user_key, "message": message})
+                response = session.post("https://api.pushover.net/1/messages.json", data={"token": api_token, "user": user_key, "message": message})
                 response.raise_for_status()
                 print("Pushover notification sent!")
         except Exception as e:
@@ -168,70 +392,94 @@ def save_latest(latest, filename):
         with open(filename, 'w') as jsonfile:
                 json.dump(latest, jsonfile)
 
-if __name__ == "__main__":
-
+def build_parser():
         parser = argparse.ArgumentParser()
         parser.add_argument("-min", "--min_stay_length", default=DEFAULT_MIN_STAY_LENGTH, type=int)
+        parser.add_argument("--store", default=DEFAULT_STORE)
+        # Only read, to seed an empty --store from an older run
         parser.add_argument("--json", default=DEFAULT_JSON)
-        parser.add_argument("--enable_sms", action="store_true")
-        parser.add_argument("-sid", "--twilio_sid")
-        parser.add_argument("-auth", "--twilio_auth_token")
-        parser.add_argument("--phone_from")
-        parser.add_argument("--phone_to", action="append")
-        parser.add_argument("--enable_email", action="store_true")
-        parser.add_argument("--email_from")
-        parser.add_argument("--email_from_password")
-        parser.add_argument("--email_to", action="append")
-        parser.add_argument("--enable_pushover", action="store_true")
-        parser.add_argument("--pushover_user_key")
-        parser.add_argument("--pushover_api_token")
+        parser.add_argument("--max_workers", default=DEFAULT_MAX_WORKERS, type=int)
+        parser.add_argument("--cache_dir", help="Keep month responses here and only fetch what changed")
+        parser.add_argument("--base_url", help="Use another server, e.g. http://localhost:8080/ for fake_recreation_server.py")
+        add_notifier_args(parser)
+        parser.add_argument("--notify_retries", default=DEFAULT_RETRIES, type=int)
+        parser.add_argument("--notify_cache", help="Remember what was sent here, so later runs don't send it again")
+        parser.add_argument("--notify_ttl", default=DEFAULT_TTL, type=float, help="Seconds before the same interval is sent again")
+        parser.add_argument("--debounce", default=DEFAULT_DEBOUNCE, type=float,
+                help="Wait until nothing new has turned up for this many seconds, then send one digest")
+        parser.add_argument("--max_delay", default=DEFAULT_MAX_DELAY, type=float, help="Longest a digest waits with --debounce")
+        parser.add_argument("--metrics", help="Write phase timings here, Prometheus text if it ends in .prom, otherwise JSONL")
         parser.add_argument("--test_email", default=False, type=bool)
         parser.add_argument("--test_sms", default=False, type=bool)
         parser.add_argument("--test_pushover", default=False, type=bool)
+        return parser
+
+def check_args(args):
+        if args.base_url is not None:
+                set_base_url(args.base_url)
+        check_notifier_args(args)
+
+def build_message(new_availability, min_stay_length):
+        message = "New availability with {} days or more:".format(min_stay_length)
+        for k,v in sorted(new_availability.items(), key=lambda x: x[0]):
+                message += "\n  Site {} on {}".format(k, format_days(v))
+        return message
+
+def build_dispatcher(args, session=None):
+        return NotificationDispatcher(build_notifiers(args, session=session), retries=args.notify_retries)
+
+def build_pipeline(args, dispatcher):
+        cache = NotificationCache(args.notify_cache, args.notify_ttl)
+        return NotificationPipeline(dispatcher, cache, args.debounce, args.max_delay)
+
+def build_notices(notifiers, campground_id, new_intervals, booking_url=BOOKING_URL, detected=None):
+        # A Notice per new interval for every recipient of every channel
+        notices = []
+        for site, intervals in sorted(new_intervals.items()):
+                for start, end in intervals:
+                        line = "Site {} on {}".format(site, format_days(range(start, end)))
+                        for notifier in notifiers:
+                                for recipient in notifier.recipients:
+                                        notices.append(Notice(notifier.channel, recipient, campground_id, site, start, end,
+                                                line, booking_url, detected=detected))
+        return notices
+
+if __name__ == "__main__":
+
+        parser = build_parser()
         args = parser.parse_args()
-        if args.enable_sms and (
-                args.twilio_sid is None or args.twilio_auth_token is None or args.phone_from is None or args.phone_to is None):
-                raise ValueError("If --enable_sms is set, must provide --twilio_auth_token, --twilio_sid, --phone_from and --phone_to.")
-        if args.enable_email and (args.email_from is None or args.email_to is None or args.email_from_password is None):
-                raise ValueError("If --enable_email is set, must provide --email_from, --email_from_password and --email_to.")
-        if args.enable_pushover and (args.pushover_user_key is None or args.pushover_api_token is None):
-                raise ValueError("If --enable_pushover is set, must provide --pushover_user_key and --pushover_api_token.")
-
-        json_file = args.json
+        check_args(args)
+
+        store = SnapshotStore(args.store)
         min_stay_length = args.min_stay_length
 
         # Get the most recent data
-        jsons = get_jsons()
-        latest_availability = load_latest_available(jsons)
+        cache = MonthCache(args.cache_dir) if args.cache_dir else None
+        latest_availability = get_latest_available(max_workers=args.max_workers, cache=cache)
         print_availability(latest_availability)
 
         # Get the data from the previous run
-        prev_availability = load_previous(json_file)
+        prev_availability = load_store(store, args.json)
 
         new_availability = get_new_availability_interval(prev_availability, latest_availability, min_stay_length)
         if not new_availability:
                 print("No new availability with at least {} days.".format(min_stay_length))
         else:
-                message = "New availability with {} days or more:".format(min_stay_length)
-                for k,v in sorted(new_availability.items(), key=lambda x: x[0]):
-                        message += "\n  Site {} on {}".format(k, ", ".join(v))
+                message = build_message(new_availability, min_stay_length)
                 print (message)
-
-                if args.enable_sms:
-                        sms_message = message + "\n" + BOOKING_URL
-                        send_sms(sms_message, args.twilio_sid, args.twilio_auth_token, phone_from=args.phone_from, phone_list_to=args.phone_to)
-
-                if args.enable_email:
-                        subject = "New availability on {}".format(", ".join(new_availability.values()))
-                        body = message + "\n\nReserve sites at " + BOOKING_URL
-                        send_email(subject, body, args.email_from, args.email_from_password, email_list_to=args.email_to)
-
-                if args.enable_pushover:
-                        push_message = message + "\n" + BOOKING_URL
-                        send_pushover(push_message, args.pushover_user_key, args.pushover_api_token)
+                dispatcher = build_dispatcher(args)
+                pipeline = build_pipeline(args, dispatcher)
+                new_intervals = {k: days_to_intervals(v) for k, v in new_availability.items()}
+                pipeline.add(build_notices(dispatcher.notifiers, DEFAULT_CAMPGROUND_ID, new_intervals))
+                # One run, nothing to wait for
+                pipeline.close()
+                dispatcher.close()
 
         # Save data to compare against next time
-        save_latest(latest_availability, json_file)
+        save_store(store, prev_availability, latest_availability)
+        store.close()
+        if args.metrics:
+                export(args.metrics)
         
         if (args.test_email):
             # Send test emails
@@ -0,0 +1,102 @@
+# Site x day availability packed into a single int.
+#
+# Each site is one row of 'stride' bits, bit d of a row is set when the site
+# is available on day d. Rows are padded to a whole number of bytes with at
+# least one zero guard bit on top, so shifting the whole matrix never carries
+# a day from one site into the next. That lets every operation below run on
+# all sites at once with plain int arithmetic.
+
+DAYS_PER_YEAR = 366
+
+
+def row_to_days(row):
+        days = []
+        while row:
+                low = row & -row
+                days.append(low.bit_length() - 1)
+                row ^= low
+        return days
+
+def days_to_row(days):
+        row = 0
+        for d in days:
+                row |= 1 << d
+        return row
+
+class AvailabilityMatrix:
+
+        def __init__(self, sites, days=DAYS_PER_YEAR, bits=0):
+                self.sites = list(sites)
+                self.rows = {site: i for i, site in enumerate(self.sites)}
+                self.days = days
+                self.row_bytes = days // 8 + 1
+                self.stride = self.row_bytes * 8
+                self.bits = bits
+
+        @classmethod
+        def from_days(cls, site_days, sites=None, days=DAYS_PER_YEAR):
+                # site_days maps a site to the day indexes it is available on.
+                # Sites not in 'sites' are dropped.
+                matrix = cls(sorted(site_days) if sites is None else sites, days)
+                empty = bytes(matrix.row_bytes)
+                rows = []
+                for site in matrix.sites:
+                        if site in site_days:
+                                rows.append(days_to_row(site_days[site]).to_bytes(matrix.row_bytes, "little"))
+                        else:
+                                rows.append(empty)
+                matrix.bits = int.from_bytes(b"".join(rows), "little")
+                return matrix
+
+        def like(self, bits):
+                matrix = AvailabilityMatrix(self.sites, self.days)
+                matrix.bits = bits
+                return matrix
+
+        def row(self, site):
+                return (self.bits >> (self.rows[site] * self.stride)) & ((1 << self.stride) - 1)
+
+        def to_days(self):
+                # Inverse of from_days, leaving out sites with no availability
+                site_days = {}
+                data = self.bits.to_bytes(len(self.sites) * self.row_bytes, "little")
+                for i, site in enumerate(self.sites):
+                        row = int.from_bytes(data[i*self.row_bytes:(i+1)*self.row_bytes], "little")
+                        if row:
+                                site_days[site] = row_to_days(row)
+                return site_days
+
+        def runs_at_least(self, min_length):
+                # Bits that belong to a run of at least min_length set days.
+                starts = self.bits
+                for i in range(1, min_length):
+                        starts &= self.bits >> i
+                runs = starts
+                for i in range(1, min_length):
+                        runs |= starts << i
+                return runs
+
+        def fill_runs(self, seeds, runs):
+                # Grow every seed bit to cover the whole run of 'runs' it sits
+                # in (Kogge-Stone fill, both directions, log2(days) steps).
+                up = down = seeds
+                up_pro = down_pro = runs
+                shift = 1
+                while shift < self.stride:
+                        up |= up_pro & (up << shift)
+                        up_pro &= up_pro << shift
+                        down |= down_pro & (down >> shift)
+                        down_pro &= down_pro >> shift
+                        shift *= 2
+                return (up | down) & runs
+
+        def new_days(self, prev):
+                # Days available now that weren't before
+                return self.like(self.bits & ~prev.bits)
+
+        def new_runs(self, prev, min_length=1):
+                # Whole runs of at least min_length days that contain at least
+                # one day that wasn't available in 'prev'.
+                runs = self.runs_at_least(min_length)
+                seeds = runs & ~prev.bits
+                return self.like(self.fill_runs(seeds, runs))
@@ -0,0 +1,159 @@
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from availability import *
+from month_stream import CHUNK_SIZE, iter_available, collect_available
+from synthetic_months import churn_payload, make_month_payload
+
+# Synthetic benchmark of the availability pipeline. Month payloads shaped
+# like recreation.gov's are generated for a configurable number of sites,
+# months and availability density, then a second snapshot is made by
+# flipping a fraction of the days (churn). Each stage is timed on its own,
+# and the results can be saved as json and compared against an earlier run.
+
+STAGES = ["parse", "filter", "normalize", "stream", "diff", "message"]
+DEFAULT_REGRESSION_THRESHOLD = 1.2
+
+
+def make_snapshots(sites, months, density, churn, seed):
+        rng = random.Random(seed)
+        start = REF_DATE.replace(month=6)
+        month_starts = []
+        for m in range(months):
+                month_starts.append(start)
+                start = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        prev = [make_month_payload(m, sites, density, rng) for m in month_starts]
+        latest = [churn_payload(p, churn, rng) for p in prev]
+        return prev, latest
+
+def filter_campsites(jsons, site_filter):
+        return [c for j in jsons for c in j["campsites"].values() if c["site"].isdigit() and site_filter(c["site"])]
+
+def normalize_campsites(campsites):
+        availability = defaultdict(list)
+        for c in campsites:
+                available_dates = [normalize_date(k) for k, v in c["availabilities"].items() if v == "Available"]
+                if available_dates:
+                        availability[c["site"]].extend(sorted(available_dates))
+        return availability
+
+def run_stages(bodies, prev_availability, site_filter, min_stay_length):
+        # Returns [(stage name, function)] run in order, each taking the
+        # previous stage's result.
+        results = {}
+        def parse():
+                results["jsons"] = [json.loads(b) for b in bodies]
+        def filter_():
+                results["campsites"] = filter_campsites(results["jsons"], site_filter)
+        def normalize():
+                normalize_date.cache_clear()
+                results["latest"] = normalize_campsites(results["campsites"])
+        def stream():
+                normalize_date.cache_clear()
+                chunks = (b[i:i + CHUNK_SIZE] for b in bodies for i in range(0, len(b), CHUNK_SIZE))
+                results["streamed"] = collect_available(iter_available(chunks, site_filter, normalize_date))
+        def diff():
+                results["new"] = get_new_availability_interval(prev_availability, results["latest"], min_stay_length)
+        def message():
+                results["message"] = build_message(results["new"], min_stay_length)
+        return results, [("parse", parse), ("filter", filter_), ("normalize", normalize),
+                ("stream", stream), ("diff", diff), ("message", message)]
+
+def benchmark(args):
+        prev_jsons, latest_jsons = make_snapshots(args.sites, args.months, args.density, args.churn, args.seed)
+        prev_availability = load_latest_available(prev_jsons, site_filter=lambda s: True)
+        bodies = [json.dumps(j).encode("utf-8") for j in latest_jsons]
+        site_filter = lambda s: True
+
+        timings = {name: [] for name in STAGES}
+        peaks = {name: 0 for name in STAGES}
+        for i in range(args.repeat + 1):
+                results, stages = run_stages(bodies, prev_availability, site_filter, args.min_stay_length)
+                for name, func in stages:
+                        start = time.perf_counter()
+                        func()
+                        elapsed = time.perf_counter() - start
+                        # The first round is a warm up
+                        if i > 0:
+                                timings[name].append(elapsed)
+                if args.memory:
+                        results, stages = run_stages(bodies, prev_availability, site_filter, args.min_stay_length)
+                        for name, func in stages:
+                                tracemalloc.start()
+                                func()
+                                peaks[name] = max(peaks[name], tracemalloc.get_traced_memory()[1])
+                                tracemalloc.stop()
+
+        assert results["streamed"] == results["latest"]
+        return {
+                "config": {"sites": args.sites, "months": args.months, "density": args.density, "churn": args.churn,
+                        "min_stay_length": args.min_stay_length, "repeat": args.repeat, "seed": args.seed},
+                "payload_bytes": sum(len(b) for b in bodies),
+                "available_days": sum(len(v) for v in results["latest"].values()),
+                "new_days": sum(len(v) for v in results["new"].values()),
+                "stages": {name: {"seconds": statistics.median(timings[name]), "min_seconds": min(timings[name]),
+                        "peak_bytes": peaks[name] if args.memory else None} for name in STAGES},
+                "python": platform.python_version(),
+                "timestamp": datetime.now().isoformat(),
+        }
+
+def print_results(results):
+        print("{} sites x {} months, density {}, churn {}: {:.1f} MB payload, {} available days, {} new".format(
+                results["config"]["sites"], results["config"]["months"], results["config"]["density"],
+                results["config"]["churn"], results["payload_bytes"] / 1e6, results["available_days"], results["new_days"]))
+        for name in STAGES:
+                stage = results["stages"][name]
+                peak = "" if stage["peak_bytes"] is None else "  peak {:.1f} MB".format(stage["peak_bytes"] / 1e6)
+                print("  {:<10} {:>9.2f} ms{}".format(name, stage["seconds"] * 1e3, peak))
+
+def compare_results(results, baseline, threshold=DEFAULT_REGRESSION_THRESHOLD):
+        # Prints each stage against the baseline, returns the stages that got slower
+        regressions = []
+        print("Compared to {}:".format(baseline["timestamp"]))
+        for name in STAGES:
+                if name not in baseline["stages"]:
+                        continue
+                ratio = results["stages"][name]["seconds"] / baseline["stages"][name]["seconds"]
+                flag = ""
+                if ratio > threshold:
+                        flag = "  REGRESSION"
+                        regressions.append(name)
+                print("  {:<10} {:>6.2f}x{}".format(name, ratio, flag))
+        return regressions
+
+if __name__ == "__main__":
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--sites", default=500, type=int)
+        parser.add_argument("--months", default=2, type=int)
+        parser.add_argument("--density", default=0.2, type=float)
+        parser.add_argument("--churn", default=0.01, type=float)
+        parser.add_argument("-min", "--min_stay_length", default=DEFAULT_MIN_STAY_LENGTH, type=int)
+        parser.add_argument("--repeat", default=5, type=int)
+        parser.add_argument("--seed", default=0, type=int)
+        parser.add_argument("--memory", action="store_true", help="Also track peak memory per stage")
+        parser.add_argument("--output", help="Save results as json")
+        parser.add_argument("--compare", help="Results json from an earlier run")
+        parser.add_argument("--threshold", default=DEFAULT_REGRESSION_THRESHOLD, type=float)
+        args = parser.parse_args()
+        if args.repeat < 1:
+                # Every stage needs a timed run to report
+                parser.error("--repeat must be at least 1")
+
+        results = benchmark(args)
+        print_results(results)
+        if args.output:
+                with open(args.output, "w") as output:
+                        json.dump(results, output, indent=2)
+        if args.compare:
+                with open(args.compare) as baseline_file:
+                        baseline = json.load(baseline_file)
+                if compare_results(results, baseline, args.threshold):
+                        sys.exit(1)
@@ -0,0 +1,84 @@
+import argparse
+import statistics
+import time
+
+import requests
+from bs4 import BeautifulSoup
+
+import giza
+from cart_check import CHUNK_SIZE, CartResponse, read_cart_count
+from fake_recreation_server import cart_page, start_server
+
+# Compares reading the cart count with a full BeautifulSoup parse, which is
+# what book_site used to do after every booking attempt, against
+# cart_check's streaming scan. First on pages in memory, then per booking
+# attempt (request and cart check) against fake_recreation_server.py.
+
+
+def soup_count(text):
+	soup = BeautifulSoup(text, 'html.parser')
+	return int(soup.find("a", {"id":"cartLink"}).text[-1])
+
+def scan_count(body):
+	return read_cart_count(body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE))
+
+def time_parse(func, page, repeat):
+	times = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		func(page)
+		times.append(time.perf_counter() - start)
+	return statistics.median(times)
+
+def soup_attempt(session, payload):
+	response = session.post(giza.BOOKING_URL, payload)
+	return soup_count(response.text)
+
+def scan_attempt(session, payload):
+	cart_response = CartResponse(session.post(giza.BOOKING_URL, payload, stream=True))
+	num_items = cart_response.num_items()
+	cart_response.finish()
+	return num_items
+
+def time_attempts(attempt, session, payload, repeat):
+	times = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		attempt(session, payload)
+		times.append(time.perf_counter() - start)
+	return statistics.median(times), max(times)
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--page_bytes", default="0,50000,300000", help="Comma separated booking page sizes")
+	parser.add_argument("--repeat", default=20, type=int)
+	parser.add_argument("--latency", default=0.0, type=float, help="Fake server latency for the attempt timings")
+	args = parser.parse_args()
+
+	page_sizes = [int(p) for p in args.page_bytes.split(",")]
+	print("Cart check on a page in memory:")
+	for page_bytes in page_sizes:
+		text = cart_page(1, page_bytes)
+		body = text.encode("utf-8")
+		soup = time_parse(soup_count, text, args.repeat)
+		scan = time_parse(scan_count, body, args.repeat)
+		print("  {:>7} bytes: soup {:8.3f} ms, scan {:6.3f} ms, {:.0f}x".format(len(body), soup * 1e3, scan * 1e3, soup / scan))
+
+	# Big carts used to be read as their last digit
+	assert scan_count(cart_page(12).encode("utf-8")) == 12
+
+	print("Booking attempt against the fake server:")
+	for page_bytes in page_sizes:
+		server = start_server(port=0, latency=args.latency, jitter=0, release_in=0, page_bytes=page_bytes)
+		giza.set_base_url(server.base_url)
+		with requests.Session() as s:
+			s.post(giza.LOGIN_URL, giza.get_login_payload("user@example.com", "password"))
+			s.get(giza.LUBY_FULL_URL)
+			payload = giza.get_booking_payload(8, "7/14/2026", 14)
+			soup, soup_max = time_attempts(soup_attempt, s, payload, args.repeat)
+			scan, scan_max = time_attempts(scan_attempt, s, payload, args.repeat)
+		server.shutdown()
+		server.server_close()
+		print("  {:>7} bytes: soup {:8.3f} ms (max {:.3f}), scan {:8.3f} ms (max {:.3f})".format(
+			page_bytes, soup * 1e3, soup_max * 1e3, scan * 1e3, scan_max * 1e3))
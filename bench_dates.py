@@ -0,0 +1,40 @@
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from availability import *
+
+
+def make_year_dates(year):
+        start = datetime(year, 1, 1)
+        return [(start + timedelta(days=i)).strftime(WEB_DATE_FORMAT) for i in range(365)]
+
+def strptime_day(datestr):
+        # What every available date used to go through: normalize_date's
+        # strptime/strftime and then grouping_func's strptime.
+        short_date = datetime.strptime(datestr, WEB_DATE_FORMAT).strftime(SHORT_DATE_FORMAT)
+        return (datetime.strptime(short_date, SHORT_DATE_FORMAT) - REF_DATE).days
+
+def time_it(func, dates, sites):
+        start = time.perf_counter()
+        for _ in range(sites):
+                for d in dates:
+                        func(d)
+        return time.perf_counter() - start
+
+if __name__ == "__main__":
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--sites", default=200, type=int)
+        parser.add_argument("--year", default=REF_DATE.year, type=int)
+        args = parser.parse_args()
+
+        dates = make_year_dates(args.year)
+        normalize_date.cache_clear()
+        old = time_it(strptime_day, dates, args.sites)
+        new = time_it(normalize_date, dates, args.sites)
+        total = len(dates) * args.sites
+        print("{} dates ({} sites x {} days)".format(total, args.sites, len(dates)))
+        print("  strptime:       {:.3f}s ({:.2f} us/date)".format(old, old / total * 1e6))
+        print("  normalize_date: {:.3f}s ({:.2f} us/date)".format(new, new / total * 1e6))
+        print("  speedup:        {:.1f}x".format(old / new))
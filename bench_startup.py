@@ -0,0 +1,61 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# How long a short run spends importing before it does anything. Each case
+# is timed in fresh interpreters, and -X importtime shows where the time goes.
+# "+ twilio" is what every run paid when notifiers imported twilio at load,
+# and what a run with --enable_sms still pays.
+
+CASES = [
+        ("python", "pass"),
+        ("availability", "import availability"),
+        ("poller", "import poller"),
+        ("availability + twilio", "import availability; import twilio.rest"),
+]
+
+
+def run(code, importtime=False):
+        command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+        return subprocess.run(command, cwd=os.path.dirname(os.path.abspath(__file__)),
+                capture_output=True, text=True, check=True)
+
+def time_startup(code, repeat):
+        times = []
+        for _ in range(repeat):
+                start = time.perf_counter()
+                run(code)
+                times.append(time.perf_counter() - start)
+        return statistics.median(times)
+
+def slowest_imports(code, count):
+        # (cumulative microseconds, module) of the slowest modules imported
+        # by the code's own imports, importtime indents two spaces a level
+        imports = []
+        for line in run(code, importtime=True).stderr.splitlines():
+                parts = line.split("|")
+                if len(parts) != 3 or not parts[1].strip().isdigit():
+                        continue
+                name = parts[2]
+                if len(name) - len(name.lstrip()) == 3:
+                        imports.append((int(parts[1]), name.strip()))
+        return sorted(imports, reverse=True)[:count]
+
+if __name__ == "__main__":
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--repeat", default=20, type=int)
+        parser.add_argument("--top", default=8, type=int)
+        args = parser.parse_args()
+
+        for name, code in CASES:
+                try:
+                        print("{:<24} {:7.1f} ms".format(name, time_startup(code, args.repeat) * 1000))
+                except subprocess.CalledProcessError as e:
+                        print("{:<24} failed: {}".format(name, e.stderr.strip().splitlines()[-1]))
+        print("Slowest imports of poller:")
+        for us, module in slowest_imports("import poller", args.top):
+                print("  {:<22} {:7.1f} ms".format(module, us / 1000))
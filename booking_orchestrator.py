@@ -0,0 +1,181 @@
+import argparse
+import json
+import multiprocessing
+import queue
+import time
+from datetime import datetime
+
+import requests
+
+import giza
+from cart_check import CartResponse
+from release_timer import ReleaseTimer, today_at, wait_until_perf
+
+# Tries a ranked list of (site, arrival date, length) targets at once when
+# booking opens, across one or more accounts.
+#
+# Targets are dealt out by rank to worker processes, so the best ones all go
+# out in the first wave. Each worker logs in to an account of its own before
+# the release time and then works through its targets, best first, for a
+# number of rounds, dropping the ones it gets. A worker can only tell its
+# booking went in from its cart growing, and a cart belongs to an account,
+# so two workers can't share one: there are at most as many workers as
+# accounts, and a worker keeps booking for as many sites as are wanted.
+#
+# The workers share a count of reservations and a stop event: once the
+# wanted number are in carts, nothing more gets sent. Requests already on
+# their way can still land, so a first wave of more targets than wanted can
+# reserve more than wanted. Every attempt is reported back, with how long
+# after the release it was sent and how long the server took to answer.
+#
+# The config is json, see bookings.example.json:
+#
+#   {"accounts": [{"email": "...", "password": "..."}],
+#    "targets": [{"site": 8, "date": "7/14/2026", "length": 14}, ...],
+#    "wanted": 1}
+
+DEFAULT_ROUNDS = 3
+DEFAULT_WANTED = 1
+
+
+class Attempt:
+
+	def __init__(self, worker, email, target, round_, sent, latency, num_items, won):
+		self.worker = worker
+		self.email = email
+		self.target = target
+		self.round = round_
+		# Seconds after the release time the request was sent
+		self.sent = sent
+		self.latency = latency
+		self.num_items = num_items
+		self.won = won
+
+	def __repr__(self):
+		return "Attempt(site {} on {} for {}, worker {}, {:+.1f} ms, {:.1f} ms, won={})".format(
+			self.target["site"], self.target["date"], self.target["length"], self.worker,
+			self.sent * 1e3, self.latency * 1e3, self.won)
+
+def deal_targets(targets, workers):
+	# Worker i gets targets i, i + workers, ... so each has its best first
+	return [targets[i::workers] for i in range(workers)]
+
+def book_targets(worker, account, targets, release_time, rounds, state, base_url=None, sync_clock=False, lead=0.0):
+	# Runs in a worker process. 'release_time' is a wall clock timestamp.
+	if base_url is not None:
+		giza.set_base_url(base_url)
+	with requests.Session() as s:
+		s.post(giza.LOGIN_URL, giza.get_login_payload(account["email"], account["password"]))
+		# Anything already in the cart isn't ours to count
+		num_in_cart = giza.get_cart_count(s)
+		timer = ReleaseTimer.synced(s, giza.BASE_URL, lead=lead) if sync_clock else ReleaseTimer(lead=lead)
+		perf_release = timer.perf_send_time(release_time)
+		wait_until_perf(perf_release)
+
+		remaining = list(targets)
+		for round_ in range(rounds):
+			for target in list(remaining):
+				if state.stop.is_set():
+					return
+				payload = giza.get_booking_payload(target["site"], target["date"], target["length"])
+				sent = time.perf_counter()
+				cart_response = CartResponse(s.post(giza.BOOKING_URL, payload, stream=True))
+				num_items = cart_response.num_items() or 0
+				latency = time.perf_counter() - sent
+				# Our cart only grows when this booking went in
+				won = num_items > num_in_cart
+				if won:
+					num_in_cart = num_items
+					state.add_reservation()
+				cart_response.finish()
+				state.results.put(Attempt(worker, account["email"], target, round_, sent - perf_release, latency, num_items, won))
+				if won:
+					# Ours now, not worth sending again in later rounds
+					remaining.remove(target)
+
+class SharedState:
+	# Shared between the workers, they're all started with it
+
+	def __init__(self, wanted):
+		self.wanted = wanted
+		self.reserved = multiprocessing.Value("i", 0)
+		self.stop = multiprocessing.Event()
+		self.results = multiprocessing.Queue()
+
+	def add_reservation(self):
+		with self.reserved.get_lock():
+			self.reserved.value += 1
+			if self.reserved.value >= self.wanted:
+				self.stop.set()
+
+class BookingOrchestrator:
+
+	def __init__(self, accounts, targets, wanted=DEFAULT_WANTED, workers=None, rounds=DEFAULT_ROUNDS,
+			base_url=None, sync_clock=False, lead=0.0):
+		if not accounts or not targets:
+			raise ValueError("Need at least one account and one target.")
+		self.accounts = accounts
+		self.targets = targets
+		self.wanted = wanted
+		if workers is not None and workers > len(accounts):
+			raise ValueError("Each worker needs an account of its own, {} workers but {} accounts.".format(workers, len(accounts)))
+		self.workers = min(len(targets), workers or len(accounts))
+		self.rounds = rounds
+		self.base_url = base_url
+		self.sync_clock = sync_clock
+		self.lead = lead
+
+	def run(self, release_time):
+		# Returns every attempt made, in the order they were sent
+		state = SharedState(self.wanted)
+		processes = []
+		for i, targets in enumerate(deal_targets(self.targets, self.workers)):
+			account = self.accounts[i]
+			processes.append(multiprocessing.Process(target=book_targets, args=(i, account, targets, release_time,
+				self.rounds, state, self.base_url, self.sync_clock, self.lead)))
+		for p in processes:
+			p.start()
+		attempts = []
+		# Drain the queue while waiting, a worker can't exit with results still queued
+		while any(p.is_alive() for p in processes) or not state.results.empty():
+			try:
+				attempts.append(state.results.get(timeout=0.1))
+			except queue.Empty:
+				pass
+		for p in processes:
+			p.join()
+		attempts.sort(key=lambda a: a.sent)
+		print("{} of {} wanted reservations in {} attempts".format(state.reserved.value, self.wanted, len(attempts)))
+		for a in attempts:
+			if a.won:
+				print("  Won site {} on {} for {} days: worker {} ({}), sent {:+.1f} ms after release, answered in {:.1f} ms".format(
+					a.target["site"], a.target["date"], a.target["length"], a.worker, a.email, a.sent * 1e3, a.latency * 1e3))
+		return attempts
+
+def load_config(config):
+	targets = [{"site": t["site"], "date": t["date"], "length": t.get("length", 14)} for t in config["targets"]]
+	return config["accounts"], targets, config.get("wanted", DEFAULT_WANTED)
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--config", required=True, help="Accounts, ranked targets and how many to reserve, as json")
+	parser.add_argument("-hr", "--hour", required=True)
+	parser.add_argument("-min", "--minute", required=True)
+	parser.add_argument("-sec", "--second", default="0")
+	parser.add_argument("-msec", "--millisecond", default="0")
+	parser.add_argument("--workers", type=int, help="Defaults to one per account, or per target if there are fewer")
+	parser.add_argument("--rounds", default=DEFAULT_ROUNDS, type=int, help="Times each worker goes through its targets")
+	parser.add_argument("--base_url")
+	parser.add_argument("--sync_clock", action="store_true", help="Treat the time as the server's arrival time")
+	parser.add_argument("--lead_ms", default="0", help="Send this much earlier on top of the measured delay")
+	args = parser.parse_args()
+
+	with open(args.config) as config_file:
+		accounts, targets, wanted = load_config(json.load(config_file))
+	release_time = today_at(int(args.hour), int(args.minute), int(args.second), int(args.millisecond) * 1000)
+	print("Trying {} targets with {} accounts at {}".format(len(targets), len(accounts), datetime.fromtimestamp(release_time)))
+
+	orchestrator = BookingOrchestrator(accounts, targets, wanted, args.workers, args.rounds,
+		args.base_url, args.sync_clock, float(args.lead_ms) / 1000)
+	orchestrator.run(release_time)
@@ -0,0 +1,89 @@
+import re
+import threading
+
+# Reads the cart count out of a booking response without parsing the page.
+#
+# The count is the text of the cartLink anchor in the page header, e.g.
+# <a id="cartLink" href="/viewCart.do">Cart: 12</a>. The response is scanned
+# chunk by chunk as it arrives and scanning stops at that anchor, which is
+# near the top of the page.
+
+CHUNK_SIZE = 8192
+CART_LINK_RE = re.compile(rb'<a\s[^>]*?\bid\s*=\s*["\']?cartLink(?![\w-])[^>]*>([^<]*)<', re.I)
+COUNT_RE = re.compile(rb'(\d+)\D*$')
+TAG_START_RE = re.compile(rb'<a(?:\s|$)', re.I)
+
+
+def parse_cart_count(link_text):
+	# The last number in the link text, None if there isn't one
+	match = COUNT_RE.search(link_text)
+	return int(match.group(1)) if match else None
+
+class CartScanner:
+
+	def __init__(self):
+		self.buffer = b""
+
+	def feed(self, chunk):
+		# Returns the cart count once the cartLink anchor has been seen
+		self.buffer += chunk
+		match = CART_LINK_RE.search(self.buffer)
+		if match:
+			return parse_cart_count(match.group(1))
+		# Only an anchor that hasn't been closed yet can still match
+		start = None
+		for start_match in TAG_START_RE.finditer(self.buffer):
+			start = start_match.start()
+		if start is None:
+			# Might end in the middle of "<a"
+			self.buffer = self.buffer[-1:]
+		else:
+			self.buffer = self.buffer[start:]
+		return None
+
+def read_cart_count(chunks):
+	# Consumes 'chunks' up to the one with the cart count in it. None when
+	# the page has no cart link, e.g. an error page.
+	scanner = CartScanner()
+	for chunk in chunks:
+		num_items = scanner.feed(chunk)
+		if num_items is not None:
+			return num_items
+	return None
+
+def record_chunks(chunks, recording):
+	# Passes 'chunks' through, keeping a copy of each in 'recording'
+	for chunk in chunks:
+		recording.append(chunk)
+		yield chunk
+
+def drain(chunks):
+	# Reads the rest of a response, so its connection can be reused
+	for chunk in chunks:
+		pass
+
+def save_html_async(recording, filename):
+	def write():
+		with open(filename, "wb") as file:
+			file.write(b"".join(recording))
+	thread = threading.Thread(target=write)
+	thread.start()
+	return thread
+
+class CartResponse:
+
+	def __init__(self, response, record=False):
+		# 'response' must have been requested with stream=True
+		self.response = response
+		self.recording = [] if record else None
+		self.chunks = response.iter_content(CHUNK_SIZE)
+		if record:
+			self.chunks = record_chunks(self.chunks, self.recording)
+
+	def num_items(self):
+		return read_cart_count(self.chunks)
+
+	def finish(self):
+		# Call once the count has been acted on. Returns the page if recording.
+		drain(self.chunks)
+		return self.recording
@@ -0,0 +1,246 @@
+import json
+import os
+import socket
+import threading
+import time
+from bisect import bisect_right
+from datetime import date
+
+from availability import REF_ORDINAL, format_day, get_changed_days
+from intervals import days_to_intervals
+
+# Typed change events out of the diff stage, for booking bots and dashboards
+# that want to react to deltas instead of polling or re-reading snapshots.
+#
+# Every run of days added to or removed from a site is one event:
+#
+#   opened    the days are a run of their own, the site had none of them
+#   extended  the days were added next to or between days already there
+#   closed    a whole run went away
+#   shrank    part of a run went away, the rest is still there
+#
+# with the run the days belong to after (opened, extended) or before (closed,
+# shrank) the change. Events are published as newline-delimited JSON, e.g.
+#
+#   {"type": "extended", "campground": 232199, "site": "008",
+#    "start": "2026-07-21", "end": "2026-07-23", "run_start": "2026-07-14",
+#    "run_end": "2026-07-23", "observed": 1784012345.2}
+#
+# where "end" and "run_end" are the day after the last night. An EventBus
+# hands each event to an NDJSON file (follow it with tail -f), to the
+# clients of a Unix socket and to in-process async iterators.
+
+OPENED = "opened"
+CLOSED = "closed"
+EXTENDED = "extended"
+SHRANK = "shrank"
+EVENT_DATE_FORMAT = "%Y-%m-%d"
+SUBSCRIBER_QUEUE_SIZE = 10000
+
+
+def format_event_day(day):
+        return date.fromordinal(REF_ORDINAL + day).strftime(EVENT_DATE_FORMAT)
+
+def find_run(runs, day):
+        # The (start, end) run in sorted 'runs' containing 'day'
+        i = bisect_right(runs, (day, float("inf"))) - 1
+        return runs[i]
+
+class ChangeEvent:
+
+        def __init__(self, type, campground_id, site, start, end, run_start, run_end, observed):
+                self.type = type
+                self.campground_id = campground_id
+                self.site = site
+                # Days as days since REF_DATE, [start, end)
+                self.start = start
+                self.end = end
+                self.run_start = run_start
+                self.run_end = run_end
+                self.observed = observed
+
+        def __eq__(self, other):
+                return self.to_dict() == other.to_dict()
+
+        def __repr__(self):
+                return "ChangeEvent({} site {} {} to {})".format(self.type, self.site, format_day(self.start), format_day(self.end))
+
+        def to_dict(self):
+                return {"type": self.type, "campground": self.campground_id, "site": self.site,
+                        "start": format_event_day(self.start), "end": format_event_day(self.end),
+                        "run_start": format_event_day(self.run_start), "run_end": format_event_day(self.run_end),
+                        "observed": self.observed}
+
+        def to_json(self):
+                return json.dumps(self.to_dict())
+
+def site_events(campground_id, site, prev_runs, latest_runs, added, removed, observed):
+        # Events for one site, from its runs before and after and the days
+        # get_changed_days found added and removed
+        events = []
+        for start, end in days_to_intervals(removed):
+                run_start, run_end = find_run(prev_runs, start)
+                kind = CLOSED if (run_start, run_end) == (start, end) else SHRANK
+                events.append(ChangeEvent(kind, campground_id, site, start, end, run_start, run_end, observed))
+        for start, end in days_to_intervals(added):
+                run_start, run_end = find_run(latest_runs, start)
+                kind = OPENED if (run_start, run_end) == (start, end) else EXTENDED
+                events.append(ChangeEvent(kind, campground_id, site, start, end, run_start, run_end, observed))
+        return events
+
+def get_change_events(campground_id, prev, latest, observed=None):
+        # Events for every site between two snapshots of {site: [days]}
+        observed = time.time() if observed is None else observed
+        added, removed = get_changed_days(prev, latest)
+        events = []
+        for site in sorted(set(added) | set(removed)):
+                events.extend(site_events(campground_id, site, days_to_intervals(prev.get(site, ())),
+                        days_to_intervals(latest.get(site, ())), added.get(site, ()), removed.get(site, ()), observed))
+        return events
+
+class NdjsonFileSink:
+
+        def __init__(self, path):
+                self.file = open(path, "a")
+
+        def publish(self, lines):
+                self.file.write("".join(line + "\n" for line in lines))
+                self.file.flush()
+
+        def close(self):
+                self.file.close()
+
+class UnixSocketSink:
+        # Every client connected to the socket gets every event from then on.
+        # Clients are non-blocking, so publishing never waits on one: a client
+        # that can't keep up, whose socket buffer is full, or that went away
+        # is dropped.
+
+        def __init__(self, path):
+                self.path = path
+                if os.path.exists(path):
+                        os.unlink(path)
+                self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.server.bind(path)
+                self.server.listen()
+                self.clients = []
+                self.lock = threading.Lock()
+                self.thread = threading.Thread(target=self.accept, daemon=True)
+                self.thread.start()
+
+        def accept(self):
+                while True:
+                        try:
+                                client, _ = self.server.accept()
+                        except OSError:
+                                return
+                        client.setblocking(False)
+                        with self.lock:
+                                self.clients.append(client)
+
+        def publish(self, lines):
+                data = "".join(line + "\n" for line in lines).encode("utf-8")
+                with self.lock:
+                        for client in list(self.clients):
+                                try:
+                                        client.sendall(data)
+                                except OSError:
+                                        # BlockingIOError too
+                                        self.clients.remove(client)
+                                        client.close()
+
+        def close(self):
+                self.server.close()
+                with self.lock:
+                        for client in self.clients:
+                                client.close()
+                        self.clients = []
+                if os.path.exists(self.path):
+                        os.unlink(self.path)
+
+class Subscription:
+        # An async iterator over events published from any thread. Create it
+        # inside the event loop it will be read from.
+
+        def __init__(self, bus, maxsize=SUBSCRIBER_QUEUE_SIZE):
+                # asyncio takes a while to import and the poller doesn't need it
+                import asyncio
+                self.bus = bus
+                self.loop = asyncio.get_running_loop()
+                self.queue = asyncio.Queue(maxsize)
+                self.closed = False
+
+        def put(self, event):
+                if self.queue.full():
+                        # A reader that stopped reading doesn't hold up the poller
+                        return
+                self.queue.put_nowait(event)
+
+        def deliver(self, event):
+                self.loop.call_soon_threadsafe(self.put, event)
+
+        def __aiter__(self):
+                return self
+
+        async def __anext__(self):
+                event = await self.queue.get()
+                if event is None:
+                        raise StopAsyncIteration
+                return event
+
+        def close(self):
+                if not self.closed:
+                        self.closed = True
+                        self.bus.unsubscribe(self)
+                        self.loop.call_soon_threadsafe(self.finish)
+
+        def finish(self):
+                if self.queue.full():
+                        self.queue.get_nowait()
+                self.queue.put_nowait(None)
+
+class EventBus:
+
+        def __init__(self, sinks=()):
+                self.sinks = list(sinks)
+                self.subscriptions = []
+                self.lock = threading.Lock()
+
+        def subscribe(self):
+                subscription = Subscription(self)
+                with self.lock:
+                        self.subscriptions.append(subscription)
+                return subscription
+
+        def unsubscribe(self, subscription):
+                with self.lock:
+                        if subscription in self.subscriptions:
+                                self.subscriptions.remove(subscription)
+
+        def publish(self, events):
+                if not events:
+                        return
+                lines = [e.to_json() for e in events]
+                for sink in self.sinks:
+                        sink.publish(lines)
+                with self.lock:
+                        subscriptions = list(self.subscriptions)
+                for subscription in subscriptions:
+                        for event in events:
+                                subscription.deliver(event)
+
+        def close(self):
+                for sink in self.sinks:
+                        sink.close()
+                with self.lock:
+                        subscriptions = list(self.subscriptions)
+                for subscription in subscriptions:
+                        subscription.close()
+
+def build_event_bus(events_file=None, events_socket=None):
+        sinks = []
+        if events_file:
+                sinks.append(NdjsonFileSink(events_file))
+        if events_socket:
+                sinks.append(UnixSocketSink(events_socket))
+        return EventBus(sinks)
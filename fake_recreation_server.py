@@ -0,0 +1,282 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from synthetic_months import make_month_payload
+
+# A local stand-in for the parts of recreation.gov the scripts talk to, for
+# load and latency testing without touching production:
+#
+#   GET  /api/camps/availability/campground/<id>/month?start_date=...
+#   POST /memberSignInSignUp.do              logs in, sets a session cookie
+#   GET  /camping/.../campgroundDetails.do   has to be visited before booking
+#   POST /switchBookingAction.do             books siteId/arvdate into the cart
+#   GET  /_stats                             request counts and booking log
+#
+# Month responses carry an ETag and a matching If-None-Match gets a 304.
+# Every response is delayed by --latency plus normal --jitter, and a share of
+# them fail with 429 (with Retry-After) or 503. Availability is generated per
+# campground and month and a fraction of the days flip every --churn_interval
+# seconds. Booking opens --release_in seconds after startup and each site and
+# arrival date goes to the first request that asks for it after that.
+#
+# Point the scripts at it with --base_url http://localhost:8080/
+
+DEFAULT_PORT = 8080
+MONTH_PATH_RE = re.compile(r"^/api/camps/availability/campground/(\d+)/month$")
+SESSION_COOKIE = "JSESSIONID"
+
+
+class Inventory:
+
+        def __init__(self, sites, density, churn, churn_interval, seed=0):
+                self.sites = sites
+                self.density = density
+                self.churn = churn
+                self.churn_interval = churn_interval
+                self.seed = seed
+                self.start = time.monotonic()
+                self.months = {}
+                self.lock = threading.Lock()
+
+        def month(self, campground_id, month):
+                # The payload for a month, churned once per elapsed interval
+                key = (campground_id, month)
+                ticks = int((time.monotonic() - self.start) / self.churn_interval) if self.churn_interval > 0 else 0
+                with self.lock:
+                        if key not in self.months:
+                                rng = random.Random("{}-{}-{}".format(self.seed, campground_id, month.isoformat()))
+                                self.months[key] = [make_month_payload(month, self.sites, self.density, rng), 0, rng]
+                        payload, done, rng = self.months[key]
+                        for _ in range(done, ticks):
+                                for campsite in payload["campsites"].values():
+                                        for date, status in campsite["availabilities"].items():
+                                                if rng.random() < self.churn:
+                                                        campsite["availabilities"][date] = "Reserved" if status == "Available" else "Available"
+                        self.months[key][1] = max(done, ticks)
+                        return json.dumps(payload).encode("utf-8")
+
+class BookingDesk:
+
+        def __init__(self, release_time):
+                self.release_time = release_time
+                self.sessions = {}
+                self.booked = {}
+                self.log = []
+                self.lock = threading.Lock()
+
+        def login(self):
+                session = uuid.uuid4().hex
+                with self.lock:
+                        self.sessions[session] = {"visited": False, "cart": 0}
+                return session
+
+        def visit(self, session):
+                # Returns the number of items in the session's cart
+                with self.lock:
+                        if session not in self.sessions:
+                                return 0
+                        self.sessions[session]["visited"] = True
+                        return self.sessions[session]["cart"]
+
+        def book(self, session, site_id, arrival_date):
+                # First come, first served once the window is open. Returns the
+                # number of items in the session's cart.
+                now = time.time()
+                with self.lock:
+                        state = self.sessions.get(session)
+                        if state is None or not state["visited"]:
+                                return 0
+                        key = (site_id, arrival_date)
+                        won = now >= self.release_time and key not in self.booked
+                        if won:
+                                self.booked[key] = session
+                                state["cart"] += 1
+                        self.log.append({"time": now, "early_ms": (self.release_time - now) * 1e3, "session": session,
+                                "site_id": site_id, "arrival_date": arrival_date, "won": won})
+                        return state["cart"]
+
+def cart_page(num_items, page_bytes=0):
+        # 'page_bytes' of filler after the header, the real page is mostly scripts and markup
+        filler = '<div class="filler">{}</div>\n'.format("x" * 80)
+        return """<html><head><title>Reservation</title></head><body>
+<div id="header"><a id="cartLink" href="/viewCart.do">Cart: {}</a></div>
+<div id="content">Booking request processed.</div>
+{}</body></html>""".format(num_items, filler * (page_bytes // len(filler)))
+
+def details_page(num_items):
+        # Every real page has the cart link in its header
+        return """<html><head><title>Campground details</title></head><body>
+<div id="header"><a id="cartLink" href="/viewCart.do">Cart: {}</a></div>
+<div id="content">Campground details</div>
+</body></html>""".format(num_items)
+
+class FakeRecreationHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body in one write, separate small writes stall on delayed ACKs
+        wbufsize = 1 << 16
+
+        def log_message(self, format, *args):
+                if self.server.verbose:
+                        BaseHTTPRequestHandler.log_message(self, format, *args)
+
+        def respond(self, status, body, content_type="text/html", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in (headers or {}).items():
+                        self.send_header(k, v)
+                self.end_headers()
+                if self.command != "HEAD":
+                        self.wfile.write(body)
+
+        def delay_or_fail(self):
+                # Simulated network/server time and injected failures. Returns
+                # True when an error response was sent.
+                server = self.server
+                with server.stats_lock:
+                        server.stats["requests"] += 1
+                        roll = server.rng.random()
+                        delay = max(0.0, server.rng.gauss(server.latency, server.jitter))
+                time.sleep(delay)
+                if roll < server.rate_429:
+                        with server.stats_lock:
+                                server.stats["429"] += 1
+                        self.respond(429, b"Too Many Requests", "text/plain", {"Retry-After": str(server.retry_after)})
+                        return True
+                if roll < server.rate_429 + server.rate_5xx:
+                        with server.stats_lock:
+                                server.stats["5xx"] += 1
+                        self.respond(503, b"<html><body>Service Unavailable</body></html>")
+                        return True
+                return False
+
+        def read_body(self):
+                length = int(self.headers.get("Content-Length", 0))
+                return parse_qs(self.rfile.read(length).decode("utf-8")) if length else {}
+
+        def session(self):
+                for cookie in self.headers.get_all("Cookie", []):
+                        for part in cookie.split(";"):
+                                name, _, value = part.strip().partition("=")
+                                if name == SESSION_COOKIE:
+                                        return value
+                return None
+
+        def do_HEAD(self):
+                self.do_GET()
+
+        def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/_stats":
+                        with self.server.stats_lock, self.server.desk.lock:
+                                stats = dict(self.server.stats, bookings=list(self.server.desk.log))
+                        self.respond(200, json.dumps(stats).encode("utf-8"), "application/json")
+                        return
+                if self.delay_or_fail():
+                        return
+                match = MONTH_PATH_RE.match(url.path)
+                if match:
+                        start_date = parse_qs(url.query).get("start_date", [""])[0]
+                        try:
+                                month = datetime.strptime(start_date[:10], "%Y-%m-%d").replace(day=1)
+                        except ValueError:
+                                self.respond(400, b'{"error": "bad start_date"}', "application/json")
+                                return
+                        body = self.server.inventory.month(int(match.group(1)), month)
+                        if not self.server.etags:
+                                self.respond(200, body, "application/json")
+                                return
+                        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+                        if self.headers.get("If-None-Match") == etag:
+                                self.respond(304, b"", "application/json", {"ETag": etag})
+                        else:
+                                self.respond(200, body, "application/json", {"ETag": etag})
+                elif url.path.endswith("campgroundDetails.do"):
+                        num_items = self.server.desk.visit(self.session())
+                        self.respond(200, details_page(num_items).encode("utf-8"))
+                else:
+                        self.respond(200, b"<html><body>Fake recreation.gov</body></html>")
+
+        def do_POST(self):
+                url = urlparse(self.path)
+                form = self.read_body()
+                if self.delay_or_fail():
+                        return
+                if url.path == "/memberSignInSignUp.do":
+                        session = self.server.desk.login()
+                        self.respond(200, b"<html><body>Signed in</body></html>", headers={
+                                "Set-Cookie": "{}={}; Path=/".format(SESSION_COOKIE, session)})
+                elif url.path == "/switchBookingAction.do":
+                        site_id = form.get("siteId", [""])[0]
+                        arrival_date = form.get("arvdate", [""])[0]
+                        num_items = self.server.desk.book(self.session(), site_id, arrival_date)
+                        self.respond(200, cart_page(num_items, self.server.page_bytes).encode("utf-8"))
+                else:
+                        self.respond(404, b"Not found", "text/plain")
+
+def make_server(port=DEFAULT_PORT, latency=0.05, jitter=0.01, rate_429=0.0, rate_5xx=0.0, retry_after=1,
+                sites=60, density=0.2, churn=0.01, churn_interval=30.0, release_in=10.0, seed=0, verbose=False, page_bytes=0, etags=True):
+        server = ThreadingHTTPServer(("127.0.0.1", port), FakeRecreationHandler)
+        server.daemon_threads = True
+        server.latency = latency
+        server.jitter = jitter
+        server.rate_429 = rate_429
+        server.rate_5xx = rate_5xx
+        server.retry_after = retry_after
+        server.rng = random.Random(seed)
+        server.verbose = verbose
+        server.page_bytes = page_bytes
+        server.etags = etags
+        server.inventory = Inventory(sites, density, churn, churn_interval, seed)
+        server.desk = BookingDesk(time.time() + release_in)
+        server.stats = {"requests": 0, "429": 0, "5xx": 0}
+        server.stats_lock = threading.Lock()
+        return server
+
+def start_server(**kwargs):
+        # Runs a server on a background thread, for tests and load scripts.
+        # Pass port=0 to pick a free port, the URL is server.base_url.
+        server = make_server(**kwargs)
+        server.base_url = "http://127.0.0.1:{}/".format(server.server_address[1])
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server
+
+if __name__ == "__main__":
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--port", default=DEFAULT_PORT, type=int)
+        parser.add_argument("--latency", default=0.05, type=float, help="Seconds added to every response")
+        parser.add_argument("--jitter", default=0.01, type=float, help="Standard deviation of the latency")
+        parser.add_argument("--rate_429", default=0.0, type=float)
+        parser.add_argument("--rate_5xx", default=0.0, type=float)
+        parser.add_argument("--retry_after", default=1, type=int)
+        parser.add_argument("--sites", default=60, type=int)
+        parser.add_argument("--density", default=0.2, type=float)
+        parser.add_argument("--churn", default=0.01, type=float)
+        parser.add_argument("--churn_interval", default=30.0, type=float)
+        parser.add_argument("--release_in", default=10.0, type=float, help="Seconds until booking opens")
+        parser.add_argument("--seed", default=0, type=int)
+        parser.add_argument("--page_bytes", default=0, type=int, help="Pad booking responses to about this size")
+        parser.add_argument("--no_etags", action="store_true", help="Don't send ETags or answer conditional requests")
+        parser.add_argument("-v", "--verbose", action="store_true")
+        args = parser.parse_args()
+
+        server = make_server(args.port, args.latency, args.jitter, args.rate_429, args.rate_5xx, args.retry_after,
+                args.sites, args.density, args.churn, args.churn_interval, args.release_in, args.seed, args.verbose, args.page_bytes, not args.no_etags)
+        print("Serving on port {}, booking opens at {}".format(
+                args.port, datetime.fromtimestamp(server.desk.release_time).strftime("%H:%M:%S.%f")))
+        try:
+                server.serve_forever()
+        except KeyboardInterrupt:
+                pass
+        server.server_close()
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+# On disk cache of month responses, so a month that hasn't changed since the
+# last cycle costs a conditional request and nothing else.
+#
+# For each (campground, month) it keeps the raw body, the ETag and
+# Last-Modified validators the server sent with it, a sha256 of the body and
+# the (site, day) pairs parsed out of it. A 304, or a 200 whose body hashes
+# the same as last time, is answered from here.
+#
+# Files are <campground>_<YYYY-MM>.body and .json, each replaced atomically.
+# A body is written to a .body.part file as it streams in, hashed on the
+# way, and renamed over the .body by put(), so it's never held whole.
+
+CACHE_MONTH_FORMAT = "%Y-%m"
+
+
+def is_past_month(month, today=None):
+        # True once the last day of 'month' has gone by
+        if today is None:
+                today = datetime.now()
+        next_month = month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1, day=1)
+        return next_month.date() <= today.date()
+
+class StreamedBody:
+        # Hashes a response's chunks and writes them to 'path' as they're
+        # read through chunks()
+
+        def __init__(self, path, chunks):
+                self.path = path
+                self.file = open(path, "wb")
+                self.hash = hashlib.sha256()
+                self.source = iter(chunks)
+
+        def chunks(self):
+                for chunk in self.source:
+                        self.hash.update(chunk)
+                        self.file.write(chunk)
+                        yield chunk
+
+        def finish(self):
+                # The sha256 of the whole body, whatever the reader left unread
+                for _ in self.chunks():
+                        pass
+                self.file.close()
+                return self.hash.hexdigest()
+
+        def discard(self):
+                self.file.close()
+                if os.path.exists(self.path):
+                        os.unlink(self.path)
+
+def write_atomic(path, data):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+                f.write(data)
+        os.replace(tmp_path, path)
+
+class MonthCache:
+
+        def __init__(self, directory):
+                self.directory = directory
+                os.makedirs(directory, exist_ok=True)
+                # Entries read so far, the files are only read once per process
+                self.entries = {}
+                self.jsons = {}
+
+        def path(self, campground_id, month, extension):
+                return os.path.join(self.directory, "{}_{}{}".format(campground_id, month.strftime(CACHE_MONTH_FORMAT), extension))
+
+        def get(self, campground_id, month):
+                # {"etag", "last_modified", "hash", "pairs"} or None
+                key = (campground_id, month)
+                if key not in self.entries:
+                        try:
+                                with open(self.path(campground_id, month, ".json")) as f:
+                                        entry = json.load(f)
+                                entry["pairs"] = [tuple(p) for p in entry["pairs"]]
+                        except (OSError, ValueError, KeyError):
+                                entry = None
+                        self.entries[key] = entry
+                return self.entries[key]
+
+        def validators(self, campground_id, month):
+                # Headers for a conditional request
+                entry = self.get(campground_id, month)
+                headers = {}
+                if entry is not None:
+                        if entry.get("etag"):
+                                headers["If-None-Match"] = entry["etag"]
+                        if entry.get("last_modified"):
+                                headers["If-Modified-Since"] = entry["last_modified"]
+                return headers
+
+        def stream_body(self, campground_id, month, chunks):
+                # A StreamedBody for put() to pick up
+                return StreamedBody(self.path(campground_id, month, ".body.part"), chunks)
+
+        def put(self, campground_id, month, etag, last_modified, digest, pairs, body=None):
+                # Without a 'body', the one stream_body() wrote is used
+                entry = {"etag": etag, "last_modified": last_modified, "hash": digest, "pairs": [tuple(p) for p in pairs]}
+                # Body first, so an entry never points at a body that isn't there
+                if body is None:
+                        os.replace(self.path(campground_id, month, ".body.part"), self.path(campground_id, month, ".body"))
+                else:
+                        write_atomic(self.path(campground_id, month, ".body"), body)
+                write_atomic(self.path(campground_id, month, ".json"), json.dumps(entry).encode("utf-8"))
+                self.entries[(campground_id, month)] = entry
+                self.jsons.pop((campground_id, month), None)
+
+        def load_json(self, campground_id, month):
+                # The cached body, parsed once
+                key = (campground_id, month)
+                if key not in self.jsons:
+                        with open(self.path(campground_id, month, ".body"), "rb") as f:
+                                self.jsons[key] = json.loads(f.read())
+                return self.jsons[key]
@@ -1,12 +1,17 @@
 import argparse
 import requests
+import threading
 import time
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from cart_check import CartResponse, save_html_async
+from metrics import TimedHTTPAdapter, export, observe
+from release_timer import ReleaseTimer, today_at, wait_until_perf
+
 # URLs
 BASE_URL = "http://www.recreation.gov/"
-# BASE_URL = "http://localhost:8080/" # For testing
+# BASE_URL = "http://localhost:8080/" # For testing, see fake_recreation_server.py
 UNIF_URL = BASE_URL + "unifSearchResults.do?"
 LOGIN_URL = BASE_URL + "memberSignInSignUp.do?"
 BOOKING_URL = BASE_URL + "switchBookingAction.do?"
@@ -14,6 +19,9 @@ LUBY_FULL_URL = BASE_URL + "camping/luby-bay/r/campgroundDetails.do?contractCode
 
 LUBY_BAY_PARK_ID = 70473
 
+# How long before the booking time to open the burst connections
+WARM_LEAD = 3
+
 SITE_IDS = { 
 	1:1890, 
 	3:1875,
@@ -32,6 +40,14 @@ SITE_IDS = {
 	52:1846,
 }
 
+def set_base_url(base_url):
+	global BASE_URL, UNIF_URL, LOGIN_URL, BOOKING_URL, LUBY_FULL_URL
+	BASE_URL = base_url
+	UNIF_URL = BASE_URL + "unifSearchResults.do?"
+	LOGIN_URL = BASE_URL + "memberSignInSignUp.do?"
+	BOOKING_URL = BASE_URL + "switchBookingAction.do?"
+	LUBY_FULL_URL = BASE_URL + "camping/luby-bay/r/campgroundDetails.do?contractCode=NRSO&parkId=70473"
+
 def get_login_payload(email, password):
 	payload = {"AemailGroup_1733152645":email,
 			"ApasswrdGroup_704558654":password,
@@ -54,16 +70,38 @@ def get_booking_payload(site, date, length):
 		"arvdate":date}
 	return payload
 
-def write_html_to_file(html, filename="output.html"):
-	with open(filename, "w") as file:
-		file.write(str(html))
-
-def extract_num_items_in_cart(soup_html):
-	shop_cart_link_text = soup_html.find("a", {"id":"cartLink"}).text
-	num_items = int(shop_cart_link_text[-1])
+def extract_num_items_in_cart(cart_response):
+	num_items = cart_response.num_items()
+	if num_items is None:
+		print("No cart in the response (status {}).".format(cart_response.response.status_code))
+		return 0
 	print("There are {} items in the cart.".format(num_items))
 	return num_items
 
+def get_cart_count(session, url=None):
+	# Items already in the cart, from the header of the campground page.
+	# Visiting it is also what lets a session book.
+	cart_response = CartResponse(session.get(LUBY_FULL_URL if url is None else url, stream=True))
+	num_items = cart_response.num_items()
+	cart_response.finish()
+	return num_items or 0
+
+def warm_connections(session, url, connections):
+	# Open and TLS handshake 'connections' connections to the server and
+	# leave them idle in the session's pool. Each streamed response keeps its
+	# connection checked out until its body is read, so they can't share.
+	adapter = TimedHTTPAdapter(pool_connections=1, pool_maxsize=connections)
+	session.mount(url, adapter)
+	with ThreadPoolExecutor(max_workers=connections) as executor:
+		responses = list(executor.map(lambda i: session.get(url, stream=True), range(connections)))
+	for response in responses:
+		response.content
+	print("Warmed {} connections".format(connections))
+
+def parse_stagger(stagger_ms):
+	# "0,20,40" -> [0.0, 0.02, 0.04] seconds
+	return [float(ms)/1000 for ms in stagger_ms.split(",")]
+
 def pretty_print_cookies(session):
 	print("Cookies:")
 	for key, val in session.cookies.get_dict().items():
@@ -81,6 +119,10 @@ class GizaBot:
 		self.date = None
 		self.length = None
 		self.retries = None
+		self.sync_clock = False
+		self.lead = 0
+		self.stagger = None
+		self.save_html = False
 
 	def set_time(self, hour, minute, second=0, millisecond=0):
 		self.has_time = True
@@ -105,31 +147,44 @@ class GizaBot:
 		print("Attempting to book site {} starting {} for {} days.".format(
 			self.site, self.date, self.length))
 
-	def wait(self):
-		now = datetime.now()
-		target_time = now.replace(hour=self.hour, minute=self.minute, second=self.second, microsecond=self.microsecond)
-		time_delta = target_time-now
-		time_delta_seconds = time_delta.total_seconds()
-		if time_delta_seconds < 0:
-			raise Exception("Wait time is negative.")
-			# Wait for the bulk of the wait time using sleep()
-		if time_delta_seconds > 2:
-			print("Waiting {} seconds".format(time_delta_seconds))
-			time.sleep(time_delta_seconds-2)
-		# Busy waiting for the last 2 seconds
-		now = datetime.now()
-		time_delta_seconds = target_time-now
-		while time_delta_seconds.total_seconds() > 0:
-			now = datetime.now()
-			time_delta_seconds = target_time-now
+	def set_clock_sync(self, sync_clock, lead_ms=0):
+		# When set, the booking time is when the request should reach the
+		# server by its own clock, rather than when we send it.
+		self.sync_clock = sync_clock
+		self.lead = lead_ms/1000
+
+	def set_burst(self, stagger):
+		# Fire one booking request per entry of 'stagger', that many seconds
+		# after the booking time, each over its own pre-warmed connection.
+		self.stagger = stagger
+
+	def set_save_html(self, save_html):
+		self.save_html = save_html
+
+	def get_timer(self, session):
+		if self.sync_clock:
+			return ReleaseTimer.synced(session, BASE_URL, lead=self.lead)
+		return ReleaseTimer(lead=self.lead)
+
+	def get_target_time(self):
+		return today_at(self.hour, self.minute, self.second, self.microsecond)
+
+	def wait(self, timer=None):
+		if timer is None:
+			timer = ReleaseTimer()
+		return timer.wait(self.get_target_time())
 
 	def book_site(self, email, password):
+		if self.stagger:
+			return self.book_site_burst(email, password)
+
 		if self.retries < 0:
 			raise ValueError("Retries must be > 0")
 
 		self.print_info()
 
 		with requests.Session() as s:
+			s.mount(BASE_URL, TimedHTTPAdapter())
 			login_payload = get_login_payload(email, password)
 			login_response = s.post(LOGIN_URL, login_payload)
 			s.get(LUBY_FULL_URL)
@@ -137,24 +192,88 @@ class GizaBot:
 			booking_payload = get_booking_payload(self.site, self.date, self.length)
 
 			if self.has_time:
-				self.wait()
+				late = self.wait(self.get_timer(s))
+				observe("book_send_error_seconds", late, mode="serial")
 
 			# Book the site
 			for i in range(self.retries):
 
 				print("Attempted at {}".format(str(datetime.now())))
-				booking_response = s.post(BOOKING_URL, booking_payload)
+				sent = time.perf_counter()
+				booking_response = s.post(BOOKING_URL, booking_payload, stream=True)
 				
-				html = BeautifulSoup(booking_response.text, 'html.parser')
-				num_items = extract_num_items_in_cart(html)
+				cart_response = CartResponse(booking_response, self.save_html)
+				num_items = extract_num_items_in_cart(cart_response)
+				observe("book_response_seconds", time.perf_counter() - sent, mode="serial")
 				if num_items == 1:
 					print("Site reserved!")
 					break # don't need to retry
 				else:
 					print("Not reserved")
+					cart_response.finish()
 
+			html = cart_response.finish()
 			pretty_print_cookies(s)
-			write_html_to_file(html, "output_site_{}.html".format(self.site))		
+			if self.save_html:
+				save_html_async(html, "output_site_{}.html".format(self.site))
+
+	def fire_shot(self, session, booking_payload, perf_target, reserved, results, i, in_cart=0):
+		wait_until_perf(perf_target)
+		if reserved.is_set():
+			return
+		sent = time.perf_counter()
+		booking_response = session.post(BOOKING_URL, booking_payload, stream=True)
+		cart_response = CartResponse(booking_response, self.save_html)
+		num_items = extract_num_items_in_cart(cart_response)
+		latency = time.perf_counter() - sent
+		# Only this booking going in grows the cart, anything already in it doesn't count
+		if num_items > in_cart:
+			reserved.set()
+		observe("book_send_error_seconds", sent - perf_target, mode="burst")
+		observe("book_response_seconds", latency, mode="burst")
+		results[i] = (sent - perf_target, latency, num_items, cart_response.finish())
+
+	def book_site_burst(self, email, password):
+		self.print_info()
+
+		with requests.Session() as s:
+			login_payload = get_login_payload(email, password)
+			s.post(LOGIN_URL, login_payload)
+			in_cart = get_cart_count(s)
+
+			booking_payload = get_booking_payload(self.site, self.date, self.length)
+			timer = self.get_timer(s)
+			if self.has_time:
+				perf_target = timer.perf_send_time(self.get_target_time())
+			else:
+				perf_target = time.perf_counter() + WARM_LEAD
+			# Warm up shortly before, so the server doesn't drop them as idle
+			wait_until_perf(perf_target - WARM_LEAD)
+			warm_connections(s, BASE_URL, len(self.stagger))
+
+			reserved = threading.Event()
+			results = [None] * len(self.stagger)
+			shots = [threading.Thread(target=self.fire_shot, args=(s, booking_payload, perf_target + offset, reserved, results, i, in_cart))
+				for i, offset in enumerate(self.stagger)]
+			for shot in shots:
+				shot.start()
+			for shot in shots:
+				shot.join()
+
+			html = None
+			for offset, result in zip(self.stagger, results):
+				if result is None:
+					print("Shot at {:+.0f} ms cancelled".format(offset*1000))
+					continue
+				late, latency, num_items, html = result
+				print("Shot at {:+.0f} ms sent {:+.3f} ms from target, response in {:.1f} ms, {} items in cart".format(
+					offset*1000, late*1000, latency*1000, num_items))
+			print("Site reserved!" if reserved.is_set() else "Not reserved")
+
+			pretty_print_cookies(s)
+			if self.save_html and html is not None:
+				save_html_async(html, "output_site_{}.html".format(self.site))
+			return reserved.is_set()
 
 
 if __name__ == "__main__":
@@ -170,6 +289,12 @@ if __name__ == "__main__":
 	parser.add_argument("-msec", "--millisecond", default="0")
 	parser.add_argument("-e", "--email")
 	parser.add_argument("-p", "--password")
+	parser.add_argument("--base_url")
+	parser.add_argument("--sync_clock", action="store_true", help="Treat the time as the server's arrival time")
+	parser.add_argument("--lead_ms", default="0", help="Send this much earlier on top of the measured delay")
+	parser.add_argument("--metrics", help="Write attempt timings here, Prometheus text if it ends in .prom, otherwise JSONL")
+	parser.add_argument("--save_html", action="store_true", help="Save the last booking response page")
+	parser.add_argument("--burst_stagger_ms", help="Comma separated send offsets for a burst, e.g. 0,20,40,60")
 
 	parser.add_argument("--jordan_default_time", choices=("0", "1", "2", "3"))
 
@@ -177,12 +302,19 @@ if __name__ == "__main__":
 	if args.site is None or args.date is None or args.length is None or args.email is None or args.password is None:
 		raise ValueError("Site, date, length, email and password must all be specified.")
 
+	if args.base_url is not None:
+		set_base_url(args.base_url)
+
 	giza_bot = GizaBot()
 
 	giza_bot.set_site(int(args.site))
 	giza_bot.set_date(args.date)
 	giza_bot.set_length_of_stay(args.length)
 	giza_bot.set_retries(int(args.retries))
+	giza_bot.set_clock_sync(args.sync_clock, float(args.lead_ms))
+	giza_bot.set_save_html(args.save_html)
+	if args.burst_stagger_ms is not None:
+		giza_bot.set_burst(parse_stagger(args.burst_stagger_ms))
 
 	# Default times at UTC 2:59pm to make Jordan's life easier
 	default_hour = 14
@@ -207,4 +339,6 @@ if __name__ == "__main__":
 		giza_bot.set_time(hour, minute, second, millisecond)
 
 	giza_bot.book_site(args.email, args.password)
+	if args.metrics:
+		export(args.metrics)
 
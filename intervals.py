@@ -0,0 +1,124 @@
+from bisect import bisect_right
+
+# Availability for one site stored as sorted, merged [start, end) runs of
+# days. Days can be added and removed one at a time, and the index remembers
+# which days were added since the last snapshot() so that changes() only has
+# to look at the runs around those days.
+
+
+def days_to_intervals(days):
+        intervals = []
+        for d in sorted(days):
+                if intervals and intervals[-1][1] == d:
+                        intervals[-1][1] = d + 1
+                elif not intervals or intervals[-1][1] < d:
+                        intervals.append([d, d + 1])
+        return [tuple(i) for i in intervals]
+
+def intervals_to_days(intervals):
+        return [d for start, end in intervals for d in range(start, end)]
+
+class IntervalIndex:
+
+        def __init__(self, days=()):
+                self.starts = []
+                self.ends = []
+                for start, end in days_to_intervals(days):
+                        self.starts.append(start)
+                        self.ends.append(end)
+                # Days added since the last snapshot that weren't there before
+                self.added = set()
+                # Days removed since the last snapshot that were there before
+                self.removed = set()
+
+        def __contains__(self, day):
+                return self.find(day) is not None
+
+        def __len__(self):
+                return sum(end - start for start, end in zip(self.starts, self.ends))
+
+        def intervals(self):
+                return list(zip(self.starts, self.ends))
+
+        def days(self):
+                return intervals_to_days(self.intervals())
+
+        def find(self, day):
+                # Position of the run containing 'day', or None
+                i = bisect_right(self.starts, day) - 1
+                if i >= 0 and day < self.ends[i]:
+                        return i
+                return None
+
+        def add(self, day):
+                i = bisect_right(self.starts, day) - 1
+                if i >= 0 and day < self.ends[i]:
+                        return
+                joins_left = i >= 0 and self.ends[i] == day
+                joins_right = i + 1 < len(self.starts) and self.starts[i + 1] == day + 1
+                if joins_left and joins_right:
+                        self.ends[i] = self.ends[i + 1]
+                        del self.starts[i + 1]
+                        del self.ends[i + 1]
+                elif joins_left:
+                        self.ends[i] = day + 1
+                elif joins_right:
+                        self.starts[i + 1] = day
+                else:
+                        self.starts.insert(i + 1, day)
+                        self.ends.insert(i + 1, day + 1)
+                if day in self.removed:
+                        self.removed.discard(day)
+                else:
+                        self.added.add(day)
+
+        def remove(self, day):
+                i = self.find(day)
+                if i is None:
+                        return
+                start, end = self.starts[i], self.ends[i]
+                if start == day and end == day + 1:
+                        del self.starts[i]
+                        del self.ends[i]
+                elif start == day:
+                        self.starts[i] = day + 1
+                elif end == day + 1:
+                        self.ends[i] = day
+                else:
+                        self.ends[i] = day
+                        self.starts.insert(i + 1, day + 1)
+                        self.ends.insert(i + 1, end)
+                if day in self.added:
+                        self.added.discard(day)
+                else:
+                        self.removed.add(day)
+
+        def apply(self, added=(), removed=()):
+                for d in removed:
+                        self.remove(d)
+                for d in added:
+                        self.add(d)
+
+        def update(self, days):
+                # Make the index hold exactly 'days'. Callers that already
+                # know which days changed should use apply() instead.
+                days = set(days)
+                current = set(self.days())
+                for d in current - days:
+                        self.remove(d)
+                for d in days - current:
+                        self.add(d)
+
+        def changes(self, min_length=1):
+                # Runs of at least min_length days that were created or
+                # extended since the last snapshot, in day order.
+                found = set()
+                for day in self.added:
+                        i = self.find(day)
+                        if self.ends[i] - self.starts[i] >= min_length:
+                                found.add((self.starts[i], self.ends[i]))
+                return sorted(found)
+
+        def snapshot(self):
+                self.added = set()
+                self.removed = set()
@@ -0,0 +1,152 @@
+import bisect
+
+from availability import format_day
+from intervals import days_to_intervals
+from notification_pipeline import Notice
+
+# Ways to cover a stay by moving between sites, e.g. site 3 for 5 nights and
+# then site 8 for 9, with at most a given number of moves.
+#
+# Each site's availability is turned into [start, end) runs of days, and a
+# run can be followed by a run of another site that covers the day it ends
+# on and goes on past it. An itinerary stays on each run as long as it can,
+# so it is identified by its sequence of runs. Runs that can't reach the end
+# of the stay within the remaining moves are never expanded: a backwards
+# pass first works out the fewest moves from each run to the end, so the
+# search only visits runs that are part of some itinerary.
+#
+# New itineraries are sent as ItineraryNotices through the notification
+# pipeline, in the same digests as new runs of single sites.
+
+DEFAULT_LIMIT = 50
+
+class Itinerary:
+
+        def __init__(self, segments):
+                # [(site, first day, day after the last night)]
+                self.segments = segments
+
+        @property
+        def moves(self):
+                return len(self.segments) - 1
+
+        def sites(self):
+                return tuple(site for site, _, _ in self.segments)
+
+        def __eq__(self, other):
+                return self.segments == other.segments
+
+        def __hash__(self):
+                return hash(tuple(self.segments))
+
+        def __repr__(self):
+                return "Itinerary({})".format(self.segments)
+
+        def describe(self):
+                return ", then ".join("site {} {} to {}".format(site, format_day(start), format_day(end))
+                        for site, start, end in self.segments)
+
+def clip_runs(availability, start, end):
+        # Runs of every site that overlap [start, end), clipped to it
+        runs = []
+        for site, days in availability.items():
+                stay = days[bisect.bisect_left(days, start):bisect.bisect_left(days, end)]
+                runs.extend((site, run_start, run_end) for run_start, run_end in days_to_intervals(stay))
+        return runs
+
+def find_itineraries(availability, start, end, max_moves=1, limit=DEFAULT_LIMIT):
+        # Itineraries covering the nights [start, end) with at most
+        # max_moves moves, fewest moves first, up to 'limit' of them
+        runs = clip_runs(availability, start, end)
+        covering = {}
+        for i, (site, run_start, run_end) in enumerate(runs):
+                for day in range(run_start, run_end):
+                        covering.setdefault(day, []).append(i)
+
+        # Runs to move to from run i: those still going on the day it ends
+        def successors(i):
+                return covering.get(runs[i][2], ())
+
+        # Fewest moves from each run to the end of the stay. Runs covering a
+        # day all end after it, so going backwards a day at a time they're
+        # always done before the runs that move to them.
+        unreachable = max_moves + 1
+        ending = {}
+        for i, (site, run_start, run_end) in enumerate(runs):
+                ending.setdefault(run_end, []).append(i)
+        moves_left = {i: 0 for i in ending.get(end, ())}
+        for day in range(end - 1, start, -1):
+                fewest = min((moves_left[j] for j in covering.get(day, ())), default=unreachable)
+                for i in ending.get(day, ()):
+                        moves_left[i] = min(fewest + 1, unreachable)
+
+        # Fewest moves first: all itineraries with 0 moves, then 1, ...
+        found = []
+        def extend(path, moves, budget):
+                if limit is not None and len(found) >= limit:
+                        return
+                last = path[-1]
+                if runs[last][2] >= end:
+                        if moves == budget:
+                                found.append(path)
+                        return
+                for j in successors(last):
+                        if moves + 1 + moves_left[j] <= budget:
+                                extend(path + [j], moves + 1, budget)
+
+        firsts = sorted((i for i in covering.get(start, ()) if runs[i][1] == start), key=lambda i: runs[i])
+        for budget in range(max_moves + 1):
+                for i in firsts:
+                        if moves_left[i] <= budget:
+                                extend([i], 0, budget)
+
+        itineraries = []
+        for path in found:
+                segments = []
+                for k, i in enumerate(path):
+                        site, run_start, run_end = runs[i]
+                        # Move on the day the previous run ends
+                        segment_start = start if k == 0 else runs[path[k - 1]][2]
+                        segments.append((site, segment_start, run_end))
+                itineraries.append(Itinerary(segments))
+        return itineraries
+
+def is_possible(availability, sites, start, end):
+        # Whether the sites can be stayed at in this order, moving on the
+        # day each run ends, the same way find_itineraries builds them
+        day = start
+        for site in sites:
+                run = next(((s, e) for s, e in days_to_intervals(availability.get(site, [])) if s <= day < e), None)
+                if run is None:
+                        return False
+                day = run[1]
+        return day >= end
+
+def get_new_itineraries(prev, latest, start, end, max_moves=1, limit=DEFAULT_LIMIT):
+        # Itineraries possible now that weren't possible with 'prev'
+        return [it for it in find_itineraries(latest, start, end, max_moves, limit)
+                if not is_possible(prev, it.sites(), start, end)]
+
+def build_itinerary_message(itineraries, start, end):
+        message = "New ways to stay from {} to {}:".format(format_day(start), format_day(end))
+        for it in itineraries:
+                message += "\n  " + it.describe()
+        return message
+
+class ItineraryNotice(Notice):
+        # An itinerary for one recipient, as a Notice whose site is its sites
+        # in order, e.g. "003+008", and whose days are the whole stay
+
+        def __init__(self, channel, recipient, campground_id, itinerary, start, end, booking_url, detected=None):
+                line = "From {} to {}: {}".format(format_day(start), format_day(end), itinerary.describe())
+                super().__init__(channel, recipient, campground_id, "+".join(itinerary.sites()), start, end,
+                        line, booking_url, detected=detected)
+                self.itinerary = itinerary
+
+        def is_open(self, latest):
+                return is_possible(latest, self.itinerary.sites(), self.start, self.end)
+
+def build_itinerary_notices(notifiers, campground_id, itineraries, start, end, booking_url, detected=None):
+        # An ItineraryNotice per itinerary for every recipient of every channel
+        return [ItineraryNotice(notifier.channel, recipient, campground_id, it, start, end, booking_url, detected)
+                for it in itineraries for notifier in notifiers for recipient in notifier.recipients]
@@ -0,0 +1,98 @@
+import argparse
+import json
+import statistics
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+import availability
+import giza
+from fake_recreation_server import start_server
+
+# End to end load test against fake_recreation_server.py: times availability
+# polls at a few fetch concurrencies, then races several GizaBots for the
+# same site when booking opens and prints who got it.
+
+
+def time_polls(campgrounds, months, max_workers, polls):
+        pairs = [(c, m) for c in campgrounds for m in months]
+        session = availability.make_session(max_workers)
+        times = []
+        for _ in range(polls):
+                start = time.perf_counter()
+                availability.fetch_available(pairs, session=session, max_workers=max_workers, site_filter=lambda s: True)
+                times.append(time.perf_counter() - start)
+        session.close()
+        return times
+
+def race_bookings(bots, release_time):
+        # Every bot waits for release_time, then books
+        release = datetime.fromtimestamp(release_time)
+        threads = []
+        for bot in bots:
+                bot.set_time(release.hour, release.minute, release.second, release.microsecond // 1000)
+                threads.append(threading.Thread(target=bot.book_site, args=("user@example.com", "password")))
+        for t in threads:
+                t.start()
+        for t in threads:
+                t.join()
+
+if __name__ == "__main__":
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--base_url", help="A fake server that's already running, otherwise one is started")
+        parser.add_argument("--campgrounds", default=4, type=int)
+        parser.add_argument("--months", default=3, type=int)
+        parser.add_argument("--polls", default=5, type=int)
+        parser.add_argument("--workers", default="1,4,16")
+        parser.add_argument("--bots", default=3, type=int)
+        parser.add_argument("--retries", default=3, type=int)
+        parser.add_argument("--latency", default=0.05, type=float)
+        parser.add_argument("--jitter", default=0.01, type=float)
+        parser.add_argument("--rate_5xx", default=0.0, type=float)
+        parser.add_argument("--release_in", default=None, type=float, help="Seconds after the polls until booking opens")
+        args = parser.parse_args()
+
+        if args.base_url is None:
+                release_in = 3600.0 if args.release_in is None else args.release_in
+                server = start_server(port=0, latency=args.latency, jitter=args.jitter, rate_5xx=args.rate_5xx, release_in=release_in)
+                base_url = server.base_url
+        else:
+                base_url = args.base_url
+        availability.set_base_url(base_url)
+        giza.set_base_url(base_url)
+
+        campgrounds = [232199 + i for i in range(args.campgrounds)]
+        months = availability.DEFAULT_MONTHS[:1]
+        while len(months) < args.months:
+                last = months[-1]
+                months.append(last.replace(year=last.year + last.month // 12, month=last.month % 12 + 1))
+
+        print("Polling {} campgrounds x {} months".format(len(campgrounds), len(months)))
+        for workers in [int(w) for w in args.workers.split(",")]:
+                times = time_polls(campgrounds, months, workers, args.polls)
+                print("  max_workers {:>3}: median {:.3f}s, max {:.3f}s".format(workers, statistics.median(times), max(times)))
+
+        if args.bots > 0:
+                if args.base_url is None:
+                        # Open booking a couple of seconds from now
+                        server.desk.release_time = time.time() + (2.0 if args.release_in is None else args.release_in)
+                        release_time = server.desk.release_time
+                else:
+                        release_time = time.time() + (2.0 if args.release_in is None else args.release_in)
+                bots = []
+                for i in range(args.bots):
+                        bot = giza.GizaBot()
+                        bot.set_site(8)
+                        bot.set_date("7/14/2026")
+                        bot.set_length_of_stay(14)
+                        bot.set_retries(args.retries)
+                        bots.append(bot)
+                print("Racing {} bots for site 8".format(len(bots)))
+                race_bookings(bots, release_time)
+                stats = json.loads(requests.get(base_url + "_stats").text)
+                for booking in stats["bookings"]:
+                        print("  {:+8.1f} ms after release  won={}".format(-booking["early_ms"], booking["won"]))
+                print("Requests: {}, 429: {}, 5xx: {}".format(stats["requests"], stats["429"], stats["5xx"]))
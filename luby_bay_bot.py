@@ -11,10 +11,19 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as ec
+import sys
 import time
 import urllib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from threading import Timer
 
+import requests
+
+from cart_check import CartResponse
+from giza import get_cart_count, parse_stagger, warm_connections
+from release_timer import ReleaseTimer, today_at, wait_until_perf
+
 #Constants
 LUBY_BAY_PARK_ID = 70473
 LUBY_BAY_CAMP_AREA = 1280981668
@@ -26,6 +35,11 @@ login_url = "https://www.recreation.gov/memberSignInSignUp.do"
 book_site_base = "https://www.recreation.gov/switchBookingAction.do?"
 search_url = "https://www.recreation.gov/unifSearchResults.do"
 luby_bay_url = "https://www.recreation.gov/camping/luby-bay/r/campgroundDetails.do?contractCode=NRSO&parkId=70473"
+cart_url = "https://www.recreation.gov/viewCart.do"
+base_url = "https://www.recreation.gov/"
+
+# How long before the release to open the HTTP connections
+WARM_LEAD = 3
 
 def chrome_options(headless=True):
     options = webdriver.ChromeOptions()
@@ -50,6 +64,7 @@ class LubyBot:
         self.site_number = site_number
         self.arrival_date = ARRIVAL_DATE
         self.booking_url = self.get_booking_url(self.site_number, self.arrival_date)
+        self.browser = None
 
         
 
@@ -80,27 +95,19 @@ class LubyBot:
         password_input.send_keys(_password)
         signin_button = self.browser.find_element_by_name(signin_button_name)
         signin_button.click()
-        time.sleep(2)
+        # Logged in once the sign in page has gone away
+        WebDriverWait(self.browser, 10).until(ec.staleness_of(signin_button))
 
     def visit_site_page(self):
         # Have to do this for some reason before booking, otherwise the requests get rejected.
         self.browser.get(luby_bay_url)
 
-    def book_site_at_time_and_retry(self, retries, hour_, minute_, second_=0):
+    def book_site_at_time_and_retry(self, retries, hour_, minute_, second_=0, millisecond_=0, timer=None):
         if (hour_ is not None) and (minute_ is not None):
             # A time was passed in
-            now = datetime.now()
-            target_time = now.replace(hour=hour_, minute=minute_, second=second_, microsecond=0)
-            time_delta = target_time-now
-            time_delta_seconds = time_delta.total_seconds()
-            # If the target time is more than 2 seconds away, set a timer.
-            if time_delta_seconds > 2:
-                time.sleep(time_delta_seconds-2)
-
-            now = datetime.now()
-            while (now.hour != hour_) or (now.minute != minute_) or (now.second != second_):
-                time.sleep(0)
-                now = datetime.now()
+            if timer is None:
+                timer = ReleaseTimer()
+            timer.wait(today_at(hour_, minute_, second_, millisecond_*1000))
 
         for i in range(retries):
             self.book_site()
@@ -110,16 +117,120 @@ class LubyBot:
     def book_site(self):
         self.browser.get(self.booking_url)
         
-    def sleep_until(self, hour_, minute_, second_=0):
-        now = datetime.now()
-        while (now.hour != hour_) or (now.minute != minute_) or (now.second != second_):
-            now = datetime.now()
+    def sleep_until(self, hour_, minute_, second_=0, millisecond_=0):
+        ReleaseTimer().wait(today_at(hour_, minute_, second_, millisecond_*1000))
+
+    def export_session(self):
+        # A requests session carrying this browser's login, for booking
+        # over plain HTTP
+        session = requests.Session()
+        session.headers["User-Agent"] = self.browser.execute_script("return navigator.userAgent")
+        for cookie in self.browser.get_cookies():
+            session.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain"), path=cookie.get("path", "/"))
+        return session
+
+    def import_session(self, session):
+        # Back the other way, the server may have changed cookies since
+        for cookie in session.cookies:
+            self.browser.add_cookie({"name": cookie.name, "value": cookie.value, "path": cookie.path or "/"})
 
     def take_screenshot(self, filename):
         self.browser.get_screenshot_as_file(filename)
           
     def close(self):
-        self.browser.close()
+        # Not started if the pool failed while preparing
+        if self.browser is not None:
+            self.browser.close()
+
+def book_over_http(session, booking_url, perf_target, reserved, results, i, in_cart=0):
+    wait_until_perf(perf_target)
+    if reserved.is_set():
+        return
+    sent = time.perf_counter()
+    cart_response = CartResponse(session.get(booking_url, stream=True))
+    num_items = cart_response.num_items() or 0
+    latency = time.perf_counter() - sent
+    # The cart grew, though with a shared cart it may be another shot's booking
+    won = num_items > in_cart
+    if won:
+        reserved.set()
+    cart_response.finish()
+    results[i] = (sent - perf_target, latency, num_items, won)
+
+class BrowserPool:
+    # Browsers that log in and visit the campground ahead of time, then hand
+    # their logins to requests sessions so the booking race is plain HTTP.
+
+    def __init__(self, size, site_number, headless=True):
+        self.bots = [LubyBot(site_number=site_number) for _ in range(size)]
+        self.headless = headless
+        self.sessions = []
+
+    def prepare(self, email, password):
+        # Starts and logs in every browser at once
+        def prepare_bot(bot):
+            bot.start(self.headless)
+            bot.login(email, password)
+            bot.visit_site_page()
+        with ThreadPoolExecutor(max_workers=len(self.bots)) as executor:
+            list(executor.map(prepare_bot, self.bots))
+
+    def export_sessions(self):
+        self.sessions = [bot.export_session() for bot in self.bots]
+        return self.sessions
+
+    def burst(self, perf_target, stagger):
+        # Shot i goes out stagger[i] after perf_target over session i % size.
+        # Returns the index of the bot whose shot got the site, or None.
+        # Every bot is logged in to the same account, so they share one cart.
+        shots_per_session = -(-len(stagger) // len(self.bots))
+        sessions = self.export_sessions()
+        # What's in the cart already, so an old item isn't taken for a win
+        in_cart = get_cart_count(sessions[0], luby_bay_url)
+        wait_until_perf(perf_target - WARM_LEAD)
+        for session in sessions:
+            warm_connections(session, base_url, shots_per_session)
+
+        reserved = threading.Event()
+        results = [None] * len(stagger)
+        shots = [threading.Thread(target=book_over_http, args=(sessions[i % len(sessions)], self.bots[0].booking_url,
+            perf_target + offset, reserved, results, i, in_cart)) for i, offset in enumerate(stagger)]
+        for shot in shots:
+            shot.start()
+        for shot in shots:
+            shot.join()
+
+        winner = None
+        first_sent = None
+        for i, (offset, result) in enumerate(zip(stagger, results)):
+            if result is None:
+                print("Shot at {:+.0f} ms cancelled".format(offset*1000))
+                continue
+            late, latency, num_items, won = result
+            print("Shot at {:+.0f} ms sent {:+.3f} ms from target, response in {:.1f} ms, {} items in cart".format(
+                offset*1000, late*1000, latency*1000, num_items))
+            # Any shot answered after the booking went in sees the cart grown,
+            # the one that made it is the first of those to be sent
+            if won and (first_sent is None or offset + late < first_sent):
+                winner = i % len(self.bots)
+                first_sent = offset + late
+
+        # The responses can be wrong, the cart itself is the answer
+        if get_cart_count(sessions[0], luby_bay_url) <= in_cart:
+            return None
+        return winner
+
+    def checkout_screenshot(self, winner, filename):
+        bot = self.bots[winner]
+        bot.import_session(self.sessions[winner])
+        bot.browser.get(cart_url)
+        bot.take_screenshot(filename)
+
+    def close(self):
+        for session in self.sessions:
+            session.close()
+        for bot in self.bots:
+            bot.close()
 
 ##############
 # Example usage:
@@ -134,7 +245,11 @@ if __name__ == "__main__":
     parser.add_argument("-hr", "--hour")
     parser.add_argument("-min", "--minute")
     parser.add_argument("-sec", "--second", default="0")
+    parser.add_argument("-msec", "--millisecond", default="0")
+    parser.add_argument("--sync_clock", action="store_true", help="Treat the time as the server's arrival time")
     parser.add_argument("-r", "--retries", default="5") #How many times to retry
+    parser.add_argument("--pool", default="0", help="Log in this many browsers, then book over HTTP")
+    parser.add_argument("--stagger_ms", default="0,10,20,30", help="Send offsets of the HTTP booking burst")
     parser.add_argument("-e", "--email")
     parser.add_argument("-p", "--password")
     args = parser.parse_args()
@@ -144,18 +259,42 @@ if __name__ == "__main__":
     hour = int(args.hour) if args.hour else None
     minute = int(args.minute) if args.minute else None
     second = int(args.second)
+    millisecond = int(args.millisecond)
     retries = int(args.retries)
     email = args.email
     password = args.password
 
     test_date = ARRIVAL_DATE #TODO: make this a flag
 
+    if int(args.pool) > 0:
+        pool = BrowserPool(int(args.pool), site_number, run_headless)
+        try:
+            pool.prepare(email, password)
+            if hour is not None and minute is not None:
+                with requests.Session() as session:
+                    timer = ReleaseTimer.synced(session, luby_bay_url) if args.sync_clock else ReleaseTimer()
+                perf_target = timer.perf_send_time(today_at(hour, minute, second, millisecond*1000))
+            else:
+                # No time given, send as soon as the connections are warm
+                perf_target = time.perf_counter() + WARM_LEAD
+            winner = pool.burst(perf_target, parse_stagger(args.stagger_ms))
+            print("Site reserved!" if winner is not None else "Not reserved")
+            if winner is not None:
+                pool.checkout_screenshot(winner, 'page.png')
+        finally:
+            pool.close()
+        sys.exit()
+
     bot = LubyBot(site_number=site_number)
 
     bot.start(run_headless)
     bot.login(email, password)
     bot.visit_site_page()
-    bot.book_site_at_time_and_retry(retries, hour, minute, second)
+    timer = None
+    if args.sync_clock:
+        with requests.Session() as session:
+            timer = ReleaseTimer.synced(session, luby_bay_url)
+    bot.book_site_at_time_and_retry(retries, hour, minute, second, millisecond, timer)
 
     if run_headless:
         bot.take_screenshot('page.png')
@@ -0,0 +1,213 @@
+import bisect
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import requests
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError
+
+# Timings for every phase of a run, from the HTTP requests through to the
+# notifications and booking attempts, kept as histograms.
+#
+# Each histogram has Prometheus style cumulative buckets over the life of the
+# process, and a window of the most recent observations for quantiles.
+# export() writes Prometheus text format to a path ending in .prom (e.g. for
+# node_exporter's textfile collector), or appends a JSONL line per histogram
+# to anything else.
+#
+# HTTP requests made through a session with TimedHTTPAdapter mounted record
+# dns, connect, tls and ttfb (time to the response headers). The body time
+# is recorded by whoever reads the body.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEFAULT_WINDOW = 1000
+PROMETHEUS_EXTENSION = ".prom"
+
+
+def label_key(labels):
+        return tuple(sorted(labels.items()))
+
+def quantile(values, q):
+        if not values:
+                return None
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class Histogram:
+
+        def __init__(self, buckets=DEFAULT_BUCKETS, window=DEFAULT_WINDOW):
+                self.buckets = buckets
+                # counts[i] is observations <= buckets[i], the last is +Inf
+                self.counts = [0] * (len(buckets) + 1)
+                self.count = 0
+                self.sum = 0.0
+                self.recent = deque(maxlen=window)
+
+        def observe(self, value):
+                self.counts[bisect.bisect_left(self.buckets, value)] += 1
+                self.count += 1
+                self.sum += value
+                self.recent.append(value)
+
+        def cumulative(self):
+                total = 0
+                for c in self.counts:
+                        total += c
+                        yield total
+
+        def summary(self):
+                recent = list(self.recent)
+                return {"count": self.count, "sum": self.sum, "p50": quantile(recent, 0.5),
+                        "p95": quantile(recent, 0.95), "max": max(recent, default=None)}
+
+class Metrics:
+
+        def __init__(self, buckets=DEFAULT_BUCKETS, window=DEFAULT_WINDOW):
+                self.buckets = buckets
+                self.window = window
+                # name -> label key -> Histogram
+                self.histograms = {}
+                self.lock = threading.Lock()
+
+        def observe(self, name, seconds, **labels):
+                with self.lock:
+                        by_labels = self.histograms.setdefault(name, {})
+                        key = label_key(labels)
+                        if key not in by_labels:
+                                by_labels[key] = Histogram(self.buckets, self.window)
+                        by_labels[key].observe(seconds)
+
+        @contextmanager
+        def timed(self, name, **labels):
+                start = time.perf_counter()
+                try:
+                        yield
+                finally:
+                        self.observe(name, time.perf_counter() - start, **labels)
+
+        def get(self, name, **labels):
+                with self.lock:
+                        return self.histograms.get(name, {}).get(label_key(labels))
+
+        def to_prometheus(self):
+                lines = []
+                with self.lock:
+                        for name in sorted(self.histograms):
+                                lines.append("# TYPE {} histogram".format(name))
+                                for key, histogram in sorted(self.histograms[name].items()):
+                                        labels = ",".join('{}="{}"'.format(k, v) for k, v in key)
+                                        sep = "," if labels else ""
+                                        bounds = [str(b) for b in histogram.buckets] + ["+Inf"]
+                                        for bound, total in zip(bounds, histogram.cumulative()):
+                                                lines.append('{}_bucket{{{}{}le="{}"}} {}'.format(name, labels, sep, bound, total))
+                                        suffix = "{{{}}}".format(labels) if labels else ""
+                                        lines.append("{}_sum{} {}".format(name, suffix, histogram.sum))
+                                        lines.append("{}_count{} {}".format(name, suffix, histogram.count))
+                return "\n".join(lines) + "\n"
+
+        def to_records(self):
+                now = time.time()
+                with self.lock:
+                        return [dict(histogram.summary(), time=now, name=name, labels=dict(key))
+                                for name in sorted(self.histograms)
+                                for key, histogram in sorted(self.histograms[name].items())]
+
+        def export(self, path):
+                if path.endswith(PROMETHEUS_EXTENSION):
+                        # Replaced in one go, so a scrape never sees half a file
+                        tmp_path = path + ".tmp"
+                        with open(tmp_path, "w") as f:
+                                f.write(self.to_prometheus())
+                        os.replace(tmp_path, path)
+                else:
+                        with open(path, "a") as f:
+                                for record in self.to_records():
+                                        f.write(json.dumps(record) + "\n")
+
+        def clear(self):
+                with self.lock:
+                        self.histograms = {}
+
+# Shared by everything in the process
+METRICS = Metrics()
+
+def observe(name, seconds, **labels):
+        METRICS.observe(name, seconds, **labels)
+
+def timed(name, **labels):
+        return METRICS.timed(name, **labels)
+
+def export(path):
+        METRICS.export(path)
+
+
+class TimedConnectionMixin:
+        # Splits connection setup into dns, connect and tls, and measures how
+        # long each response took to start coming back.
+
+        def _new_conn(self):
+                start = time.perf_counter()
+                host = self._dns_host
+                try:
+                        # Resolve here so it can be timed
+                        addresses = [info[4][0] for info in socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)]
+                except socket.gaierror:
+                        # Let urllib3 fail it the usual way
+                        addresses = [host]
+                resolved = time.perf_counter()
+                try:
+                        # Every address in turn until one connects, like
+                        # socket.create_connection, so one unreachable
+                        # IPv6 address doesn't fail the request
+                        for i, address in enumerate(addresses):
+                                self._dns_host = address
+                                try:
+                                        sock = super()._new_conn()
+                                        break
+                                except ConnectTimeoutError:
+                                        # NewConnectionError too
+                                        if i == len(addresses) - 1:
+                                                raise
+                finally:
+                        # Resolved again on the next connection
+                        self._dns_host = host
+                self.connected_at = time.perf_counter()
+                observe("http_phase_seconds", resolved - start, phase="dns", host=self.host)
+                observe("http_phase_seconds", self.connected_at - resolved, phase="connect", host=self.host)
+                return sock
+
+        def request(self, *args, **kwargs):
+                super().request(*args, **kwargs)
+                self.request_sent_at = time.perf_counter()
+
+        def getresponse(self):
+                response = super().getresponse()
+                observe("http_phase_seconds", time.perf_counter() - self.request_sent_at, phase="ttfb", host=self.host)
+                return response
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+        pass
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+
+        def connect(self):
+                super().connect()
+                observe("http_phase_seconds", time.perf_counter() - self.connected_at, phase="tls", host=self.host)
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = TimedHTTPSConnection
+
+class TimedHTTPAdapter(requests.adapters.HTTPAdapter):
+
+        def init_poolmanager(self, *args, **kwargs):
+                super().init_poolmanager(*args, **kwargs)
+                self.poolmanager.pool_classes_by_scheme = {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
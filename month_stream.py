@@ -0,0 +1,120 @@
+import codecs
+import re
+from collections import defaultdict
+
+# Incremental reader for recreation.gov month payloads:
+#
+#   {"campsites": {"<id>": {"availabilities": {"<date>": "Available", ...},
+#                          "site": "001", ...}, ...}, "count": ...}
+#
+# The body is scanned as it arrives for braces and strings only, so nothing
+# is ever decoded into dicts. Each campsite object is cut out of the stream
+# once its closing brace is seen, its "site" is checked against the filter,
+# and only then are its available dates pulled out with a regex. The buffer
+# never holds more than the campsite being read.
+
+CHUNK_SIZE = 64 * 1024
+STRUCTURE_RE = re.compile(r'["{}]')
+STRING_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"')
+SKIP_RE = re.compile(r'[^"{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"{}]*)*')
+SITE_RE = re.compile(r'"site"\s*:\s*"([^"]*)"')
+AVAILABILITIES_RE = re.compile(r'"availabilities"\s*:\s*\{([^}]*)\}')
+AVAILABLE_RE = re.compile(r'"([^"]+)"\s*:\s*"Available"')
+
+# Depth of the braces around a campsite object: top level, "campsites", campsite
+CAMPSITE_DEPTH = 3
+
+
+class CampsiteScanner:
+
+        def __init__(self):
+                self.buffer = ""
+                self.pos = 0
+                self.depth = 0
+                self.last_key = None
+                self.in_campsites = False
+                self.campsite_start = None
+
+        def feed(self, text):
+                # Returns the text of every campsite object completed by 'text'
+                self.buffer += text
+                campsites = []
+                buffer = self.buffer
+                pos = self.pos
+                while True:
+                        if self.depth == 1:
+                                # Top level, look at strings one by one to
+                                # find the key in front of each object.
+                                match = STRUCTURE_RE.search(buffer, pos)
+                                if match is None:
+                                        pos = len(buffer)
+                                        break
+                                pos = match.start()
+                                if match.group() == '"':
+                                        string = STRING_RE.match(buffer, pos)
+                                        if string is None:
+                                                break
+                                        self.last_key = string.group()
+                                        pos = string.end()
+                                        continue
+                        else:
+                                # Skip everything up to the next brace, strings
+                                # included, in one regex call.
+                                pos = SKIP_RE.match(buffer, pos).end()
+                                if pos == len(buffer) or buffer[pos] == '"':
+                                        # Out of data, possibly inside a string
+                                        break
+                        if buffer[pos] == "{":
+                                self.depth += 1
+                                if self.depth == 2:
+                                        self.in_campsites = self.last_key == '"campsites"'
+                                elif self.depth == CAMPSITE_DEPTH and self.in_campsites:
+                                        self.campsite_start = pos
+                        else:
+                                if self.depth == CAMPSITE_DEPTH and self.campsite_start is not None:
+                                        campsites.append(buffer[self.campsite_start:pos + 1])
+                                        self.campsite_start = None
+                                self.depth -= 1
+                        pos += 1
+
+                # Only keep what's still needed: an unfinished campsite or string
+                keep = self.campsite_start if self.campsite_start is not None else pos
+                self.buffer = buffer[keep:]
+                self.pos = pos - keep
+                if self.campsite_start is not None:
+                        self.campsite_start = 0
+                return campsites
+
+def get_campsite_available(campsite_text, site_filter):
+        # (site, date) for every available date of a campsite that passes the
+        # same checks load_latest_available makes.
+        site = SITE_RE.search(campsite_text)
+        if site is None or not site.group(1).isdigit() or not site_filter(site.group(1)):
+                return []
+        availabilities = AVAILABILITIES_RE.search(campsite_text)
+        if availabilities is None:
+                return []
+        site_number = site.group(1)
+        return [(site_number, date) for date in AVAILABLE_RE.findall(availabilities.group(1))]
+
+def iter_available(chunks, site_filter, normalize=lambda d: d):
+        # Yields (site, normalize(date)) for each available date in a month
+        # payload given as an iterable of bytes chunks.
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        scanner = CampsiteScanner()
+        for chunk in chunks:
+                for campsite_text in scanner.feed(decoder.decode(chunk)):
+                        for site, date in get_campsite_available(campsite_text, site_filter):
+                                yield site, normalize(date)
+        for campsite_text in scanner.feed(decoder.decode(b"", final=True)):
+                for site, date in get_campsite_available(campsite_text, site_filter):
+                        yield site, normalize(date)
+
+def collect_available(pairs):
+        # Same shape as load_latest_available's result
+        availability = defaultdict(list)
+        for site, day in pairs:
+                availability[site].append(day)
+        for days in availability.values():
+                days.sort()
+        return availability
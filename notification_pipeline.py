@@ -0,0 +1,228 @@
+import json
+import time
+
+from fetch_cache import write_atomic
+from metrics import observe
+
+# Sits between detection and NotificationDispatcher, so a cancellation storm
+# turns into a few digests instead of a message per site per poll.
+#
+# Every new interval for every recipient is a Notice. Notices wait in the
+# pipeline until their recipient has had nothing new for 'debounce' seconds,
+# or the oldest has waited 'max_delay'. A notice replaces any waiting one for
+# the same site and overlapping days, so a run that grows while waiting is
+# sent once, as it ended up, and one that closes again is dropped.
+#
+# A NotificationCache remembers what each recipient was sent for 'ttl'
+# seconds, in a json file if it has a path, so a site that flaps open and
+# closed isn't sent again on every reopening, by this run or the next ones.
+#
+# Each recipient gets one digest per campground, split into as few messages
+# as fit their channel's max_length (notifiers set it, e.g. 1600 for SMS).
+# Only what was delivered goes in the cache. A recipient whose digest failed
+# gets it again RETRY_DELAY later, with anything new since, for as long as
+# its days stay open.
+
+DEFAULT_DEBOUNCE = 0.0
+DEFAULT_MAX_DELAY = 300.0
+DEFAULT_TTL = 6 * 3600
+RETRY_DELAY = 60.0
+TRUNCATED = "..."
+
+
+class Notice:
+
+        def __init__(self, channel, recipient, campground_id, site, start, end, line, booking_url, name=None, detected=None):
+                self.channel = channel
+                self.recipient = recipient
+                self.campground_id = campground_id
+                self.site = site
+                # [start, end) in days since REF_DATE
+                self.start = start
+                self.end = end
+                # How the interval reads in a digest, e.g. "Site 003 on 07/14, 07/15"
+                self.line = line
+                self.booking_url = booking_url
+                # For a greeting, subscribers have names
+                self.name = name
+                # time.perf_counter() when the interval was first seen
+                self.detected = time.perf_counter() if detected is None else detected
+
+        def __repr__(self):
+                return "Notice({} {} site {} [{}, {}))".format(self.channel, self.recipient, self.site, self.start, self.end)
+
+        def group(self):
+                # Notices that go out together
+                return (self.channel, self.recipient, self.campground_id, self.booking_url)
+
+        def key(self):
+                return "{}|{}|{}|{}|{}|{}".format(self.channel, self.recipient, self.campground_id, self.site, self.start, self.end)
+
+        def overlaps(self, other):
+                return self.group() == other.group() and self.site == other.site and self.start < other.end and other.start < self.end
+
+        def is_open(self, latest):
+                # Whether any of its days are still available in {site: [days]}
+                return any(self.start <= d < self.end for d in latest.get(self.site, ()))
+
+class NotificationCache:
+
+        def __init__(self, path=None, ttl=DEFAULT_TTL):
+                self.path = path
+                self.ttl = ttl
+                # key -> wall clock time it stops being suppressed
+                self.expiries = {}
+                if path is not None:
+                        try:
+                                with open(path) as f:
+                                        self.expiries = json.load(f)
+                        except (OSError, ValueError):
+                                pass
+
+        def seen(self, key, now=None):
+                now = time.time() if now is None else now
+                return self.expiries.get(key, 0) > now
+
+        def add(self, keys, now=None):
+                now = time.time() if now is None else now
+                for key in keys:
+                        self.expiries[key] = now + self.ttl
+
+        def save(self, now=None):
+                now = time.time() if now is None else now
+                self.expiries = {k: v for k, v in self.expiries.items() if v > now}
+                if self.path is not None:
+                        write_atomic(self.path, json.dumps(self.expiries).encode("utf-8"))
+
+def split_digest(header, lines, limit=None):
+        # Bodies of the header and as many lines as fit in 'limit' characters
+        # each, with the header repeated. Lines too long on their own are cut.
+        if limit is None:
+                return ["\n".join([header] + lines)]
+        bodies = []
+        body = header
+        for line in lines:
+                room = limit - len(header) - 1
+                if len(line) > room:
+                        line = line[:max(0, room - len(TRUNCATED))] + TRUNCATED
+                if len(body) + 1 + len(line) > limit:
+                        bodies.append(body)
+                        body = header
+                body += "\n" + line
+        bodies.append(body)
+        return bodies
+
+class NotificationPipeline:
+
+        def __init__(self, dispatcher, cache=None, debounce=DEFAULT_DEBOUNCE, max_delay=DEFAULT_MAX_DELAY, retry_delay=RETRY_DELAY):
+                self.dispatcher = dispatcher
+                self.cache = cache if cache is not None else NotificationCache()
+                self.debounce = debounce
+                self.max_delay = max_delay
+                self.retry_delay = retry_delay
+                # group -> [notices]
+                self.pending = {}
+                # group -> (first added, last added), on time.perf_counter()
+                self.added = {}
+                # group -> when a failed digest can be sent again
+                self.retry_at = {}
+
+        def add(self, notices, now=None):
+                # Returns how many weren't sent already
+                now = time.perf_counter() if now is None else now
+                wall = time.time()
+                count = 0
+                for notice in notices:
+                        if self.cache.seen(notice.key(), wall):
+                                continue
+                        group = notice.group()
+                        waiting = [n for n in self.pending.get(group, []) if not n.overlaps(notice)]
+                        waiting.append(notice)
+                        self.pending[group] = waiting
+                        first, _ = self.added.get(group, (now, now))
+                        self.added[group] = (first, now)
+                        count += 1
+                return count
+
+        def discard_closed(self, campground_id, latest):
+                # Drops waiting notices none of whose days are available anymore
+                for group, notices in list(self.pending.items()):
+                        if group[2] != campground_id:
+                                continue
+                        notices = [n for n in notices if n.is_open(latest)]
+                        if notices:
+                                self.pending[group] = notices
+                        else:
+                                self.remove(group)
+
+        def remove(self, group):
+                notices = self.pending.pop(group)
+                del self.added[group]
+                self.retry_at.pop(group, None)
+                return notices
+
+        def due_at(self, group):
+                first, last = self.added[group]
+                return max(min(last + self.debounce, first + self.max_delay), self.retry_at.get(group, 0.0))
+
+        def next_flush(self):
+                # time.perf_counter() when the next digest is due, None if none are waiting
+                return min((self.due_at(g) for g in self.pending), default=None)
+
+        def digests(self, notices):
+                # (channel, recipient, subject, message, booking_url) messages for a group
+                channel, recipient, campground_id, booking_url = notices[0].group()
+                notifier = next((n for n in self.dispatcher.notifiers if n.channel == channel), None)
+                subject = "New availability at campground {}".format(campground_id)
+                header = "Campground {}. New availability:".format(campground_id)
+                if notices[0].name:
+                        header = "Hi {}. ".format(notices[0].name) + header
+                limit = getattr(notifier, "max_length", None)
+                if limit is not None:
+                        # Room for what the notifier adds, like the booking url
+                        limit -= len(notifier.format(subject, "", booking_url))
+                lines = ["  " + n.line for n in sorted(notices, key=lambda n: (n.site, n.start))]
+                bodies = split_digest(header, lines, limit)
+                if len(bodies) > 1:
+                        return [(channel, recipient, "{} ({}/{})".format(subject, i + 1, len(bodies)), body, booking_url)
+                                for i, body in enumerate(bodies)]
+                return [(channel, recipient, subject, bodies[0], booking_url)]
+
+        def flush(self, now=None, force=False):
+                # Sends every digest that's due, or all of them with 'force'
+                now = time.perf_counter() if now is None else now
+                groups = [g for g in self.pending if force or self.due_at(g) <= now]
+                if not groups:
+                        return []
+                messages = []
+                flushed = {}
+                for group in groups:
+                        flushed[group] = (self.added[group], self.remove(group))
+                        messages.extend(self.digests(flushed[group][1]))
+                print("Sending {} digests".format(len(messages)))
+                results = self.dispatcher.send(messages)
+                # A recipient's digests only count as sent if every part went out
+                delivered = {}
+                for r in results:
+                        delivered[(r.channel, r.recipient)] = delivered.get((r.channel, r.recipient), True) and r.ok
+                sent = time.perf_counter()
+                retry = 0
+                for group, (added, notices) in flushed.items():
+                        if delivered.get(group[:2]):
+                                self.cache.add(n.key() for n in notices)
+                                # From the first sighting to the last message going out
+                                observe("detect_to_notify_seconds", sent - min(n.detected for n in notices), campground=group[2])
+                                continue
+                        self.pending[group] = notices
+                        self.added[group] = added
+                        self.retry_at[group] = now + self.retry_delay
+                        retry += 1
+                if retry:
+                        print("Unable to send {} digests, trying again in {:.0f}s".format(retry, self.retry_delay))
+                self.cache.save()
+                return results
+
+        def close(self):
+                self.flush(force=True)
+                if self.pending:
+                        print("Giving up on {} digests that couldn't be sent".format(len(self.pending)))
@@ -0,0 +1,312 @@
+import json
+import queue
+import smtplib
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from metrics import observe
+
+# Notification channels that hold on to their connections between sends, and
+# a dispatcher that sends to every recipient of every channel at once.
+#
+# Channels register themselves in BACKENDS with the command line options they
+# take, which is all it takes to add one. The parser gets an --enable_<channel>
+# flag and the options of every registered channel, and only enabled channels
+# are built. Client libraries that are slow to import, like twilio, are
+# imported when their channel is built rather than with this module.
+
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_WORKERS = 16
+SMTP_HOST = "smtp.gmail.com"
+SMTP_PORT = 465
+PUSHOVER_URL = "https://api.pushover.net/1/messages.json"
+
+# channel -> notifier class
+BACKENDS = {}
+
+
+def is_transient(e):
+        # Throttling, server errors and dropped connections are worth a retry,
+        # anything else the recipient would refuse again.
+        status = getattr(e, "status", None)
+        response = getattr(e, "response", None)
+        if status is None and response is not None:
+                status = getattr(response, "status_code", None)
+        if isinstance(status, int):
+                return status == 429 or status >= 500
+        smtp_code = getattr(e, "smtp_code", None)
+        if isinstance(smtp_code, int):
+                return 400 <= smtp_code < 500
+        if isinstance(e, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPAuthenticationError)):
+                return False
+        return True
+
+class DeliveryResult:
+
+        def __init__(self, channel, recipient, ok, latency, attempts, error=None):
+                self.channel = channel
+                self.recipient = recipient
+                self.ok = ok
+                self.latency = latency
+                self.attempts = attempts
+                self.error = error
+
+        def __repr__(self):
+                return "DeliveryResult({}, {}, ok={}, latency={:.3f}s, attempts={})".format(
+                        self.channel, self.recipient, self.ok, self.latency, self.attempts)
+
+def register_notifier(cls):
+        # A notifier class has a channel name, a list of (flags, argparse
+        # keyword arguments) options and from_args(args, session) to build it
+        BACKENDS[cls.channel] = cls
+        return cls
+
+def option_dest(flags):
+        return flags[-1].lstrip("-")
+
+def add_notifier_args(parser):
+        for channel, cls in BACKENDS.items():
+                parser.add_argument("--enable_" + channel, action="store_true")
+                for flags, kwargs in cls.options:
+                        parser.add_argument(*flags, **kwargs)
+
+def check_notifier_args(args):
+        for channel, cls in BACKENDS.items():
+                if not getattr(args, "enable_" + channel):
+                        continue
+                if any(getattr(args, option_dest(flags)) is None for flags, _ in cls.options):
+                        raise ValueError("If --enable_{} is set, must provide {}.".format(
+                                channel, ", ".join(flags[-1] for flags, _ in cls.options)))
+
+def build_notifiers(args, session=None):
+        # One long-lived notifier per enabled channel
+        return [cls.from_args(args, session) for channel, cls in BACKENDS.items() if getattr(args, "enable_" + channel)]
+
+@register_notifier
+class SmsNotifier:
+        channel = "sms"
+        # Twilio's limit for a message split over several SMS
+        max_length = 1600
+        options = [(("-sid", "--twilio_sid"), {}), (("-auth", "--twilio_auth_token"), {}),
+                (("--phone_from",), {}), (("--phone_to",), {"action": "append"})]
+
+        def __init__(self, account_sid, auth_token, phone_from, phone_list_to):
+                from twilio.rest import Client
+                self.client = Client(account_sid, auth_token)
+                self.phone_from = phone_from
+                self.recipients = list(phone_list_to)
+
+        @classmethod
+        def from_args(cls, args, session=None):
+                return cls(args.twilio_sid, args.twilio_auth_token, args.phone_from, args.phone_to)
+
+        def format(self, subject, message, booking_url):
+                return message + "\n" + booking_url
+
+        def send(self, recipient, subject, body):
+                self.client.messages.create(body=body, from_=self.phone_from, to=recipient)
+
+        def close(self):
+                pass
+
+@register_notifier
+class EmailNotifier:
+        channel = "email"
+        max_length = None
+        options = [(("--email_from",), {}), (("--email_from_password",), {}), (("--email_to",), {"action": "append"})]
+
+        def __init__(self, email_from, email_from_password, email_list_to, max_connections=2):
+                self.email_from = email_from
+                self.email_from_password = email_from_password
+                self.recipients = list(email_list_to)
+                self.context = ssl.create_default_context()
+                # Logged in connections are kept here between sends. An
+                # SMTP connection can only send one message at a time.
+                self.idle = queue.LifoQueue()
+                self.slots = threading.Semaphore(max_connections)
+
+        @classmethod
+        def from_args(cls, args, session=None):
+                return cls(args.email_from, args.email_from_password, args.email_to)
+
+        def format(self, subject, message, booking_url):
+                return message + "\n\nReserve sites at " + booking_url
+
+        def connect(self):
+                server = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, context=self.context)
+                server.login(self.email_from, self.email_from_password)
+                return server
+
+        def send(self, recipient, subject, body):
+                with self.slots:
+                        try:
+                                server = self.idle.get_nowait()
+                        except queue.Empty:
+                                server = self.connect()
+                        try:
+                                server.sendmail(self.email_from, recipient, "Subject: {}\n\n{}".format(subject, body))
+                        except Exception as e:
+                                # SMTPException is an OSError too, but only a socket
+                                # error or a disconnect means the connection is gone
+                                if isinstance(e, smtplib.SMTPServerDisconnected) or (
+                                                isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException)):
+                                        self.quit(server)
+                                else:
+                                        # Refused, the connection is still logged in
+                                        self.idle.put(server)
+                                raise
+                        self.idle.put(server)
+
+        def quit(self, server):
+                try:
+                        server.quit()
+                except Exception:
+                        pass
+
+        def close(self):
+                while not self.idle.empty():
+                        self.quit(self.idle.get_nowait())
+
+@register_notifier
+class PushoverNotifier:
+        channel = "pushover"
+        max_length = 1024
+        options = [(("--pushover_user_key",), {}), (("--pushover_api_token",), {})]
+
+        def __init__(self, user_key, api_token, session=None):
+                self.api_token = api_token
+                self.recipients = [user_key]
+                self.own_session = session is None
+                self.session = requests.Session() if session is None else session
+
+        @classmethod
+        def from_args(cls, args, session=None):
+                return cls(args.pushover_user_key, args.pushover_api_token, session=session)
+
+        def format(self, subject, message, booking_url):
+                return message + "\n" + booking_url
+
+        def send(self, recipient, subject, body):
+                response = self.session.post(PUSHOVER_URL, data={"token": self.api_token, "user": recipient, "message": body})
+                response.raise_for_status()
+
+        def close(self):
+                if self.own_session:
+                        self.session.close()
+
+@register_notifier
+class WebhookNotifier:
+        # POSTs {"subject", "message"} as JSON to every URL
+        channel = "webhook"
+        max_length = None
+        options = [(("--webhook_url",), {"action": "append"})]
+
+        def __init__(self, urls, session=None):
+                self.recipients = list(urls)
+                self.own_session = session is None
+                self.session = requests.Session() if session is None else session
+
+        @classmethod
+        def from_args(cls, args, session=None):
+                return cls(args.webhook_url, session=session)
+
+        def format(self, subject, message, booking_url):
+                return message + "\n" + booking_url
+
+        def send(self, recipient, subject, body):
+                response = self.session.post(recipient, json={"subject": subject, "message": body})
+                response.raise_for_status()
+
+        def close(self):
+                if self.own_session:
+                        self.session.close()
+
+@register_notifier
+class FileNotifier:
+        # Appends {"time", "subject", "message"} lines of JSON to a file
+        channel = "file"
+        max_length = None
+        options = [(("--notify_file",), {})]
+
+        def __init__(self, path):
+                self.recipients = [path]
+                self.lock = threading.Lock()
+
+        @classmethod
+        def from_args(cls, args, session=None):
+                return cls(args.notify_file)
+
+        def format(self, subject, message, booking_url):
+                return message + "\n" + booking_url
+
+        def send(self, recipient, subject, body):
+                line = json.dumps({"time": time.time(), "subject": subject, "message": body})
+                with self.lock:
+                        with open(recipient, "a") as f:
+                                f.write(line + "\n")
+
+        def close(self):
+                pass
+
+class NotificationDispatcher:
+
+        def __init__(self, notifiers, max_workers=DEFAULT_MAX_WORKERS, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+                self.notifiers = list(notifiers)
+                self.retries = retries
+                self.backoff = backoff
+                self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        def deliver(self, notifier, recipient, subject, body, start):
+                result = self.send_with_retries(notifier, recipient, subject, body, start)
+                observe("notify_seconds", result.latency, channel=result.channel, ok=result.ok)
+                return result
+
+        def send_with_retries(self, notifier, recipient, subject, body, start):
+                attempts = 0
+                while True:
+                        attempts += 1
+                        try:
+                                notifier.send(recipient, subject, body)
+                                return DeliveryResult(notifier.channel, recipient, True, time.perf_counter() - start, attempts)
+                        except Exception as e:
+                                if attempts > self.retries or not is_transient(e):
+                                        return DeliveryResult(notifier.channel, recipient, False,
+                                                time.perf_counter() - start, attempts, e)
+                                time.sleep(self.backoff * 2 ** (attempts - 1))
+
+        def dispatch(self, subject, message, booking_url):
+                # Send to every recipient of every channel
+                return self.send([(notifier.channel, recipient, subject, message, booking_url)
+                        for notifier in self.notifiers for recipient in notifier.recipients])
+
+        def send(self, messages):
+                # Send (channel, recipient, subject, message, booking_url)
+                # messages concurrently. Latency is measured from the start of
+                # the send, so it is how long each recipient waited for their message.
+                start = time.perf_counter()
+                notifiers = {notifier.channel: notifier for notifier in self.notifiers}
+                futures = []
+                for channel, recipient, subject, message, booking_url in messages:
+                        notifier = notifiers.get(channel)
+                        if notifier is None:
+                                print("Unable to send {} to {}: {} isn't enabled".format(channel, recipient, channel))
+                                continue
+                        body = notifier.format(subject, message, booking_url)
+                        futures.append(self.executor.submit(self.deliver, notifier, recipient, subject, body, start))
+                results = [f.result() for f in futures]
+                for r in results:
+                        if r.ok:
+                                print("Sent {} to {} in {:.3f}s ({} attempts)".format(r.channel, r.recipient, r.latency, r.attempts))
+                        else:
+                                print("Unable to send {} to {}: {}".format(r.channel, r.recipient, r.error))
+                return results
+
+        def close(self):
+                self.executor.shutdown()
+                for notifier in self.notifiers:
+                        notifier.close()
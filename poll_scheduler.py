@@ -0,0 +1,126 @@
+import time
+from datetime import datetime, timedelta
+
+from availability import REF_DATE
+
+# Decides when each month of each watched campground is polled next.
+#
+# Every (campground, month) starts at its watch's interval. A month whose
+# days keep changing is polled more often, down to min_interval, and one
+# that stays quiet backs off, up to max_interval. Around a campground's
+# release times its months are polled at min_interval. Months of the same
+# campground that are due at about the same time are polled together.
+#
+# The request budget itself is enforced by rate_limit.TokenBucket, this only
+# decides where to spend it.
+
+DEFAULT_MIN_INTERVAL = 15
+DEFAULT_MAX_INTERVAL = 900
+DEFAULT_RELEASE_WINDOW = 600
+CONFIG_TIME_FORMAT = "%H:%M"
+# Weight of the latest poll in a month's churn, the changed days per poll
+CHURN_ALPHA = 0.3
+# Churn at which a month counts as hot
+HOT_CHURN = 0.5
+# Interval growth per quiet poll in a row
+COOLING = 1.5
+# Months of a campground due within this many seconds of each other go together
+BATCH_SLACK = 2.0
+
+
+def month_day_range(month):
+        # [first day, first day of the next month) as days since REF_DATE
+        next_month = month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1, day=1)
+        return (month - REF_DATE).days, (next_month - REF_DATE).days
+
+def count_month_changes(changes, months):
+        # {month: days added or removed} from get_changed_days' (added, removed)
+        ranges = {month: month_day_range(month) for month in months}
+        counts = {month: 0 for month in months}
+        for by_site in changes:
+                for days in by_site.values():
+                        for day in days:
+                                for month, (start, end) in ranges.items():
+                                        if start <= day < end:
+                                                counts[month] += 1
+        return counts
+
+def next_interval(base, churn, quiet, min_interval, max_interval):
+        if churn >= HOT_CHURN:
+                interval = base / (1 + churn)
+        else:
+                interval = base * COOLING ** quiet
+        return min(max(interval, min_interval), max_interval)
+
+def release_window(release_times, window, now):
+        # (start, end) wall clock timestamps of the current or next release
+        # window. Polling speeds up one minute before a release time.
+        starts = []
+        for t in release_times:
+                clock = datetime.strptime(t, CONFIG_TIME_FORMAT)
+                release = now.replace(hour=clock.hour, minute=clock.minute, second=0, microsecond=0)
+                for day in (0, 1):
+                        start = release + timedelta(days=day) - timedelta(minutes=1)
+                        if start + timedelta(minutes=1, seconds=window) > now:
+                                starts.append(start)
+                                break
+        if not starts:
+                return None
+        start = min(starts)
+        return start.timestamp(), start.timestamp() + 60 + window
+
+class MonthState:
+
+        def __init__(self, watch, month, due):
+                self.watch = watch
+                self.month = month
+                self.due = due
+                self.interval = watch.interval
+                self.churn = 0.0
+                self.quiet = 0
+
+class PollScheduler:
+
+        def __init__(self, watches, min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL):
+                self.min_interval = min_interval
+                self.max_interval = max_interval
+                now = time.monotonic()
+                self.states = [MonthState(watch, month, now) for watch in watches for month in watch.months]
+
+        def next_poll(self):
+                # (due time, watch, months) for the next poll, on time.monotonic()
+                first = min(self.states, key=lambda s: s.due)
+                batch = [s for s in self.states if s.watch is first.watch and s.due <= first.due + BATCH_SLACK]
+                return first.due, first.watch, [s.month for s in batch]
+
+        def states_for(self, watch, months):
+                return [s for s in self.states if s.watch is watch and s.month in months]
+
+        def in_release(self, watch, now_wall):
+                # Seconds until the next release window starts, 0 when in one
+                window = release_window(watch.release_times, watch.release_window, datetime.fromtimestamp(now_wall))
+                if window is None:
+                        return None
+                return max(0.0, window[0] - now_wall)
+
+        def record(self, watch, months, counts, now=None, now_wall=None):
+                # After a poll, with the changed days per month
+                now = time.monotonic() if now is None else now
+                now_wall = time.time() if now_wall is None else now_wall
+                until_release = self.in_release(watch, now_wall)
+                for s in self.states_for(watch, months):
+                        changed = counts.get(s.month, 0)
+                        s.churn = CHURN_ALPHA * changed + (1 - CHURN_ALPHA) * s.churn
+                        s.quiet = 0 if changed else s.quiet + 1
+                        s.interval = next_interval(watch.interval, s.churn, s.quiet, self.min_interval, self.max_interval)
+                        if until_release == 0:
+                                s.interval = self.min_interval
+                        s.due = now + s.interval
+                        if until_release:
+                                # Don't sleep through the start of a release
+                                s.due = min(s.due, now + until_release)
+
+        def record_failure(self, watch, months, retry_after=None, now=None):
+                now = time.monotonic() if now is None else now
+                for s in self.states_for(watch, months):
+                        s.due = now + max(retry_after or 0, s.interval)
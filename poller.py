@@ -0,0 +1,292 @@
+import argparse
+import json
+import time
+from datetime import datetime
+
+from availability import *
+from metrics import export
+from watch_rules import RuleIndex, config_date_to_day, load_rules
+from poll_scheduler import (DEFAULT_MAX_INTERVAL, DEFAULT_MIN_INTERVAL, DEFAULT_RELEASE_WINDOW, PollScheduler,
+        count_month_changes, month_day_range)
+from rate_limit import DEFAULT_BURST, DEFAULT_RATE, TokenBucket
+from itinerary import build_itinerary_message, build_itinerary_notices, get_new_itineraries
+from events import build_event_bus, site_events
+
+
+# The format used for months in the watch config, e.g. "2026-07"
+CONFIG_MONTH_FORMAT = "%Y-%m"
+DEFAULT_POLL_INTERVAL = 60
+DEFAULT_STORE_TEMPLATE = "available_{}.snapshot"
+
+
+def max_site_filter(max_site):
+        if max_site is None:
+                return lambda site_number: True
+        return lambda site_number: int(site_number) <= max_site
+
+class Watch:
+
+        def __init__(self, campground_id, months, interval=DEFAULT_POLL_INTERVAL,
+                        min_stay_length=DEFAULT_MIN_STAY_LENGTH, max_site=None, store=None, json_file=None,
+                        release_times=(), release_window=DEFAULT_RELEASE_WINDOW, itineraries=()):
+                self.campground_id = campground_id
+                self.months = months
+                self.interval = interval
+                self.min_stay_length = min_stay_length
+                self.site_filter = max_site_filter(max_site)
+                self.store_path = store or DEFAULT_STORE_TEMPLATE.format(campground_id)
+                # Only read, to seed an empty store from an older run
+                self.json_file = json_file
+                self.store = None
+                self.booking_url = get_booking_url(campground_id)
+                # Times of day ("HH:MM") new dates open up, polled hard around them
+                self.release_times = list(release_times)
+                self.release_window = release_window
+                # Stays to look for ways to piece together across sites, as
+                # (first night, day after the last night, max moves)
+                self.itineraries = list(itineraries)
+                # Availability seen on the last cycle, kept in memory between cycles
+                self.previous = None
+                self.changes = None
+                # Change events from the last update
+                self.events = []
+                self.indexes = {}
+                self.rules = None
+
+        def set_rules(self, rules):
+                # With subscriber rules, they decide which sites are fetched and
+                # who hears about what, instead of max_site and min_stay_length
+                self.rules = RuleIndex(rules)
+                self.site_filter = self.rules.wants_site
+                self.min_stay_length = self.rules.min_stay_length
+
+        def pairs(self, months=None):
+                return [(self.campground_id, month) for month in (months or self.months)]
+
+        def merge(self, fetched, months):
+                # The last availability seen with 'months' replaced by 'fetched'
+                if self.previous is None or set(months) >= set(self.months):
+                        return fetched
+                ranges = [month_day_range(m) for m in months]
+                in_months = lambda day: any(start <= day < end for start, end in ranges)
+                merged = defaultdict(list)
+                for site, days in self.previous.items():
+                        merged[site].extend(d for d in days if not in_months(d))
+                for site, days in fetched.items():
+                        merged[site].extend(days)
+                return {site: sorted(days) for site, days in merged.items() if days}
+
+        def reset(self):
+                # Forgets everything seen, the next poll loads it from the store again
+                if self.store is not None:
+                        self.store.close()
+                self.store = None
+                self.previous = None
+                self.changes = None
+                self.events = []
+                self.indexes = {}
+
+        def update(self, latest, observed=None):
+                # Apply this cycle's changes to the per-site interval indexes and
+                # return the new intervals. Only the indexes of sites that changed
+                # do any work, but finding those sites still compares both
+                # snapshots, so a cycle is O(all availability), at C speed for
+                # sites whose days are unchanged.
+                if self.previous is None:
+                        self.previous = {}
+                changed = [s for s in set(self.previous) | set(latest) if self.previous.get(s) != latest.get(s)]
+                added, removed = get_changed_days({s: self.previous[s] for s in changed if s in self.previous},
+                        {s: latest[s] for s in changed if s in latest})
+                self.changes = (added, removed)
+                observed = time.time() if observed is None else observed
+                self.events = []
+                new_intervals = {}
+                for site in sorted(set(added) | set(removed)):
+                        index = self.indexes.setdefault(site, IntervalIndex())
+                        prev_runs = index.intervals()
+                        index.apply(added.get(site, ()), removed.get(site, ()))
+                        self.events.extend(site_events(self.campground_id, site, prev_runs, index.intervals(),
+                                added.get(site, ()), removed.get(site, ()), observed))
+                        intervals = index.changes(self.min_stay_length)
+                        if intervals:
+                                new_intervals[site] = intervals
+                        index.snapshot()
+                self.previous = latest
+                return new_intervals
+
+def load_itinerary(config):
+        # {"start": "2026-07-14", "nights": 14, "max_moves": 1}
+        start = config_date_to_day(config["start"])
+        return start, start + config["nights"], config.get("max_moves", 1)
+
+def load_watches(filename):
+        with open(filename, 'r') as config_file:
+                config = json.load(config_file)
+        watches = []
+        for c in config["campgrounds"]:
+                months = [datetime.strptime(m, CONFIG_MONTH_FORMAT) for m in c["months"]]
+                watches.append(Watch(c["id"], months,
+                        interval=c.get("interval", DEFAULT_POLL_INTERVAL),
+                        min_stay_length=c.get("min_stay_length", DEFAULT_MIN_STAY_LENGTH),
+                        max_site=c.get("max_site"),
+                        store=c.get("store"),
+                        json_file=c.get("json"),
+                        release_times=c.get("release_times", ()),
+                        release_window=c.get("release_window", DEFAULT_RELEASE_WINDOW),
+                        itineraries=[load_itinerary(i) for i in c.get("itineraries", [])]))
+                rules = load_rules(config.get("subscribers", []), c["id"])
+                if rules:
+                        watches[-1].set_rules(rules)
+        return watches
+
+class Poller:
+
+        def __init__(self, watches, args):
+                self.watches = watches
+                self.args = args
+                # Connections and clients live for the whole process
+                self.bucket = TokenBucket(args.rate, args.burst)
+                self.session = make_session(args.max_workers, bucket=self.bucket)
+                # Notifiers get sessions of their own, recreation.gov's rate
+                # limit and backoff have nothing to do with them
+                self.dispatcher = build_dispatcher(args)
+                self.pipeline = build_pipeline(args, self.dispatcher)
+                self.cache = MonthCache(args.cache_dir) if args.cache_dir else None
+                self.events = build_event_bus(args.events_file, args.events_socket)
+
+        def poll(self, watch, months=None):
+                # Polls some or all of a watch's months, returns the number of
+                # days that changed in each
+                months = months or watch.months
+                start = time.perf_counter()
+                if self.cache is None:
+                        fetched = fetch_available(watch.pairs(months), session=self.session,
+                                max_workers=self.args.max_workers, site_filter=watch.site_filter)
+                else:
+                        fetched, changed = fetch_available_cached(watch.pairs(months), self.cache, session=self.session,
+                                max_workers=self.args.max_workers, site_filter=watch.site_filter)
+                        if not changed and watch.previous is not None:
+                                print("Campground {}: unchanged.".format(watch.campground_id))
+                                return {}
+                if watch.store is None:
+                        # First cycle, pick up where the last process left off
+                        watch.store = self.open_store(watch)
+                        watch.update(load_store(watch.store, watch.json_file))
+                latest = watch.merge(fetched, months)
+
+                prev = watch.previous
+                new_intervals = watch.update(latest)
+                # Committed before anything else can fail, so the store's
+                # history has every cycle the watch has moved on from
+                try:
+                        save_store(watch.store, None, latest, changes=watch.changes)
+                except Exception:
+                        # Start again from what the store has
+                        watch.reset()
+                        raise
+                new_intervals = self.claim(watch, new_intervals)
+                self.events.publish(watch.events)
+                self.notify_itineraries(watch, prev, latest, start)
+                # Digests still waiting don't go out for days that closed again
+                self.pipeline.discard_closed(watch.campground_id, latest)
+                new_availability = {k: intervals_to_days(v) for k, v in new_intervals.items()}
+                if not new_availability:
+                        print("Campground {}: no new availability with at least {} days.".format(
+                                watch.campground_id, watch.min_stay_length))
+                else:
+                        if watch.rules is not None:
+                                notices = watch.rules.notices(new_intervals, watch.campground_id, watch.booking_url,
+                                        detected=start, added=watch.changes[0])
+                        else:
+                                print("Campground {}. ".format(watch.campground_id) + build_message(new_availability, watch.min_stay_length))
+                                notices = build_notices(self.dispatcher.notifiers, watch.campground_id, new_intervals,
+                                        watch.booking_url, detected=start)
+                        added = self.pipeline.add(notices)
+                        print("Campground {}: {} new notices, {} already sent".format(watch.campground_id, added, len(notices) - added))
+                self.pipeline.flush()
+
+                if self.args.metrics:
+                        export(self.args.metrics)
+                return count_month_changes(watch.changes, months)
+
+        def open_store(self, watch):
+                return SnapshotStore(watch.store_path)
+
+        def claim(self, watch, new_intervals):
+                # The new intervals to notify about, all of them with one poller
+                return new_intervals
+
+        def notify_itineraries(self, watch, prev, latest, detected=None):
+                for start, end, max_moves in watch.itineraries:
+                        itineraries = get_new_itineraries(prev or {}, latest, start, end, max_moves)
+                        if itineraries:
+                                print("Campground {}. ".format(watch.campground_id) + build_itinerary_message(itineraries, start, end))
+                                self.pipeline.add(build_itinerary_notices(self.dispatcher.notifiers, watch.campground_id,
+                                        itineraries, start, end, watch.booking_url, detected))
+
+        def run(self, cycles=None):
+                # The scheduler picks which months of which campground to poll
+                # next and adapts each month's interval to how much it changes.
+                scheduler = PollScheduler(self.watches, self.args.min_interval, self.args.max_interval)
+                while self.watches and cycles != 0:
+                        due, watch, months = scheduler.next_poll()
+                        delay = due - time.monotonic()
+                        flush_delay = self.flush_delay()
+                        if flush_delay is not None and flush_delay < delay:
+                                # A digest is due before the next poll
+                                time.sleep(flush_delay)
+                                self.pipeline.flush()
+                                continue
+                        if delay > 0:
+                                time.sleep(delay)
+                        self.poll_scheduled(scheduler, watch, months)
+                        if cycles is not None:
+                                cycles -= 1
+
+        def flush_delay(self):
+                # Seconds until the next digest is due, None if none are waiting
+                due = self.pipeline.next_flush()
+                return None if due is None else max(0.0, due - time.perf_counter())
+
+        def poll_scheduled(self, scheduler, watch, months):
+                try:
+                        scheduler.record(watch, months, self.poll(watch, months))
+                except FetchError as e:
+                        print("Unable to poll campground {}: {}".format(watch.campground_id, e))
+                        scheduler.record_failure(watch, months, e.retry_after)
+                except Exception as e:
+                        print("Unable to poll campground {}: {}".format(watch.campground_id, e))
+                        scheduler.record_failure(watch, months)
+
+        def close(self):
+                self.pipeline.close()
+                self.events.close()
+                self.dispatcher.close()
+                self.session.close()
+                for watch in self.watches:
+                        if watch.store is not None:
+                                watch.store.close()
+
+def build_poller_parser():
+        parser = build_parser()
+        parser.add_argument("--config", required=True)
+        parser.add_argument("--rate", default=DEFAULT_RATE, type=float, help="Requests per second, across every campground")
+        parser.add_argument("--burst", default=DEFAULT_BURST, type=int)
+        parser.add_argument("--min_interval", default=DEFAULT_MIN_INTERVAL, type=float)
+        parser.add_argument("--max_interval", default=DEFAULT_MAX_INTERVAL, type=float)
+        parser.add_argument("--events_file", help="Append change events to this file as newline-delimited JSON")
+        parser.add_argument("--events_socket", help="Serve change events as newline-delimited JSON on this Unix socket")
+        return parser
+
+if __name__ == "__main__":
+
+        parser = build_poller_parser()
+        parser.add_argument("--cycles", type=int)
+        args = parser.parse_args()
+        check_args(args)
+
+        poller = Poller(load_watches(args.config), args)
+        try:
+                poller.run(args.cycles)
+        finally:
+                poller.close()
@@ -0,0 +1,105 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from metrics import TimedHTTPAdapter, observe
+
+# A request budget shared by every campground and month a process polls.
+#
+# TokenBucket allows 'rate' requests a second on average, with bursts of up
+# to 'burst'. When the server pushes back with a 429 or a 5xx everything
+# waits, for Retry-After if the server sent one, otherwise for a backoff that
+# doubles with each failure in a row. RateLimitedAdapter puts every request
+# made through a session behind a bucket.
+
+DEFAULT_RATE = 1.0
+DEFAULT_BURST = 10
+DEFAULT_BACKOFF = 5.0
+MAX_BACKOFF = 300.0
+
+
+def get_retry_after(response):
+        # Seconds from a Retry-After header, either form, or None
+        value = response.headers.get("Retry-After")
+        if value is None:
+                return None
+        try:
+                return max(0.0, float(value))
+        except ValueError:
+                pass
+        try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+                return None
+
+def is_throttled(status):
+        return status == 429 or status >= 500
+
+class TokenBucket:
+
+        def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+                self.rate = rate
+                self.burst = burst
+                self.tokens = float(burst)
+                self.updated = time.monotonic()
+                # Nothing goes out before this, after the server pushed back
+                self.blocked_until = 0.0
+                self.failures = 0
+                self.lock = threading.Lock()
+
+        def acquire(self):
+                waited = 0.0
+                while True:
+                        with self.lock:
+                                now = time.monotonic()
+                                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                                self.updated = now
+                                if now < self.blocked_until:
+                                        wait = self.blocked_until - now
+                                elif self.tokens >= 1:
+                                        self.tokens -= 1
+                                        if waited:
+                                                observe("rate_limit_wait_seconds", waited)
+                                        return
+                                else:
+                                        wait = (1 - self.tokens) / self.rate
+                        time.sleep(wait)
+                        waited += wait
+
+        def set_rate(self, rate):
+                with self.lock:
+                        # Tokens earned so far at the old rate
+                        now = time.monotonic()
+                        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                        self.updated = now
+                        self.rate = rate
+
+        def back_off(self, retry_after=None):
+                # Returns how long everything is held back
+                with self.lock:
+                        self.failures += 1
+                        if retry_after is None:
+                                retry_after = min(MAX_BACKOFF, DEFAULT_BACKOFF * 2 ** (self.failures - 1))
+                        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+                        self.tokens = 0.0
+                        return retry_after
+
+        def succeeded(self):
+                with self.lock:
+                        self.failures = 0
+
+class RateLimitedAdapter(TimedHTTPAdapter):
+
+        def __init__(self, bucket, *args, **kwargs):
+                self.bucket = bucket
+                super().__init__(*args, **kwargs)
+
+        def send(self, request, **kwargs):
+                self.bucket.acquire()
+                response = super().send(request, **kwargs)
+                if is_throttled(response.status_code):
+                        wait = self.bucket.back_off(get_retry_after(response))
+                        print("Got {} from {}, holding off requests for {:.1f}s".format(response.status_code, request.url, wait))
+                else:
+                        self.bucket.succeeded()
+                return response
@@ -0,0 +1,99 @@
+import statistics
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+# Fires at a target time on recreation.gov's clock instead of ours.
+#
+# The server's clock is estimated from the Date header of a series of small
+# requests. Each header only has whole seconds, so every probe just narrows
+# down the offset: a response stamped D that was sent at local t0 and
+# received at t1 means server - local is between D - t1 and D + 1 - t0.
+# Later probes are timed to land right on the edge of a second according to
+# the current estimate, which halves the uncertainty each time.
+#
+# Waiting is done on perf_counter, which doesn't jump when the wall clock is
+# adjusted. It sleeps until the last SPIN_WINDOW, then takes short sleeps,
+# and only busy-waits for the last BUSY_WINDOW.
+
+DEFAULT_PROBES = 8
+SPIN_WINDOW = 0.02
+BUSY_WINDOW = 0.0005
+
+
+def today_at(hour, minute, second=0, microsecond=0):
+	# Wall clock timestamp for a time of day today
+	return datetime.now().replace(hour=hour, minute=minute, second=second, microsecond=microsecond).timestamp()
+
+def wall_to_perf(wall_time):
+	return time.perf_counter() + (wall_time - time.time())
+
+def wait_until_perf(perf_target):
+	# Returns how late we woke up, in seconds
+	while True:
+		remaining = perf_target - time.perf_counter()
+		if remaining <= 0:
+			break
+		if remaining > SPIN_WINDOW:
+			time.sleep(remaining - SPIN_WINDOW)
+		elif remaining > BUSY_WINDOW:
+			time.sleep(remaining / 2)
+	return time.perf_counter() - perf_target
+
+def probe(session, url):
+	# (local send time, local receive time, server Date header as a timestamp)
+	t0 = time.time()
+	response = session.head(url)
+	t1 = time.time()
+	return t0, t1, parsedate_to_datetime(response.headers["Date"]).timestamp()
+
+class ReleaseTimer:
+
+	def __init__(self, offset=0.0, uncertainty=None, one_way=0.0, lead=0.0):
+		# server clock = local clock + offset
+		self.offset = offset
+		self.uncertainty = uncertainty
+		# Seconds for a request to reach the server, plus any extra margin
+		self.one_way = one_way
+		self.lead = lead
+
+	@classmethod
+	def synced(cls, session, url, probes=DEFAULT_PROBES, lead=0.0):
+		lo, hi = float("-inf"), float("inf")
+		rtts = []
+		for i in range(probes):
+			if i > 0:
+				# Aim for the response to be stamped right at a second boundary
+				mid = (lo + hi) / 2
+				server_arrival = time.time() + statistics.median(rtts) / 2 + mid
+				next_second = int(server_arrival) + 1
+				wait_until_perf(wall_to_perf(next_second - mid - statistics.median(rtts) / 2))
+			t0, t1, date = probe(session, url)
+			rtts.append(t1 - t0)
+			lo = max(lo, date - t1)
+			hi = min(hi, date + 1 - t0)
+		if lo > hi:
+			# Probes disagree, e.g. the clock was stepped while probing
+			lo, hi = hi, lo
+		timer = cls((lo + hi) / 2, (hi - lo) / 2, statistics.median(rtts) / 2, lead)
+		print("Server clock is {:+.1f} ms from ours (+/- {:.1f} ms), one way delay {:.1f} ms".format(
+			timer.offset * 1e3, timer.uncertainty * 1e3, timer.one_way * 1e3))
+		return timer
+
+	def send_time(self, server_arrival):
+		# Local wall clock time to send so a request arrives at 'server_arrival'
+		return server_arrival - self.offset - self.one_way - self.lead
+
+	def perf_send_time(self, server_arrival):
+		# send_time() on the perf_counter clock
+		send_time = self.send_time(server_arrival)
+		if send_time < time.time():
+			raise ValueError("Wait time is negative.")
+		return wall_to_perf(send_time)
+
+	def wait(self, server_arrival):
+		perf_target = self.perf_send_time(server_arrival)
+		print("Waiting {:.3f} seconds".format(perf_target - time.perf_counter()))
+		late = wait_until_perf(perf_target)
+		print("Fired at {}, {:+.3f} ms from target".format(datetime.now(), late * 1e3))
+		return late
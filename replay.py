@@ -0,0 +1,322 @@
+import argparse
+import gzip
+import json
+import os
+import random
+import statistics
+import time
+from bisect import bisect_right
+from datetime import datetime
+
+from availability import *
+from synthetic_months import churn_payload, make_month_payload
+from poll_scheduler import DEFAULT_MAX_INTERVAL, DEFAULT_MIN_INTERVAL, PollScheduler, count_month_changes, month_day_range
+from poller import Watch
+
+# Records month responses over days and replays them offline, to tune polling
+# and try out pipeline changes against real churn without touching
+# recreation.gov.
+#
+# An archive is a gzipped file of JSON lines. The first line is a header with
+# the campground and months, then one line per poll:
+#
+#   {"t": <unix time>, "months": [<month>, ...]}
+#
+# where a month is null if its response is the same as in the line before,
+# {"patch": {<campsite id>: <campsite or null>}, "rest": {...}} with just the
+# campsites that changed and the response's other keys, or {"full": <month
+# response>}. Most polls change a few sites at most, so they take a few bytes
+# each. Recording again into the same file appends another gzip member, which
+# gzip reads through.
+#
+# Replaying first pushes every snapshot through load_latest_available,
+# get_new_availability_interval and build_message as fast as it can, for
+# snapshots/sec. Then it simulates polling the archive on its own clock:
+# every day that the pipeline reports as new between two archived snapshots
+# is a cancellation, and its detection latency is the time from the snapshot
+# it showed up in to the first simulated poll that reports it. A cancellation
+# that is gone again before any poll sees it is missed. The recording's poll
+# interval bounds how precisely appearances are timed.
+#
+# Polling policies:
+#   fixed     every month of the campground, every interval
+#   adaptive  poll_scheduler.PollScheduler, starting from interval
+
+ARCHIVE_MONTH_FORMAT = "%Y-%m"
+POLICIES = ("fixed", "adaptive")
+DEFAULT_INTERVALS = "15,60,300"
+
+
+def dumps(value):
+        return json.dumps(value, separators=(",", ":"))
+
+def diff_month(month, campsites, last):
+        # The archive entry for a month response, against the last one's campsites
+        patch = ["{}:{}".format(dumps(k), v) for k, v in campsites.items() if last.get(k) != v]
+        patch.extend("{}:null".format(dumps(k)) for k in last if k not in campsites)
+        if not patch:
+                return "null"
+        rest = {k: v for k, v in month.items() if k != "campsites"}
+        return '{{"patch":{{{}}},"rest":{}}}'.format(",".join(patch), dumps(rest))
+
+def apply_month(entry, last):
+        if entry is None:
+                return last
+        if "full" in entry:
+                return entry["full"]
+        campsites = dict(last["campsites"])
+        for k, v in entry["patch"].items():
+                if v is None:
+                        campsites.pop(k, None)
+                else:
+                        campsites[k] = v
+        return dict(entry["rest"], campsites=campsites)
+
+class ArchiveWriter:
+
+        def __init__(self, path, campground_id, months):
+                new = not os.path.exists(path) or os.path.getsize(path) == 0
+                self.file = gzip.open(path, "at")
+                if new:
+                        header = {"campground": campground_id, "months": [m.strftime(ARCHIVE_MONTH_FORMAT) for m in months]}
+                        self.file.write(json.dumps(header) + "\n")
+                # {campsite id: campsite as JSON} for each month of the last line
+                self.last = None
+
+        def write(self, timestamp, jsons):
+                campsites = [{k: dumps(v) for k, v in j.get("campsites", {}).items()} for j in jsons]
+                if self.last is None or len(self.last) != len(jsons):
+                        months = [dumps({"full": j}) for j in jsons]
+                else:
+                        months = [diff_month(j, c, last) for j, c, last in zip(jsons, campsites, self.last)]
+                self.file.write('{{"t":{},"months":[{}]}}\n'.format(timestamp, ",".join(months)))
+                # A flush per line so a recording that dies keeps what it had
+                self.file.flush()
+                self.last = campsites
+
+        def close(self):
+                self.file.close()
+
+def read_archive(path):
+        # (header, [(timestamp, jsons)]) with the month responses filled back in
+        with gzip.open(path, "rt") as f:
+                header = json.loads(f.readline())
+                snapshots = []
+                last = None
+                for line in f:
+                        record = json.loads(line)
+                        jsons = [apply_month(entry, last[i] if last else None) for i, entry in enumerate(record["months"])]
+                        snapshots.append((record["t"], jsons))
+                        last = jsons
+        header["months"] = [datetime.strptime(m, ARCHIVE_MONTH_FORMAT) for m in header["months"]]
+        return header, snapshots
+
+def record(path, campground_id, months, interval, count=None, session=None):
+        # Polls every 'interval' seconds into the archive at 'path'
+        pairs = [(campground_id, month) for month in months]
+        own_session = session is None
+        if own_session:
+                session = make_session(len(pairs))
+        writer = ArchiveWriter(path, campground_id, months)
+        try:
+                done = 0
+                due = time.time()
+                while count is None or done < count:
+                        due = max(due + interval, time.time())
+                        try:
+                                jsons = fetch_months(pairs, session=session, max_workers=len(pairs))
+                                writer.write(time.time(), jsons)
+                                done += 1
+                        except FetchError as e:
+                                print("Unable to record campground {}: {}".format(campground_id, e))
+                                if e.retry_after:
+                                        due = max(due, time.time() + e.retry_after)
+                        if count is None or done < count:
+                                time.sleep(max(0.0, due - time.time()))
+        finally:
+                writer.close()
+                if own_session:
+                        session.close()
+
+def synthesize(path, campground_id, months, snapshots, interval, sites=60, density=0.2, churn=0.002, seed=0, start=None):
+        # An archive with generated churn, for trying the replay out
+        rng = random.Random(seed)
+        payloads = [make_month_payload(m, sites, density, rng) for m in months]
+        t = time.time() if start is None else start
+        writer = ArchiveWriter(path, campground_id, months)
+        for _ in range(snapshots):
+                writer.write(t, payloads)
+                payloads = [churn_payload(p, churn, rng) for p in payloads]
+                t += interval
+        writer.close()
+
+def replay_throughput(snapshots, min_stay_length, site_filter=in_first_loop):
+        # Snapshots/sec through filtering, diffing and message building
+        start = time.perf_counter()
+        prev = {}
+        for _, jsons in snapshots:
+                latest = load_latest_available(jsons, site_filter)
+                new_availability = get_new_availability_interval(prev, latest, min_stay_length)
+                if new_availability:
+                        build_message(new_availability, min_stay_length)
+                prev = latest
+        return len(snapshots) / max(time.perf_counter() - start, 1e-9)
+
+def find_cancellations(states, min_stay_length):
+        # [(appeared, site, day)] for every day reported as new between
+        # archived snapshots, from [(timestamp, availability)]
+        cancellations = []
+        for (_, prev), (t, latest) in zip(states, states[1:]):
+                for site, days in get_new_availability_interval(prev, latest, min_stay_length).items():
+                        before = set(prev.get(site, ()))
+                        cancellations.extend((t, site, d) for d in days if d not in before)
+        return cancellations
+
+def restrict(availability, months):
+        ranges = [month_day_range(m) for m in months]
+        restricted = {}
+        for site, days in availability.items():
+                days = [d for d in days if any(start <= d < end for start, end in ranges)]
+                if days:
+                        restricted[site] = days
+        return restricted
+
+class Simulation:
+        # Polls the archived states on a virtual clock, through Watch.update
+        # like the poller does
+
+        def __init__(self, header, states, cancellations, policy, interval, min_stay_length=DEFAULT_MIN_STAY_LENGTH,
+                        min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL, release_times=()):
+                self.states = states
+                self.times = [t for t, _ in states]
+                self.cancellations = cancellations
+                self.policy = policy
+                self.watch = Watch(header["campground"], header["months"], interval=interval,
+                        min_stay_length=min_stay_length, release_times=release_times)
+                self.scheduler = PollScheduler([self.watch], min_interval, max_interval)
+                for s in self.scheduler.states:
+                        s.due = self.times[0]
+                # (site, day) -> when it appeared, for cancellations not seen yet
+                self.pending = {}
+                self.next_cancellation = 0
+                self.latencies = []
+                self.missed = 0
+                self.requests = 0
+
+        def next_poll(self, now):
+                if self.policy == "fixed":
+                        return now + self.watch.interval, self.watch.months
+                due, _, months = self.scheduler.next_poll()
+                return due, months
+
+        def poll(self, now, months):
+                while self.next_cancellation < len(self.cancellations) and self.cancellations[self.next_cancellation][0] <= now:
+                        appeared, site, day = self.cancellations[self.next_cancellation]
+                        if (site, day) in self.pending:
+                                # Gone and back again before a poll saw it
+                                self.missed += 1
+                        self.pending[(site, day)] = appeared
+                        self.next_cancellation += 1
+                _, state = self.states[bisect_right(self.times, now) - 1]
+                latest = self.watch.merge(restrict(state, months), months)
+                seen = self.watch.previous or {}
+                new_intervals = self.watch.update(latest, observed=now)
+                self.requests += len(months)
+                for site, intervals in new_intervals.items():
+                        for day in intervals_to_days(intervals):
+                                appeared = self.pending.pop((site, day), None)
+                                if appeared is not None:
+                                        self.latencies.append(now - appeared)
+                # Days that went and came back between two polls never looked
+                # new to the poller, it still had them from before. Those
+                # aren't counted either way.
+                for site, day in list(self.pending):
+                        if day in seen.get(site, ()) and day in latest.get(site, ()):
+                                del self.pending[(site, day)]
+                if self.policy == "adaptive":
+                        counts = count_month_changes(self.watch.changes, months)
+                        self.scheduler.record(self.watch, months, counts, now=now, now_wall=now)
+
+        def run(self):
+                now, months = self.times[0], self.watch.months
+                while now <= self.times[-1]:
+                        self.poll(now, months)
+                        now, months = self.next_poll(now)
+                self.missed += len(self.pending) + len(self.cancellations) - self.next_cancellation
+                return self
+
+        def summary(self):
+                latencies = sorted(self.latencies)
+                return {"policy": self.policy, "interval": self.watch.interval, "requests": self.requests,
+                        "detected": len(latencies), "missed": self.missed,
+                        "median": statistics.median(latencies) if latencies else None,
+                        "p90": latencies[int(0.9 * (len(latencies) - 1))] if latencies else None,
+                        "max": latencies[-1] if latencies else None}
+
+def format_seconds(seconds):
+        return "-" if seconds is None else "{:.1f}s".format(seconds)
+
+def replay(path, intervals, policies=POLICIES, min_stay_length=DEFAULT_MIN_STAY_LENGTH, site_filter=in_first_loop, **kwargs):
+        header, snapshots = read_archive(path)
+        if not snapshots:
+                print("{} has no snapshots".format(path))
+                return []
+        span = snapshots[-1][0] - snapshots[0][0]
+        print("{} snapshots over {:.1f} hours".format(len(snapshots), span / 3600))
+        print("Pipeline: {:.1f} snapshots/sec".format(replay_throughput(snapshots, min_stay_length, site_filter)))
+
+        states = [(t, load_latest_available(jsons, site_filter)) for t, jsons in snapshots]
+        cancellations = find_cancellations(states, min_stay_length)
+        print("{} cancellations".format(len(cancellations)))
+        summaries = []
+        for policy in policies:
+                for interval in intervals:
+                        summary = Simulation(header, states, cancellations, policy, interval, min_stay_length, **kwargs).run().summary()
+                        summaries.append(summary)
+                        print("  {:<9} {:>6.0f}s  {:>6} requests  {:>5} detected  {:>5} missed  median {:>7}  p90 {:>7}  max {:>7}".format(
+                                policy, interval, summary["requests"], summary["detected"], summary["missed"],
+                                format_seconds(summary["median"]), format_seconds(summary["p90"]), format_seconds(summary["max"])))
+        return summaries
+
+if __name__ == "__main__":
+
+        parser = argparse.ArgumentParser()
+        subparsers = parser.add_subparsers(dest="command", required=True)
+        record_parser = subparsers.add_parser("record", help="Poll recreation.gov into an archive")
+        synthesize_parser = subparsers.add_parser("synthesize", help="Generate an archive with random churn")
+        for p in (record_parser, synthesize_parser):
+                p.add_argument("--archive", required=True)
+                p.add_argument("--campground", default=DEFAULT_CAMPGROUND_ID, type=int)
+                p.add_argument("--months", default=",".join(m.strftime(ARCHIVE_MONTH_FORMAT) for m in DEFAULT_MONTHS))
+                p.add_argument("--interval", default=15.0, type=float)
+        record_parser.add_argument("--count", type=int, help="Stop after this many polls")
+        record_parser.add_argument("--base_url", help="Use another server, e.g. http://localhost:8080/ for fake_recreation_server.py")
+        synthesize_parser.add_argument("--snapshots", default=5760, type=int)
+        synthesize_parser.add_argument("--sites", default=60, type=int)
+        synthesize_parser.add_argument("--density", default=0.2, type=float)
+        synthesize_parser.add_argument("--churn", default=0.002, type=float)
+        synthesize_parser.add_argument("--seed", default=0, type=int)
+        replay_parser = subparsers.add_parser("replay", help="Benchmark the pipeline and polling policies on an archive")
+        replay_parser.add_argument("--archive", required=True)
+        replay_parser.add_argument("--intervals", default=DEFAULT_INTERVALS, help="Poll intervals to simulate, in seconds")
+        replay_parser.add_argument("--policies", default=",".join(POLICIES))
+        replay_parser.add_argument("-min", "--min_stay_length", default=DEFAULT_MIN_STAY_LENGTH, type=int)
+        replay_parser.add_argument("--min_interval", default=DEFAULT_MIN_INTERVAL, type=float)
+        replay_parser.add_argument("--max_interval", default=DEFAULT_MAX_INTERVAL, type=float)
+        replay_parser.add_argument("--release_times", action="append", default=[], help="HH:MM, for the adaptive policy")
+        replay_parser.add_argument("--all_sites", action="store_true", help="Not just the first loop")
+        args = parser.parse_args()
+
+        if args.command == "replay":
+                replay(args.archive, [float(i) for i in args.intervals.split(",")], args.policies.split(","),
+                        args.min_stay_length, (lambda site_number: True) if args.all_sites else in_first_loop,
+                        min_interval=args.min_interval, max_interval=args.max_interval, release_times=args.release_times)
+        else:
+                months = [datetime.strptime(m, ARCHIVE_MONTH_FORMAT) for m in args.months.split(",")]
+                if args.command == "record":
+                        if args.base_url is not None:
+                                set_base_url(args.base_url)
+                        record(args.archive, args.campground, months, args.interval, args.count)
+                else:
+                        synthesize(args.archive, args.campground, months, args.snapshots, args.interval,
+                                args.sites, args.density, args.churn, args.seed)
@@ -0,0 +1,319 @@
+import copy
+import hashlib
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from bisect import bisect_right
+
+from availability import check_args
+from poll_scheduler import PollScheduler
+from poller import Poller, build_poller_parser, load_watches
+from sqlite_store import DEFAULT_DEDUP_WINDOW, CampgroundStore, StateDB
+
+# Polls many campgrounds with one worker process per core.
+#
+# The campgrounds are split between workers on a consistent hash ring, so
+# adding or losing a worker only moves the campgrounds it gains or had. Each
+# worker polls and diffs its own shard like poller.py does, but keeps state
+# in one SQLite database (sqlite_store.StateDB) shared by every worker
+# instead of a store per campground. A campground that moves to another
+# worker is picked up from the database with its history.
+#
+# The coordinator starts the workers, tells each which campgrounds are its
+# own and watches them. A worker that exits, or stops heartbeating for
+# --worker_timeout seconds, is replaced and the ring rebalanced. SIGUSR1 adds
+# a worker and SIGUSR2 removes one.
+#
+# --rate is split evenly between the workers, and split again whenever
+# workers are added or removed.
+# --events_socket and --metrics get a per-worker suffix, e.g.
+# metrics.worker-1.prom.
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_DB = "availability.db"
+VIRTUAL_NODES = 64
+DEFAULT_WORKER_TIMEOUT = 300
+# How often an idle worker still heartbeats
+HEARTBEAT_INTERVAL = 10.0
+CHECK_INTERVAL = 1.0
+STOP_TIMEOUT = 10.0
+
+
+def ring_hash(key):
+        return int.from_bytes(hashlib.md5(str(key).encode("utf-8")).digest()[:8], "big")
+
+class HashRing:
+
+        def __init__(self, nodes=(), replicas=VIRTUAL_NODES):
+                self.replicas = replicas
+                # Sorted (hash, node) points, each node at 'replicas' points
+                self.points = []
+                for node in nodes:
+                        self.add(node)
+
+        def add(self, node):
+                self.points.extend((ring_hash("{}#{}".format(node, i)), node) for i in range(self.replicas))
+                self.points.sort()
+
+        def remove(self, node):
+                self.points = [p for p in self.points if p[1] != node]
+
+        def nodes(self):
+                return sorted(set(node for _, node in self.points))
+
+        def owner(self, key):
+                # The first point clockwise from the key's hash
+                if not self.points:
+                        return None
+                i = bisect_right(self.points, (ring_hash(key), "")) % len(self.points)
+                return self.points[i][1]
+
+        def assign(self, keys):
+                # {node: [keys]} for every node, even ones without any keys
+                assignment = {node: [] for node in self.nodes()}
+                for key in keys:
+                        assignment[self.owner(key)].append(key)
+                return assignment
+
+def worker_path(path, worker_id):
+        # metrics.prom -> metrics.worker-1.prom
+        if path is None:
+                return None
+        root, extension = os.path.splitext(path)
+        return "{}.{}{}".format(root, worker_id, extension)
+
+class ShardWorker(Poller):
+
+        def __init__(self, worker_id, config, args, db_path, control):
+                args = copy.copy(args)
+                args.events_socket = worker_path(args.events_socket, worker_id)
+                args.metrics = worker_path(args.metrics, worker_id)
+                args.notify_cache = worker_path(args.notify_cache, worker_id)
+                super().__init__([], args)
+                self.worker_id = worker_id
+                self.config = config
+                self.db = StateDB(db_path)
+                self.control = control
+                self.scheduler = None
+                self.stopped = False
+                self.last_heartbeat = 0.0
+
+        def open_store(self, watch):
+                return CampgroundStore(self.db, watch.campground_id)
+
+        def claim(self, watch, new_intervals):
+                # Another worker may have had this campground until just now
+                return self.db.claim(watch.campground_id, new_intervals, self.args.dedup_window)
+
+        def assign(self, campground_ids):
+                # Keeps the state of campgrounds it already had. New ones start
+                # from the database on their first poll.
+                current = {w.campground_id: w for w in self.watches}
+                configured = {w.campground_id: w for w in load_watches(self.config)}
+                self.watches = [current.get(c) or configured[c] for c in campground_ids if c in configured]
+                old_states = {(id(s.watch), s.month): s for s in self.scheduler.states} if self.scheduler else {}
+                self.scheduler = PollScheduler(self.watches, self.args.min_interval, self.args.max_interval)
+                self.scheduler.states = [old_states.get((id(s.watch), s.month), s) for s in self.scheduler.states]
+                print("{}: polling campgrounds {}".format(self.worker_id, ", ".join(str(c) for c in campground_ids) or "none"))
+
+        def handle(self, message):
+                command = message[0]
+                if command == "assign":
+                        # The worker's share of --rate comes with its campgrounds
+                        self.bucket.set_rate(message[2])
+                        self.assign(message[1])
+                elif command == "stop":
+                        self.stopped = True
+
+        def wait(self, timeout):
+                # Sleeps until 'timeout' or the next message from the coordinator
+                try:
+                        self.handle(self.control.get(timeout=timeout))
+                        return True
+                except queue.Empty:
+                        return False
+
+        def heartbeat(self, force=False):
+                now = time.time()
+                if force or now - self.last_heartbeat >= HEARTBEAT_INTERVAL:
+                        self.db.heartbeat(self.worker_id, len(self.watches), now)
+                        self.last_heartbeat = now
+
+        def run(self):
+                self.heartbeat(force=True)
+                while not self.stopped:
+                        if not self.watches:
+                                self.wait(HEARTBEAT_INTERVAL)
+                                self.heartbeat()
+                                continue
+                        due, watch, months = self.scheduler.next_poll()
+                        delay = due - time.monotonic()
+                        flush_delay = self.flush_delay()
+                        if flush_delay is not None and flush_delay < min(delay, HEARTBEAT_INTERVAL):
+                                # A digest is due first
+                                if not self.wait(flush_delay):
+                                        self.pipeline.flush()
+                                continue
+                        if delay > 0:
+                                if self.wait(min(delay, HEARTBEAT_INTERVAL)) or delay > HEARTBEAT_INTERVAL:
+                                        self.heartbeat()
+                                        continue
+                        self.poll_scheduled(self.scheduler, watch, months)
+                        # Commit everything that's due now in one transaction
+                        if self.scheduler.next_poll()[0] > time.monotonic():
+                                self.db.flush()
+                        self.heartbeat()
+                self.db.flush()
+
+        def close(self):
+                super().close()
+                self.db.flush()
+                self.db.remove_worker(self.worker_id)
+                self.db.close()
+
+def run_worker(worker_id, config, args, db_path, control):
+        # Runs in a worker process
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        check_args(args)
+        worker = ShardWorker(worker_id, config, args, db_path, control)
+        try:
+                worker.run()
+        finally:
+                worker.close()
+
+class Coordinator:
+
+        def __init__(self, config, args, db_path=DEFAULT_DB, workers=DEFAULT_WORKERS, worker_timeout=DEFAULT_WORKER_TIMEOUT):
+                self.config = config
+                self.campgrounds = [w.campground_id for w in load_watches(config)]
+                self.args = copy.copy(args)
+                # Across every worker, each gets its share with its campgrounds
+                self.rate = args.rate
+                self.db_path = db_path
+                self.db = StateDB(db_path)
+                self.workers = workers
+                self.worker_timeout = worker_timeout
+                self.ring = HashRing()
+                self.processes = {}
+                self.controls = {}
+                self.started = {}
+                self.assignment = {}
+                self.rates = {}
+                self.next_id = 1
+                self.resize = 0
+
+        def start_worker(self):
+                worker_id = "worker-{}".format(self.next_id)
+                self.next_id += 1
+                control = multiprocessing.Queue()
+                process = multiprocessing.Process(target=run_worker, args=(worker_id, self.config, self.args, self.db_path, control),
+                        daemon=True)
+                process.start()
+                self.processes[worker_id] = process
+                self.controls[worker_id] = control
+                self.started[worker_id] = time.time()
+                self.ring.add(worker_id)
+                return worker_id
+
+        def stop_worker(self, worker_id):
+                process = self.processes.pop(worker_id)
+                control = self.controls.pop(worker_id)
+                self.started.pop(worker_id)
+                self.ring.remove(worker_id)
+                if process.is_alive():
+                        control.put(("stop",))
+                        process.join(STOP_TIMEOUT)
+                if process.is_alive():
+                        process.terminate()
+                        process.join()
+                self.db.remove_worker(worker_id)
+
+        def rebalance(self):
+                assignment = self.ring.assign(self.campgrounds)
+                owners = {c: w for w, cs in self.assignment.items() for c in cs}
+                moved = sum(1 for w, cs in assignment.items() for c in cs if owners.get(c) not in (None, w))
+                rate = self.rate / max(1, len(assignment))
+                for worker_id, campground_ids in assignment.items():
+                        if campground_ids != self.assignment.get(worker_id) or rate != self.rates.get(worker_id):
+                                self.controls[worker_id].put(("assign", campground_ids, rate))
+                self.assignment = assignment
+                self.rates = {worker_id: rate for worker_id in assignment}
+                print("{} campgrounds over {} workers at {:.2f} requests a second each, {} moved".format(
+                        len(self.campgrounds), len(assignment), rate, moved))
+
+        def failed_workers(self, now=None):
+                now = time.time() if now is None else now
+                heartbeats = self.db.heartbeats()
+                failed = []
+                for worker_id, process in self.processes.items():
+                        if not process.is_alive():
+                                failed.append((worker_id, "exited with {}".format(process.exitcode)))
+                        elif now - heartbeats.get(worker_id, self.started[worker_id]) > self.worker_timeout:
+                                failed.append((worker_id, "stopped heartbeating"))
+                return failed
+
+        def check(self):
+                changed = False
+                for worker_id, reason in self.failed_workers():
+                        print("{} {}, replacing it".format(worker_id, reason))
+                        self.stop_worker(worker_id)
+                        self.start_worker()
+                        changed = True
+                while self.resize > 0:
+                        self.resize -= 1
+                        print("Adding {}".format(self.start_worker()))
+                        changed = True
+                while self.resize < 0:
+                        self.resize += 1
+                        if len(self.processes) > 1:
+                                # The newest one
+                                worker_id = list(self.processes)[-1]
+                                print("Removing {}".format(worker_id))
+                                self.stop_worker(worker_id)
+                                changed = True
+                if changed:
+                        self.rebalance()
+
+        def run(self, duration=None):
+                for _ in range(self.workers):
+                        self.start_worker()
+                self.rebalance()
+                handlers = (signal.signal(signal.SIGUSR1, lambda signum, frame: self.add_workers(1)),
+                        signal.signal(signal.SIGUSR2, lambda signum, frame: self.add_workers(-1)))
+                end = None if duration is None else time.monotonic() + duration
+                try:
+                        while end is None or time.monotonic() < end:
+                                time.sleep(CHECK_INTERVAL)
+                                self.check()
+                finally:
+                        signal.signal(signal.SIGUSR1, handlers[0])
+                        signal.signal(signal.SIGUSR2, handlers[1])
+
+        def add_workers(self, count):
+                # Picked up on the next check
+                self.resize += count
+
+        def close(self):
+                for worker_id in list(self.processes):
+                        self.stop_worker(worker_id)
+                self.db.close()
+
+if __name__ == "__main__":
+
+        parser = build_poller_parser()
+        parser.add_argument("--workers", default=DEFAULT_WORKERS, type=int)
+        parser.add_argument("--db", default=DEFAULT_DB, help="SQLite database shared by the workers")
+        parser.add_argument("--dedup_window", default=DEFAULT_DEDUP_WINDOW, type=float,
+                help="Seconds an interval one worker notified about is kept from the others")
+        parser.add_argument("--worker_timeout", default=DEFAULT_WORKER_TIMEOUT, type=float)
+        parser.add_argument("--duration", type=float, help="Stop after this many seconds")
+        args = parser.parse_args()
+        check_args(args)
+
+        coordinator = Coordinator(args.config, args, args.db, args.workers, args.worker_timeout)
+        try:
+                coordinator.run(args.duration)
+        finally:
+                coordinator.close()
@@ -0,0 +1,318 @@
+import mmap
+import os
+import struct
+import time
+import zlib
+
+from availability_matrix import days_to_row, row_to_days
+
+# Binary store for availability snapshots, replacing a json file rewritten
+# every cycle. A store is a directory holding two files:
+#
+# current.bin  The latest snapshot. Written to a temporary file and renamed
+#              over the old one, so a crash leaves either the old or the new
+#              snapshot, never half of one. Read back through mmap, site
+#              bitmaps are only decoded when asked for and the checksum is
+#              only checked when the store is opened.
+#
+#   header:  magic, version, cycle, timestamp, number of sites, file size,
+#            crc32 of the rest
+#   index:   per site, name length, name, first day, bitmap offset, bitmap size
+#   bitmaps: per site, bit d set if available on first day + d
+#
+# history.log  Append-only log with one record per commit holding the days
+#              added and removed per site. A record torn by a crash is cut
+#              off the next time the store is opened.
+#
+#   record:  payload length, crc32 of payload, payload
+#   payload: cycle, timestamp, number of sites,
+#            per site: name length, name, first day, added size, added bitmap,
+#            removed size, removed bitmap
+
+CURRENT_FILE = "current.bin"
+HISTORY_FILE = "history.log"
+MAGIC = b"BSNP"
+VERSION = 1
+HEADER = struct.Struct("<4sHIdIII")
+INDEX_ENTRY = struct.Struct("<iII")
+RECORD_HEADER = struct.Struct("<II")
+RECORD_START = struct.Struct("<IdI")
+DAYS_HEADER = struct.Struct("<iI")
+NAME_LENGTH = struct.Struct("<B")
+
+
+class SnapshotError(Exception):
+        pass
+
+def encode_days(days):
+        # (first day, bitmap bytes) for a list of days
+        if not days:
+                return 0, b""
+        first_day = min(days)
+        row = days_to_row(d - first_day for d in days)
+        return first_day, row.to_bytes((row.bit_length() + 7) // 8, "little")
+
+def decode_days(first_day, data):
+        return [first_day + d for d in row_to_days(int.from_bytes(data, "little"))]
+
+def encode_name(site):
+        name = site.encode("utf-8")
+        return NAME_LENGTH.pack(len(name)) + name
+
+def decode_name(buf, pos):
+        length = buf[pos]
+        pos += NAME_LENGTH.size
+        return bytes(buf[pos:pos + length]).decode("utf-8"), pos + length
+
+def fsync_dir(path):
+        if hasattr(os, "O_DIRECTORY"):
+                fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                        os.fsync(fd)
+                finally:
+                        os.close(fd)
+
+class Snapshot:
+        # A read-only view of current.bin
+
+        def __init__(self, buf):
+                self.buf = buf
+                if len(buf) < HEADER.size:
+                        raise SnapshotError("Snapshot is truncated")
+                magic, version, self.cycle, self.timestamp, num_sites, size, self.crc = HEADER.unpack_from(buf, 0)
+                if magic != MAGIC or version != VERSION:
+                        raise SnapshotError("Not a snapshot file")
+                if size != len(buf):
+                        raise SnapshotError("Snapshot is {} bytes, expected {}".format(len(buf), size))
+                self.num_sites = num_sites
+                self.index = None
+
+        def verify(self):
+                if zlib.crc32(memoryview(self.buf)[HEADER.size:]) != self.crc:
+                        raise SnapshotError("Snapshot checksum doesn't match")
+
+        def get_index(self):
+                # Site -> (first day, offset, size), read on first use
+                if self.index is None:
+                        self.index = {}
+                        pos = HEADER.size
+                        for _ in range(self.num_sites):
+                                site, pos = decode_name(self.buf, pos)
+                                self.index[site] = INDEX_ENTRY.unpack_from(self.buf, pos)
+                                pos += INDEX_ENTRY.size
+                return self.index
+
+        def sites(self):
+                return list(self.get_index())
+
+        def site_days(self, site):
+                index = self.get_index()
+                if site not in index:
+                        return []
+                first_day, offset, size = index[site]
+                return decode_days(first_day, self.buf[offset:offset + size])
+
+        def to_dict(self):
+                return {site: self.site_days(site) for site in self.get_index()}
+
+def encode_snapshot(availability, cycle, timestamp):
+        index = []
+        bitmaps = []
+        index_size = sum(NAME_LENGTH.size + len(site.encode("utf-8")) + INDEX_ENTRY.size for site in availability)
+        offset = HEADER.size + index_size
+        for site in sorted(availability):
+                first_day, data = encode_days(availability[site])
+                index.append(encode_name(site) + INDEX_ENTRY.pack(first_day, offset, len(data)))
+                bitmaps.append(data)
+                offset += len(data)
+        body = b"".join(index) + b"".join(bitmaps)
+        return HEADER.pack(MAGIC, VERSION, cycle, timestamp, len(availability),
+                HEADER.size + len(body), zlib.crc32(body)) + body
+
+def encode_record(cycle, timestamp, added, removed):
+        sites = sorted(set(added) | set(removed))
+        parts = [RECORD_START.pack(cycle, timestamp, len(sites))]
+        for site in sites:
+                site_added = added.get(site, [])
+                site_removed = removed.get(site, [])
+                first_day = min(site_added + site_removed)
+                parts.append(encode_name(site))
+                for days in (site_added, site_removed):
+                        row = days_to_row(d - first_day for d in days)
+                        data = row.to_bytes((row.bit_length() + 7) // 8, "little")
+                        parts.append(DAYS_HEADER.pack(first_day, len(data)) + data)
+        payload = b"".join(parts)
+        return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+def decode_record(payload):
+        cycle, timestamp, num_sites = RECORD_START.unpack_from(payload, 0)
+        pos = RECORD_START.size
+        changes = {}
+        for _ in range(num_sites):
+                site, pos = decode_name(payload, pos)
+                change = []
+                for _ in range(2):
+                        first_day, size = DAYS_HEADER.unpack_from(payload, pos)
+                        pos += DAYS_HEADER.size
+                        change.append(decode_days(first_day, payload[pos:pos + size]))
+                        pos += size
+                changes[site] = tuple(change)
+        return cycle, timestamp, changes
+
+def diff_days(prev, latest):
+        added = {}
+        removed = {}
+        for site in set(prev) | set(latest):
+                prev_days = set(prev.get(site, []))
+                latest_days = set(latest.get(site, []))
+                if latest_days - prev_days:
+                        added[site] = sorted(latest_days - prev_days)
+                if prev_days - latest_days:
+                        removed[site] = sorted(prev_days - latest_days)
+        return added, removed
+
+def apply_changes(availability, changes):
+        for site, (added, removed) in changes.items():
+                days = set(availability.get(site, [])).difference(removed).union(added)
+                if days:
+                        availability[site] = sorted(days)
+                else:
+                        availability.pop(site, None)
+
+class SnapshotStore:
+
+        def __init__(self, path):
+                self.path = path
+                os.makedirs(path, exist_ok=True)
+                self.current_file = os.path.join(path, CURRENT_FILE)
+                self.history_file = os.path.join(path, HISTORY_FILE)
+                self.snapshot = None
+                self.mapped = None
+                self.recover()
+
+        def recover(self):
+                # Bring the store back to a consistent state after a crash
+                self.repair_history()
+                try:
+                        self.open_current()
+                        if self.snapshot is not None:
+                                self.snapshot.verify()
+                except SnapshotError as e:
+                        # Never fall back to "nothing was available", that
+                        # would report everything as new. Rebuild from the log.
+                        print("Rebuilding snapshot from history: {}".format(e))
+                        self.rewrite(*self.replay())
+                        return
+                # History written after the snapshot means we crashed between
+                # appending the record and replacing current.bin.
+                last_cycle, timestamp = self.last_record()
+                if last_cycle > self.cycle():
+                        print("Rolling snapshot forward to cycle {}".format(last_cycle))
+                        availability, _, _ = self.replay()
+                        self.rewrite(availability, last_cycle, timestamp)
+
+        def repair_history(self):
+                # Cut off a record left half written by a crash
+                if not os.path.exists(self.history_file):
+                        return
+                good = 0
+                with open(self.history_file, "rb") as history:
+                        for end, _ in self.read_records(history):
+                                good = end
+                if good != os.path.getsize(self.history_file):
+                        print("Truncating torn history record in {}".format(self.history_file))
+                        with open(self.history_file, "r+b") as history:
+                                history.truncate(good)
+
+        def read_records(self, history):
+                # Yields (end offset, payload) for every intact record
+                pos = 0
+                while True:
+                        header = history.read(RECORD_HEADER.size)
+                        if len(header) < RECORD_HEADER.size:
+                                return
+                        length, crc = RECORD_HEADER.unpack(header)
+                        payload = history.read(length)
+                        if len(payload) < length or zlib.crc32(payload) != crc:
+                                return
+                        pos += RECORD_HEADER.size + length
+                        yield pos, payload
+
+        def open_current(self):
+                self.close()
+                if os.path.exists(self.current_file) and os.path.getsize(self.current_file) > 0:
+                        with open(self.current_file, "rb") as current:
+                                self.mapped = mmap.mmap(current.fileno(), 0, access=mmap.ACCESS_READ)
+                        self.snapshot = Snapshot(self.mapped)
+
+        def last_record(self):
+                last = (0, 0.0)
+                for cycle, timestamp, _ in self.history():
+                        last = (cycle, timestamp)
+                return last
+
+        def rewrite(self, availability, cycle, timestamp):
+                tmp_file = self.current_file + ".tmp"
+                with open(tmp_file, "wb") as tmp:
+                        tmp.write(encode_snapshot(availability, cycle, timestamp))
+                        tmp.flush()
+                        os.fsync(tmp.fileno())
+                self.close()
+                os.replace(tmp_file, self.current_file)
+                fsync_dir(self.path)
+                self.open_current()
+
+        def cycle(self):
+                return self.snapshot.cycle if self.snapshot else 0
+
+        def is_empty(self):
+                return self.snapshot is None
+
+        def load(self):
+                return self.snapshot.to_dict() if self.snapshot else {}
+
+        def site_days(self, site):
+                return self.snapshot.site_days(site) if self.snapshot else []
+
+        def commit(self, latest, timestamp=None, changes=None):
+                # Log what changed since the last commit, then replace the
+                # snapshot. Callers that already diffed the two snapshots can
+                # pass (added, removed) as 'changes' to skip decoding this one.
+                if timestamp is None:
+                        timestamp = time.time()
+                latest = {k: v for k, v in latest.items() if v}
+                added, removed = changes if changes is not None else diff_days(self.load(), latest)
+                cycle = self.cycle() + 1
+                with open(self.history_file, "ab") as history:
+                        history.write(encode_record(cycle, timestamp, added, removed))
+                        history.flush()
+                        os.fsync(history.fileno())
+                self.rewrite(latest, cycle, timestamp)
+
+        def history(self):
+                # Yields (cycle, timestamp, {site: (added, removed)}) oldest first
+                if not os.path.exists(self.history_file):
+                        return
+                with open(self.history_file, "rb") as history:
+                        for _, payload in self.read_records(history):
+                                yield decode_record(payload)
+
+        def replay(self, until=None):
+                # State after every commit up to timestamp 'until'
+                availability = {}
+                cycle, timestamp = 0, 0.0
+                for record_cycle, record_timestamp, changes in self.history():
+                        if until is not None and record_timestamp > until:
+                                break
+                        apply_changes(availability, changes)
+                        cycle, timestamp = record_cycle, record_timestamp
+                return availability, cycle, timestamp
+
+        def availability_at(self, site, timestamp):
+                return self.replay(until=timestamp)[0].get(site, [])
+
+        def close(self):
+                self.snapshot = None
+                if self.mapped is not None:
+                        self.mapped.close()
+                        self.mapped = None
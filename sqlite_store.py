@@ -0,0 +1,177 @@
+import sqlite3
+import time
+
+from snapshot_store import decode_days, diff_days, encode_days
+
+# Availability state shared by poller processes in one SQLite database, for
+# the sharded poller. The database is in WAL mode, so readers never wait for
+# the writer and each commit is an append to the log.
+#
+#   campgrounds   per campground, the last cycle and when it was committed
+#   availability  per campground and site, the days available now
+#   history       per campground, cycle and site, the days added and removed
+#   notified      intervals already notified about, so two workers polling
+#                 the same campground while it moves between them only
+#                 notify once
+#   workers       each worker's last heartbeat
+#
+# Days are stored as a first day and a bitmap, like snapshot_store.
+# commit() only queues a campground's changes. flush() writes everything
+# queued in one transaction, so a worker pays for one commit per round of
+# polls rather than one per campground. Until then load() and is_empty()
+# answer from what's queued, so the next commit diffs against it.
+
+DEFAULT_BUSY_TIMEOUT = 30.0
+DEFAULT_DEDUP_WINDOW = 600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campgrounds (
+        campground INTEGER PRIMARY KEY, cycle INTEGER NOT NULL, timestamp REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS availability (
+        campground INTEGER NOT NULL, site TEXT NOT NULL, first_day INTEGER NOT NULL, days BLOB NOT NULL,
+        PRIMARY KEY (campground, site));
+CREATE TABLE IF NOT EXISTS history (
+        campground INTEGER NOT NULL, cycle INTEGER NOT NULL, timestamp REAL NOT NULL, site TEXT NOT NULL,
+        added_first INTEGER NOT NULL, added BLOB NOT NULL, removed_first INTEGER NOT NULL, removed BLOB NOT NULL);
+CREATE INDEX IF NOT EXISTS history_site ON history (campground, site, timestamp);
+CREATE TABLE IF NOT EXISTS notified (
+        campground INTEGER NOT NULL, site TEXT NOT NULL, start_day INTEGER NOT NULL, end_day INTEGER NOT NULL,
+        timestamp REAL NOT NULL, PRIMARY KEY (campground, site, start_day, end_day));
+CREATE TABLE IF NOT EXISTS workers (
+        worker TEXT PRIMARY KEY, heartbeat REAL NOT NULL, campgrounds INTEGER NOT NULL);
+"""
+
+
+class StateDB:
+
+        def __init__(self, path, timeout=DEFAULT_BUSY_TIMEOUT):
+                self.path = path
+                # Transactions are begun and committed here, not by sqlite3
+                self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+                self.conn.execute("PRAGMA journal_mode=WAL")
+                # Safe with WAL, a commit can only be lost with the machine
+                self.conn.execute("PRAGMA synchronous=NORMAL")
+                self.conn.executescript(SCHEMA)
+                # (campground, latest, (added, removed), timestamp) waiting for flush()
+                self.pending = []
+                # campground -> the latest availability queued for it
+                self.unflushed = {}
+
+        def write(self):
+                # A write transaction, taking the lock up front so it can't
+                # fail halfway through on another worker's write
+                return Transaction(self.conn)
+
+        def is_empty(self, campground_id):
+                if campground_id in self.unflushed:
+                        return False
+                return self.conn.execute("SELECT 1 FROM campgrounds WHERE campground = ?", (campground_id,)).fetchone() is None
+
+        def load(self, campground_id):
+                if campground_id in self.unflushed:
+                        return dict(self.unflushed[campground_id])
+                rows = self.conn.execute("SELECT site, first_day, days FROM availability WHERE campground = ?", (campground_id,))
+                return {site: decode_days(first_day, days) for site, first_day, days in rows}
+
+        def commit(self, campground_id, latest, timestamp=None, changes=None):
+                timestamp = time.time() if timestamp is None else timestamp
+                latest = {k: v for k, v in latest.items() if v}
+                if changes is None:
+                        changes = diff_days(self.load(campground_id), latest)
+                self.pending.append((campground_id, latest, changes, timestamp))
+                self.unflushed[campground_id] = latest
+
+        def flush(self):
+                if not self.pending:
+                        return
+                with self.write() as conn:
+                        for campground_id, latest, (added, removed), timestamp in self.pending:
+                                row = conn.execute("SELECT cycle FROM campgrounds WHERE campground = ?", (campground_id,)).fetchone()
+                                cycle = (row[0] if row else 0) + 1
+                                conn.execute("INSERT OR REPLACE INTO campgrounds VALUES (?, ?, ?)", (campground_id, cycle, timestamp))
+                                for site in set(added) | set(removed):
+                                        days = latest.get(site)
+                                        if days:
+                                                conn.execute("INSERT OR REPLACE INTO availability VALUES (?, ?, ?, ?)",
+                                                        (campground_id, site) + encode_days(days))
+                                        else:
+                                                conn.execute("DELETE FROM availability WHERE campground = ? AND site = ?", (campground_id, site))
+                                        conn.execute("INSERT INTO history VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                                (campground_id, cycle, timestamp, site) + encode_days(added.get(site, [])) + encode_days(removed.get(site, [])))
+                self.pending = []
+                self.unflushed = {}
+
+        def cycle(self, campground_id):
+                row = self.conn.execute("SELECT cycle FROM campgrounds WHERE campground = ?", (campground_id,)).fetchone()
+                return row[0] if row else 0
+
+        def site_history(self, campground_id, site):
+                # [(timestamp, added, removed)] oldest first
+                rows = self.conn.execute("SELECT timestamp, added_first, added, removed_first, removed FROM history "
+                        "WHERE campground = ? AND site = ? ORDER BY timestamp, cycle", (campground_id, site))
+                return [(t, decode_days(af, a), decode_days(rf, r)) for t, af, a, rf, r in rows]
+
+        def claim(self, campground_id, new_intervals, window=DEFAULT_DEDUP_WINDOW, now=None):
+                # The part of {site: [(start, end)]} no worker has notified
+                # about in the last 'window' seconds, recorded as notified now
+                now = time.time() if now is None else now
+                claimed = {}
+                if not new_intervals:
+                        # Nothing to claim, don't take the write lock
+                        return claimed
+                with self.write() as conn:
+                        for site, intervals in new_intervals.items():
+                                for start, end in intervals:
+                                        row = conn.execute("SELECT timestamp FROM notified WHERE campground = ? AND site = ? "
+                                                "AND start_day = ? AND end_day = ?", (campground_id, site, start, end)).fetchone()
+                                        if row is not None and row[0] > now - window:
+                                                continue
+                                        conn.execute("INSERT OR REPLACE INTO notified VALUES (?, ?, ?, ?, ?)", (campground_id, site, start, end, now))
+                                        claimed.setdefault(site, []).append((start, end))
+                return claimed
+
+        def heartbeat(self, worker, campgrounds, now=None):
+                now = time.time() if now is None else now
+                with self.write() as conn:
+                        conn.execute("INSERT OR REPLACE INTO workers VALUES (?, ?, ?)", (worker, now, campgrounds))
+
+        def heartbeats(self):
+                return {worker: heartbeat for worker, heartbeat in self.conn.execute("SELECT worker, heartbeat FROM workers")}
+
+        def remove_worker(self, worker):
+                with self.write() as conn:
+                        conn.execute("DELETE FROM workers WHERE worker = ?", (worker,))
+
+        def close(self):
+                self.conn.close()
+
+class Transaction:
+
+        def __init__(self, conn):
+                self.conn = conn
+
+        def __enter__(self):
+                self.conn.execute("BEGIN IMMEDIATE")
+                return self.conn
+
+        def __exit__(self, exc_type, exc, tb):
+                self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+class CampgroundStore:
+        # One campground's state in a StateDB, in place of a SnapshotStore
+
+        def __init__(self, db, campground_id):
+                self.db = db
+                self.campground_id = campground_id
+
+        def is_empty(self):
+                return self.db.is_empty(self.campground_id)
+
+        def load(self):
+                return self.db.load(self.campground_id)
+
+        def commit(self, latest, timestamp=None, changes=None):
+                self.db.commit(self.campground_id, latest, timestamp, changes)
+
+        def close(self):
+                pass
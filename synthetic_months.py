@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from availability import WEB_DATE_FORMAT
+
+# Month payloads shaped like recreation.gov's, for the benchmarks, the replay
+# harness and the fake server. Each site gets a random share of 'density'
+# of its days available, and churn_payload() flips a fraction of them to
+# make the next snapshot.
+
+
+def make_month_payload(month, sites, density, rng):
+        days_in_month = ((month.replace(day=28) + timedelta(days=4)).replace(day=1) - month).days
+        dates = [(month + timedelta(days=d)).strftime(WEB_DATE_FORMAT) for d in range(days_in_month)]
+        campsites = {}
+        for i in range(sites):
+                campsite_id = str(10000 + i)
+                campsites[campsite_id] = {
+                        "availabilities": {d: ("Available" if rng.random() < density else "Reserved") for d in dates},
+                        "campsite_id": campsite_id,
+                        "campsite_reserve_type": "Site-Specific",
+                        "loop": "Loop {}".format(i // 25 + 1),
+                        "max_num_people": 6,
+                        "quantities": {},
+                        # A few non numbered sites, like the real data
+                        "site": "{:03d}".format(i + 1) if i % 50 else "G{:02d}".format(i // 50),
+                }
+        return {"campsites": campsites, "count": sites}
+
+def churn_payload(payload, rate, rng):
+        # A copy of 'payload' with each day's status flipped with probability 'rate'
+        campsites = {}
+        for campsite_id, campsite in payload["campsites"].items():
+                campsite = dict(campsite)
+                campsite["availabilities"] = {d: (("Reserved" if v == "Available" else "Available") if rng.random() < rate else v)
+                        for d, v in campsite["availabilities"].items()}
+                campsites[campsite_id] = campsite
+        return {"campsites": campsites, "count": payload["count"]}
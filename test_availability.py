@@ -45,7 +45,7 @@ def test_1AvailableDate():
 	latest = load_latest_available([json1])
 	assert len(latest) == 1
 	assert len(latest[site_num]) == 1
-	assert latest[site_num][0] == "08/02"
+	assert format_day(latest[site_num][0]) == "08/02"
 
 def test_multipleAvailableDates():
 	site_num = "001"
@@ -62,8 +62,8 @@ def test_multipleAvailableDates():
 	latest = load_latest_available([json1])
 	assert len(latest) == 1
 	assert len(latest[site_num]) == 2
-	assert latest[site_num][0] == "08/02"
-	assert latest[site_num][1] == "08/09"
+	assert format_day(latest[site_num][0]) == "08/02"
+	assert format_day(latest[site_num][1]) == "08/09"
 
 def test_getNewAvailability_none_empty():
 	prev = []
@@ -72,59 +72,136 @@ def test_getNewAvailability_none_empty():
 	assert not get_site_new_availability(prev, latest, min_length)
 
 def test_getNewAvailability_none_prevEqualsLatest():
-	prev = ["8/22", "8/26"]
-	latest = ["8/22", "8/26"]
+	prev = days("8/22", "8/26")
+	latest = days("8/22", "8/26")
 	min_length = 1
 	assert not get_site_new_availability(prev, latest, min_length)
 
 def test_getNewAvailability_none_intervalTooShort():
-	prev = ["8/22"]
-	latest = ["8/22", "8/26"]
+	prev = days("8/22")
+	latest = days("8/22", "8/26")
 	min_length = 2
 	assert not get_site_new_availability(prev, latest, min_length)
 
 def test_getNewAvailability_none_intervalTooShortAndPrevEmpty():
 	prev = []
-	latest = ["8/22", "8/26"]
+	latest = days("8/22", "8/26")
 	min_length = 2
 	assert not get_site_new_availability(prev, latest, min_length)
 
 def test_getNewAvailability_minLength1():
-	prev = ["8/22"]
-	latest = ["8/22", "8/26"]
+	prev = days("8/22")
+	latest = days("8/22", "8/26")
 	min_length = 1
 	new_availability = get_site_new_availability(prev, latest, min_length)
 	assert len(new_availability) == 1
-	assert new_availability[0] == "8/26"
+	assert new_availability[0] == short_date_to_day("8/26")
 
 def test_getNewAvailability_none_daysDifferBy1():
-	prev = ["8/22"]
-	latest = ["7/22", "8/23"]
+	prev = days("8/22")
+	latest = days("7/22", "8/23")
 	min_length = 2
 	assert not get_site_new_availability(prev, latest, min_length)
 
 def test_getNewAvailability_minLength1AndPrevEmpty():
 	prev = []
-	latest = ["8/22", "8/26"]
+	latest = days("8/22", "8/26")
 	min_length = 1
 	new_availability = get_site_new_availability(prev, latest, min_length)
 	assert len(new_availability) == 2
-	assert new_availability[0] == "8/22"
-	assert new_availability[1] == "8/26"
+	assert new_availability[0] == short_date_to_day("8/22")
+	assert new_availability[1] == short_date_to_day("8/26")
 
 def test_getNewAvailability_none_adjacentPrevAndLatest():
-	prev = ["7/22","8/01","8/03"]
-	latest = ["7/23", "8/02"]
+	prev = days("7/22","8/01","8/03")
+	latest = days("7/23", "8/02")
 	min_length = 2
 	assert not get_site_new_availability(prev, latest, min_length)
 
 def test_getNewAvailability_inBetween():
-	prev = ["7/22","8/01","8/03"]
-	latest = ["7/23", "8/02","8/01","8/03"]
+	prev = days("7/22","8/01","8/03")
+	latest = days("7/23", "8/02","8/01","8/03")
 	min_length = 2
 	new_availability = get_site_new_availability(prev, latest, min_length)
 	assert len(new_availability) == 3
 
+def test_getSiteNewIntervals():
+	prev = days("8/01", "8/02")
+	latest = days("8/01", "8/02", "8/03", "8/10", "8/12", "8/13")
+	new_intervals = get_site_new_intervals(prev, latest, 2)
+	assert new_intervals == [(short_date_to_day("8/01"), short_date_to_day("8/04")), (short_date_to_day("8/12"), short_date_to_day("8/14"))]
+
+def test_getChangedDays():
+	prev = {"001": days("8/01", "8/02"), "002": days("8/05")}
+	latest = {"001": days("8/02", "8/03")}
+	added, removed = get_changed_days(prev, latest)
+	assert added == {"001": days("8/03")}
+	assert removed == {"001": days("8/01"), "002": days("8/05")}
+
+def test_getNewAvailabilityInterval_newSite():
+	prev = {"001": days("08/01")}
+	latest = {"001": days("08/01"), "002": days("08/01", "08/02")}
+	assert get_new_availability_interval(prev, latest, 2) == {"002": days("08/01", "08/02")}
+
+def test_getNewAvailabilityInterval_extendedRun():
+	prev = {"001": days("07/30", "07/31")}
+	latest = {"001": days("07/30", "07/31", "08/01", "08/05")}
+	assert get_new_availability_interval(prev, latest, 3) == {"001": days("07/30", "07/31", "08/01")}
+
+def test_getNewAvailabilityInterval_acrossYearBoundary():
+	prev = {}
+	latest = {"001": [normalize_date("2026-12-31T00:00:00Z"), normalize_date("2027-01-01T00:00:00Z")]}
+	assert get_new_availability_interval(prev, latest, 2) == latest
+
+def test_getNewAvailability_onlyNewDates():
+	prev = {"001": days("08/01")}
+	latest = {"001": days("08/01", "08/03"), "002": days("08/02")}
+	assert get_new_availability(prev, latest) == {"001": days("08/03"), "002": days("08/02")}
+
+def test_normalizeDate():
+	assert normalize_date("2026-01-01T00:00:00Z") == 0
+	assert normalize_date("2026-08-02T00:00:00Z") == short_date_to_day("08/02")
+	assert normalize_date("2027-01-01T00:00:00Z") == 365
+	assert normalize_date("2028-03-01T00:00:00Z") - normalize_date("2028-02-28T00:00:00Z") == 2
+	assert normalize_date("2025-12-31T00:00:00Z") == -1
+
+def test_formatDay():
+	assert format_day(normalize_date("2027-01-05T00:00:00Z")) == "01/05"
+	assert format_days(days("8/1", "8/2")) == "08/01, 08/02"
+
+def test_fetchMonths_preservesOrder():
+	session = FakeSession()
+	pairs = [(1, datetime(2026,7,1)), (2, datetime(2026,8,1)), (1, datetime(2026,9,1))]
+	jsons = fetch_months(pairs, session=session, max_workers=3)
+	assert [j["url"] for j in jsons] == [get_month_url(c) for c, m in pairs]
+	assert [j["start_date"] for j in jsons] == ["2026-07-01T00:00:00.000Z", "2026-08-01T00:00:00.000Z", "2026-09-01T00:00:00.000Z"]
+
+def test_fetchMonths_empty():
+	assert fetch_months([], session=FakeSession()) == []
+
+
+class FakeResponse:
+	def __init__(self, body):
+		self.body = body
+		self.content = json.dumps(body).encode("utf-8")
+		self.status_code = 200
+		self.headers = {"Content-Type": "application/json"}
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		pass
+
+	def json(self):
+		return self.body
+
+class FakeSession:
+	def get(self, url, params=None, headers=None, stream=False):
+		return FakeResponse({"url": url, "start_date": params["start_date"]})
+
+def days(*short_dates):
+	return [short_date_to_day(d) for d in short_dates]
 
 def make_site(num, av):
 	site = {}
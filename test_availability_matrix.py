@@ -0,0 +1,33 @@
+from availability_matrix import *
+
+def test_roundTrip():
+	site_days = {"001": [0, 1, 5, 365], "003": [200]}
+	matrix = AvailabilityMatrix.from_days(site_days, sites=["001", "002", "003"])
+	assert matrix.to_days() == site_days
+	assert matrix.row("002") == 0
+
+def test_newDays():
+	prev = AvailabilityMatrix.from_days({"001": [1, 2]}, sites=["001", "002"])
+	latest = AvailabilityMatrix.from_days({"001": [1, 2, 3], "002": [7]}, sites=["001", "002"])
+	assert latest.new_days(prev).to_days() == {"001": [3], "002": [7]}
+
+def test_newRuns_wholeRunReported():
+	prev = AvailabilityMatrix.from_days({"001": [10, 11]})
+	latest = AvailabilityMatrix.from_days({"001": [10, 11, 12, 20]})
+	assert latest.new_runs(prev, 3).to_days() == {"001": [10, 11, 12]}
+
+def test_newRuns_none_runTooShort():
+	prev = AvailabilityMatrix.from_days({"001": []})
+	latest = AvailabilityMatrix.from_days({"001": [10, 11, 20]})
+	assert not latest.new_runs(prev, 3).to_days()
+
+def test_newRuns_none_unchanged():
+	site_days = {"001": [10, 11, 12]}
+	assert not AvailabilityMatrix.from_days(site_days).new_runs(AvailabilityMatrix.from_days(site_days), 2).to_days()
+
+def test_newRuns_doesNotCrossSites():
+	# The last day of one site and the first day of the next aren't a run
+	prev = AvailabilityMatrix.from_days({}, sites=["001", "002"])
+	latest = AvailabilityMatrix.from_days({"001": [364, 365], "002": [0, 1]}, sites=["001", "002"])
+	assert not latest.new_runs(prev, 3).to_days()
+	assert latest.new_runs(prev, 2).to_days() == {"001": [364, 365], "002": [0, 1]}
@@ -0,0 +1,48 @@
+import json
+import time
+
+import pytest
+import requests
+
+from booking_orchestrator import *
+from fake_recreation_server import start_server
+
+def test_dealTargets_bestFirst():
+	assert deal_targets([1, 2, 3, 4, 5], 2) == [[1, 3, 5], [2, 4]]
+
+def test_run_stopsAtWanted():
+	server = start_server(port=0, latency=0.01, jitter=0, release_in=3600)
+	try:
+		accounts = [{"email": "a@example.com", "password": "a"}, {"email": "b@example.com", "password": "b"}]
+		targets = [{"site": s, "date": "7/14/2026", "length": 14} for s in [8, 8, 9, 9]]
+		server.desk.release_time = time.time() + 1.5
+		orchestrator = BookingOrchestrator(accounts, targets, wanted=2, rounds=2, base_url=server.base_url)
+		attempts = orchestrator.run(server.desk.release_time)
+		assert sum(a.won for a in attempts) == 2
+		bookings = json.loads(requests.get(server.base_url + "_stats").text)["bookings"]
+		assert len(bookings) == len(attempts)
+		# One worker per account
+		assert len(set(b["session"] for b in bookings)) == 2
+	finally:
+		server.shutdown()
+		server.server_close()
+
+def test_run_oneAccountReservesSeveral():
+	server = start_server(port=0, latency=0, jitter=0, release_in=3600)
+	try:
+		accounts = [{"email": "a@example.com", "password": "a"}]
+		targets = [{"site": s, "date": "7/14/2026", "length": 14} for s in [8, 9, 10]]
+		server.desk.release_time = time.time() + 1.0
+		orchestrator = BookingOrchestrator(accounts, targets, wanted=2, base_url=server.base_url)
+		attempts = orchestrator.run(server.desk.release_time)
+		assert [(a.target["site"], a.won) for a in attempts] == [(8, True), (9, True)]
+	finally:
+		server.shutdown()
+		server.server_close()
+
+def test_workersNeedTheirOwnAccounts():
+	accounts = [{"email": "a@example.com", "password": "a"}]
+	targets = [{"site": s, "date": "7/14/2026", "length": 14} for s in [8, 9]]
+	assert BookingOrchestrator(accounts, targets).workers == 1
+	with pytest.raises(ValueError):
+		BookingOrchestrator(accounts, targets, workers=2)
@@ -0,0 +1,26 @@
+from cart_check import *
+from fake_recreation_server import cart_page
+
+def chunked(body, size):
+	return [body[i:i + size] for i in range(0, len(body), size)]
+
+def test_readCartCount_twoDigits():
+	assert read_cart_count([cart_page(12).encode("utf-8")]) == 12
+
+def test_readCartCount_anyChunking():
+	body = cart_page(3, 2000).encode("utf-8")
+	for size in [1, 2, 7, 64]:
+		assert read_cart_count(chunked(body, size)) == 3
+
+def test_readCartCount_stopsAtCartLink():
+	chunks = iter(chunked(cart_page(1, 2000).encode("utf-8"), 64))
+	assert read_cart_count(chunks) == 1
+	assert len(list(chunks)) > 20
+
+def test_readCartCount_noCartLink():
+	assert read_cart_count([b'<html><body><a id="cartLinkish">Cart: 1</a>Service Unavailable</body></html>']) is None
+
+def test_parseCartCount():
+	assert parse_cart_count(b"Cart: 0") == 0
+	assert parse_cart_count(b"Cart (10) ") == 10
+	assert parse_cart_count(b"Cart") is None
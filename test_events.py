@@ -0,0 +1,106 @@
+import asyncio
+import json
+import os
+import socket
+import threading
+
+from availability import short_date_to_day
+from events import *
+from poller import Watch
+
+def day(datestr):
+	return short_date_to_day(datestr)
+
+def days(first, last):
+	return list(range(day(first), day(last) + 1))
+
+def kinds(events):
+	return [(e.type, e.site, format_day(e.start), format_day(e.end)) for e in events]
+
+def test_getChangeEvents():
+	prev = {"001": days("7/1", "7/5"), "002": days("7/10", "7/12"), "003": days("7/1", "7/3")}
+	latest = {"001": days("7/1", "7/7"), "002": days("7/10", "7/11"), "004": days("7/20", "7/20")}
+	events = get_change_events(232199, prev, latest, observed=1.0)
+	assert kinds(events) == [
+		("extended", "001", "07/06", "07/08"),
+		("shrank", "002", "07/12", "07/13"),
+		("closed", "003", "07/01", "07/04"),
+		("opened", "004", "07/20", "07/21"),
+	]
+	assert (events[0].run_start, events[0].run_end) == (day("7/1"), day("7/8"))
+	assert (events[1].run_start, events[1].run_end) == (day("7/10"), day("7/13"))
+
+def test_fillingAGapExtends():
+	events = get_change_events(1, {"001": [1, 2, 4, 5]}, {"001": [1, 2, 3, 4, 5, 9]}, observed=1.0)
+	assert [(e.type, e.start, e.end, e.run_start, e.run_end) for e in events] == [
+		("extended", 3, 4, 1, 6),
+		("opened", 9, 10, 9, 10),
+	]
+
+def test_watchUpdate_matchesSnapshotDiff():
+	prev = {"001": days("7/1", "7/5"), "002": days("7/10", "7/12")}
+	latest = {"001": days("7/3", "7/9"), "003": days("7/1", "7/2")}
+	watch = Watch(232199, [])
+	watch.update(prev, observed=1.0)
+	watch.update(latest, observed=2.0)
+	assert watch.events == get_change_events(232199, prev, latest, observed=2.0)
+
+def test_toJson():
+	event = ChangeEvent(EXTENDED, 232199, "008", day("7/21"), day("7/23"), day("7/14"), day("7/23"), 5.0)
+	assert json.loads(event.to_json()) == {"type": "extended", "campground": 232199, "site": "008",
+		"start": "2026-07-21", "end": "2026-07-23", "run_start": "2026-07-14", "run_end": "2026-07-23", "observed": 5.0}
+
+def test_bus_fileAndSocket(tmp_path):
+	socket_path = str(tmp_path / "events.sock")
+	bus = build_event_bus(str(tmp_path / "events.ndjson"), socket_path)
+	client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	client.connect(socket_path)
+	while not bus.sinks[1].clients:
+		pass
+	events = get_change_events(1, {}, {"001": [1, 2], "002": [5]}, observed=1.0)
+	bus.publish(events)
+	bus.close()
+
+	with open(str(tmp_path / "events.ndjson")) as f:
+		lines = [json.loads(line) for line in f]
+	assert [(l["type"], l["site"]) for l in lines] == [("opened", "001"), ("opened", "002")]
+	received = b""
+	while received.count(b"\n") < 2:
+		received += client.recv(4096)
+	assert [json.loads(line) for line in received.splitlines()] == lines
+	client.close()
+	assert not os.path.exists(socket_path)
+
+def test_socket_dropsClientThatDoesntRead(tmp_path):
+	socket_path = str(tmp_path / "events.sock")
+	sink = UnixSocketSink(socket_path)
+	stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	stalled.connect(socket_path)
+	while not sink.clients:
+		pass
+	line = json.dumps({"padding": "x" * 1000})
+	done = threading.Event()
+	def publish():
+		# Far more than a socket buffer holds
+		for _ in range(1000):
+			sink.publish([line] * 10)
+		done.set()
+	threading.Thread(target=publish, daemon=True).start()
+	assert done.wait(10)
+	assert not sink.clients
+	sink.close()
+	stalled.close()
+
+def test_bus_asyncIterator():
+	bus = EventBus()
+	events = get_change_events(1, {}, {"001": [1, 2], "002": [5]}, observed=1.0)
+
+	async def consume():
+		subscription = bus.subscribe()
+		loop = asyncio.get_running_loop()
+		# Published from another thread, like the poller does
+		await loop.run_in_executor(None, bus.publish, events)
+		await loop.run_in_executor(None, bus.close)
+		return [e async for e in subscription]
+
+	assert asyncio.run(consume()) == events
@@ -0,0 +1,47 @@
+import time
+
+import requests
+
+import availability
+from fake_recreation_server import *
+
+def test_monthEndpoint():
+	server = start_server(port=0, latency=0, jitter=0, sites=30, release_in=0)
+	availability.set_base_url(server.base_url)
+	try:
+		pairs = [(1, datetime(2026, 7, 1)), (1, datetime(2026, 8, 1))]
+		jsons = availability.fetch_months(pairs)
+		assert len(jsons[0]["campsites"]) == 30
+		streamed = availability.fetch_available(pairs)
+		assert streamed == availability.load_latest_available(jsons)
+	finally:
+		availability.set_base_url("https://www.recreation.gov/")
+		server.shutdown()
+		server.server_close()
+
+def test_injected429HasRetryAfter():
+	server = start_server(port=0, latency=0, jitter=0, rate_429=1.0, retry_after=7)
+	try:
+		response = requests.get(server.base_url + "api/camps/availability/campground/1/month")
+		assert response.status_code == 429
+		assert response.headers["Retry-After"] == "7"
+	finally:
+		server.shutdown()
+		server.server_close()
+
+def test_bookingDesk_firstComeFirstServed():
+	desk = BookingDesk(time.time() + 3600)
+	first = desk.login()
+	second = desk.login()
+	desk.visit(first)
+	desk.visit(second)
+	assert desk.book(first, "1878", "7/14/2026") == 0
+	desk.release_time = time.time()
+	assert desk.book(second, "1878", "7/14/2026") == 1
+	assert desk.book(first, "1878", "7/14/2026") == 0
+	assert desk.book(first, "1875", "7/14/2026") == 1
+
+def test_bookingDesk_mustVisitCampgroundFirst():
+	desk = BookingDesk(time.time())
+	session = desk.login()
+	assert desk.book(session, "1878", "7/14/2026") == 0
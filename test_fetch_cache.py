@@ -0,0 +1,73 @@
+import time
+
+import availability
+from availability import fetch_available, fetch_available_cached, make_session, set_base_url
+from fake_recreation_server import start_server
+from fetch_cache import *
+
+PAIRS = [(1, datetime(2030, 7, 1)), (1, datetime(2030, 8, 1))]
+ALL_SITES = lambda s: True
+
+def test_isPastMonth():
+	assert is_past_month(datetime(2026, 7, 1), today=datetime(2026, 8, 1))
+	assert not is_past_month(datetime(2026, 7, 1), today=datetime(2026, 7, 31, 23))
+	assert is_past_month(datetime(2026, 12, 1), today=datetime(2027, 1, 1))
+
+def test_monthCache_roundTrip(tmp_path):
+	cache = MonthCache(str(tmp_path))
+	month = datetime(2030, 7, 1)
+	cache.put(1, month, '"abc"', None, "hash", [("001", 3)], b'{"campsites": {}}')
+	reopened = MonthCache(str(tmp_path))
+	assert reopened.get(1, month)["pairs"] == [("001", 3)]
+	assert reopened.validators(1, month) == {"If-None-Match": '"abc"'}
+	assert reopened.load_json(1, month) == {"campsites": {}}
+	assert reopened.get(2, month) is None
+
+def fetch_twice(server, tmp_path):
+	set_base_url(server.base_url)
+	try:
+		cache = MonthCache(str(tmp_path))
+		session = make_session(2)
+		first, first_changed = fetch_available_cached(PAIRS, cache, session=session, site_filter=ALL_SITES)
+		second, second_changed = fetch_available_cached(PAIRS, cache, session=session, site_filter=ALL_SITES)
+		assert first == fetch_available(PAIRS, session=session, site_filter=ALL_SITES)
+		session.close()
+		return first, first_changed, second, second_changed
+	finally:
+		set_base_url("https://www.recreation.gov/")
+		server.shutdown()
+		server.server_close()
+
+def test_fetchCached_notModified(tmp_path):
+	server = start_server(port=0, latency=0, jitter=0, churn=0)
+	first, first_changed, second, second_changed = fetch_twice(server, tmp_path)
+	assert first_changed and not second_changed
+	assert first == second
+
+def test_fetchCached_sameBodyWithoutEtags(tmp_path):
+	server = start_server(port=0, latency=0, jitter=0, churn=0, etags=False)
+	first, first_changed, second, second_changed = fetch_twice(server, tmp_path)
+	assert first_changed and not second_changed
+	assert first == second
+
+def test_streamedBody_hashesAndWrites(tmp_path):
+	cache = MonthCache(str(tmp_path))
+	month = datetime(2030, 7, 1)
+	body = cache.stream_body(1, month, [b'{"campsites"', b': {}}'])
+	assert next(body.chunks()) == b'{"campsites"'
+	# The rest is read by finish()
+	assert body.finish() == hashlib.sha256(b'{"campsites": {}}').hexdigest()
+	cache.put(1, month, None, None, "hash", [])
+	assert cache.load_json(1, month) == {"campsites": {}}
+	assert sorted(os.listdir(str(tmp_path))) == ["1_2030-07.body", "1_2030-07.json"]
+
+def test_fetchCached_keepsNoPartFiles(tmp_path):
+	server = start_server(port=0, latency=0, jitter=0, churn=0, etags=False)
+	fetch_twice(server, tmp_path)
+	assert not [f for f in os.listdir(str(tmp_path)) if f.endswith(".part")]
+	cache = MonthCache(str(tmp_path))
+	assert set(cache.load_json(*PAIRS[0])) >= {"campsites"}
+
+def test_fetchCached_skipsPastMonths(tmp_path):
+	cache = MonthCache(str(tmp_path))
+	assert fetch_available_cached([(1, datetime(2020, 7, 1))], cache, session=object()) == ({}, False)
@@ -0,0 +1,53 @@
+import json
+import threading
+import time
+
+import requests
+
+import giza
+from fake_recreation_server import start_server
+from giza import *
+
+def test_parseStagger():
+	assert parse_stagger("0,20,45") == [0.0, 0.02, 0.045]
+
+def test_burst_firstCartAddCancelsTheRest(monkeypatch):
+	server = start_server(port=0, latency=0.01, jitter=0, release_in=0)
+	giza.set_base_url(server.base_url)
+	monkeypatch.setattr(giza, "WARM_LEAD", 0.1)
+	try:
+		bot = GizaBot()
+		bot.set_site(8)
+		bot.set_date("7/14/2026")
+		bot.set_length_of_stay(14)
+		bot.set_burst(parse_stagger("0,200,400"))
+		assert bot.book_site("user@example.com", "password")
+		bookings = json.loads(requests.get(server.base_url + "_stats").text)["bookings"]
+		assert len(bookings) == 1
+		assert bookings[0]["won"]
+	finally:
+		giza.set_base_url("http://www.recreation.gov/")
+		server.shutdown()
+		server.server_close()
+
+def test_fireShot_itemAlreadyInCartIsNoWin():
+	server = start_server(port=0, latency=0, jitter=0, release_in=0)
+	giza.set_base_url(server.base_url)
+	try:
+		bot = GizaBot()
+		with requests.Session() as s:
+			s.post(giza.LOGIN_URL, get_login_payload("user@example.com", "password"))
+			assert get_cart_count(s) == 0
+			s.post(giza.BOOKING_URL, get_booking_payload(8, "7/14/2026", 14))
+			in_cart = get_cart_count(s)
+			assert in_cart == 1
+			# Someone else already has site 8, the cart still shows ours from before
+			reserved = threading.Event()
+			results = [None]
+			bot.fire_shot(s, get_booking_payload(8, "7/14/2026", 14), time.perf_counter(), reserved, results, 0, in_cart)
+			assert results[0][2] == 1
+			assert not reserved.is_set()
+	finally:
+		giza.set_base_url("http://www.recreation.gov/")
+		server.shutdown()
+		server.server_close()
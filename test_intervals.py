@@ -0,0 +1,46 @@
+from intervals import *
+
+def test_daysToIntervals():
+	assert days_to_intervals([5, 1, 2, 3, 7, 8, 2]) == [(1, 4), (5, 6), (7, 9)]
+	assert not days_to_intervals([])
+
+def test_add_mergesNeighbours():
+	index = IntervalIndex([1, 2, 4, 5])
+	index.add(3)
+	assert index.intervals() == [(1, 6)]
+	index.add(0)
+	index.add(8)
+	assert index.intervals() == [(0, 6), (8, 9)]
+
+def test_remove_splitsRun():
+	index = IntervalIndex([1, 2, 3, 4])
+	index.remove(2)
+	assert index.intervals() == [(1, 2), (3, 5)]
+	index.remove(1)
+	index.remove(4)
+	assert index.intervals() == [(3, 4)]
+	assert 3 in index
+	assert 4 not in index
+
+def test_changes_createdAndExtended():
+	index = IntervalIndex([1, 2, 10])
+	index.snapshot()
+	index.apply(added=[3, 20, 21])
+	assert index.changes(1) == [(1, 4), (20, 22)]
+	assert index.changes(3) == [(1, 4)]
+
+def test_changes_none_removedThenReadded():
+	index = IntervalIndex([1, 2, 3])
+	index.snapshot()
+	index.remove(2)
+	index.add(2)
+	assert not index.changes(1)
+
+def test_changes_none_afterSnapshot():
+	index = IntervalIndex()
+	index.update([1, 2, 3])
+	assert index.changes(3) == [(1, 4)]
+	index.snapshot()
+	index.update([1, 2])
+	assert not index.changes(1)
+	assert index.days() == [1, 2]
@@ -0,0 +1,83 @@
+from availability import short_date_to_day
+from itinerary import *
+from notification_pipeline import NotificationPipeline
+from notifiers import DeliveryResult
+
+def days(first, last):
+	return list(range(short_date_to_day(first), short_date_to_day(last) + 1))
+
+START = short_date_to_day("7/14")
+END = short_date_to_day("7/28")
+
+def test_singleSite():
+	its = find_itineraries({"008": days("7/10", "7/30")}, START, END)
+	assert [it.segments for it in its] == [[("008", START, END)]]
+
+def test_moveBetweenSites():
+	availability = {"003": days("7/14", "7/18"), "008": days("7/17", "7/27")}
+	its = find_itineraries(availability, START, END, max_moves=1)
+	assert [it.segments for it in its] == [[("003", START, short_date_to_day("7/19")), ("008", short_date_to_day("7/19"), END)]]
+	assert find_itineraries(availability, START, END, max_moves=0) == []
+
+def test_fewestMovesFirst():
+	availability = {
+		"001": days("7/14", "7/27"),
+		"002": days("7/14", "7/20"),
+		"003": days("7/21", "7/23"),
+		"004": days("7/20", "7/27"),
+	}
+	its = find_itineraries(availability, START, END, max_moves=2)
+	assert [it.moves for it in its] == [0, 1, 1, 2, 2]
+	assert its[0].sites() == ("001",)
+	assert set(it.sites() for it in its[1:3]) == {("002", "001"), ("002", "004")}
+	assert set(it.sites() for it in its[3:]) == {("002", "003", "001"), ("002", "003", "004")}
+	assert [it.moves for it in find_itineraries(availability, START, END, max_moves=1)] == [0, 1, 1]
+	assert len(find_itineraries(availability, START, END, max_moves=2, limit=2)) == 2
+
+def test_gapMeansNoItinerary():
+	availability = {"001": days("7/14", "7/20"), "002": days("7/22", "7/27")}
+	assert find_itineraries(availability, START, END, max_moves=3) == []
+
+def test_getNewItineraries():
+	prev = {"003": days("7/14", "7/18"), "008": days("7/20", "7/27")}
+	latest = {"003": days("7/14", "7/18"), "008": days("7/19", "7/27")}
+	new = get_new_itineraries(prev, latest, START, END)
+	assert [it.sites() for it in new] == [("003", "008")]
+	assert get_new_itineraries(latest, latest, START, END) == []
+	assert "site 003 07/14 to 07/19, then site 008 07/19 to 07/28" in build_itinerary_message(new, START, END)
+
+class FakeNotifier:
+	channel = "sms"
+	recipients = ["+1"]
+	max_length = None
+
+	def format(self, subject, message, booking_url):
+		return message + "\n" + booking_url
+
+class FakeDispatcher:
+	notifiers = [FakeNotifier()]
+
+	def __init__(self):
+		self.sent = []
+
+	def send(self, messages):
+		self.sent.extend(messages)
+		return [DeliveryResult(channel, recipient, True, 0.0, 1) for channel, recipient, _, _, _ in messages]
+
+def test_itineraryNotices_inDigestUntilClosed():
+	prev = {"003": days("7/14", "7/18"), "008": days("7/20", "7/27")}
+	latest = {"003": days("7/14", "7/18"), "008": days("7/19", "7/27")}
+	dispatcher = FakeDispatcher()
+	pipeline = NotificationPipeline(dispatcher, debounce=10)
+	notices = build_itinerary_notices(dispatcher.notifiers, 1, get_new_itineraries(prev, latest, START, END), START, END, "url")
+	assert [(n.site, n.start, n.end) for n in notices] == [("003+008", START, END)]
+	pipeline.add(notices, now=0)
+	pipeline.discard_closed(1, latest)
+	pipeline.flush(now=10)
+	assert "  From 07/14 to 07/28: site 003 07/14 to 07/19, then site 008 07/19 to 07/28" in dispatcher.sent[0][3]
+	# Sent once, and dropped when the move stops working
+	assert pipeline.add(notices, now=20) == 0
+	other = build_itinerary_notices(dispatcher.notifiers, 2, get_new_itineraries(prev, latest, START, END), START, END, "url")
+	pipeline.add(other, now=20)
+	pipeline.discard_closed(2, prev)
+	assert pipeline.next_flush() is None
@@ -0,0 +1,71 @@
+import json
+import socket
+
+import requests
+
+from fake_recreation_server import start_server
+from metrics import *
+
+def test_histogram_bucketsAreCumulative():
+	histogram = Histogram(buckets=(0.1, 1.0))
+	for v in [0.05, 0.1, 0.5, 2.0]:
+		histogram.observe(v)
+	assert list(histogram.cumulative()) == [2, 3, 4]
+	assert histogram.summary()["max"] == 2.0
+
+def test_histogram_windowOnlyKeepsRecent():
+	histogram = Histogram(window=2)
+	for v in [10.0, 1.0, 1.0]:
+		histogram.observe(v)
+	assert histogram.count == 3
+	assert histogram.summary()["p95"] == 1.0
+
+def test_toPrometheus():
+	metrics = Metrics(buckets=(0.5,))
+	metrics.observe("phase_seconds", 0.25, phase="diff")
+	text = metrics.to_prometheus()
+	assert 'phase_seconds_bucket{phase="diff",le="0.5"} 1' in text
+	assert 'phase_seconds_bucket{phase="diff",le="+Inf"} 1' in text
+	assert 'phase_seconds_count{phase="diff"} 1' in text
+
+def test_export_jsonlAppends(tmp_path):
+	metrics = Metrics()
+	metrics.observe("a_seconds", 1.0, channel="sms")
+	path = str(tmp_path / "metrics.jsonl")
+	metrics.export(path)
+	metrics.export(path)
+	lines = [json.loads(l) for l in open(path)]
+	assert len(lines) == 2
+	assert lines[0]["labels"] == {"channel": "sms"}
+
+def test_timedAdapter_recordsPhases():
+	server = start_server(port=0, latency=0, jitter=0)
+	try:
+		METRICS.clear()
+		with requests.Session() as s:
+			s.mount("http://", TimedHTTPAdapter())
+			s.get(server.base_url)
+			s.get(server.base_url)
+		assert METRICS.get("http_phase_seconds", phase="connect", host="127.0.0.1").count == 1
+		assert METRICS.get("http_phase_seconds", phase="ttfb", host="127.0.0.1").count == 2
+	finally:
+		server.shutdown()
+		server.server_close()
+
+def test_timedAdapter_triesEveryAddress(monkeypatch):
+	server = start_server(port=0, latency=0, jitter=0)
+	port = int(server.base_url.rsplit(":", 1)[1].strip("/"))
+	getaddrinfo = socket.getaddrinfo
+	def resolve(host, *args, **kwargs):
+		if host != "campgrounds.test":
+			return getaddrinfo(host, *args, **kwargs)
+		# The server only listens on 127.0.0.1, like an IPv6 address without a route
+		return getaddrinfo("127.0.0.2", port, 0, socket.SOCK_STREAM)[:1] + getaddrinfo("127.0.0.1", port, 0, socket.SOCK_STREAM)
+	try:
+		monkeypatch.setattr(socket, "getaddrinfo", resolve)
+		with requests.Session() as s:
+			s.mount("http://", TimedHTTPAdapter())
+			assert s.get("http://campgrounds.test:{}/".format(port)).status_code == 200
+	finally:
+		server.shutdown()
+		server.server_close()
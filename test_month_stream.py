@@ -0,0 +1,41 @@
+import json
+
+from availability import load_latest_available, normalize_date, in_first_loop
+from month_stream import *
+
+def make_month():
+	return {
+		"campsites" : {
+			"1": {"availabilities": {"2026-08-01T00:00:00Z": "Available", "2026-08-02T00:00:00Z": "Reserved"},
+				"loop": "Loop {A}", "quantities": {"x": 1}, "site": "001", "notes": 'say "hi" {'},
+			"2": {"availabilities": {"2026-08-03T00:00:00Z": "Available", "2026-08-04T00:00:00Z": "Available"},
+				"site": "002"},
+			"3": {"availabilities": {"2026-08-01T00:00:00Z": "Available"}, "site": "025"},
+			"4": {"availabilities": {"2026-08-01T00:00:00Z": "Available"}, "site": "G01"},
+			"5": {"site": "003", "availabilities": {}},
+		},
+		"count": 5
+	}
+
+def test_iterAvailable_matchesLoadLatestAvailable():
+	month = make_month()
+	body = json.dumps(month).encode("utf-8")
+	expected = load_latest_available([month])
+	for chunk_size in [1, 2, 7, 64, len(body)]:
+		chunks = [body[i:i+chunk_size] for i in range(0, len(body), chunk_size)]
+		assert collect_available(iter_available(chunks, in_first_loop, normalize_date)) == expected
+
+def test_iterAvailable_skipsFilteredSites():
+	body = json.dumps(make_month()).encode("utf-8")
+	pairs = list(iter_available([body], lambda site: site == "002"))
+	assert pairs == [("002", "2026-08-03T00:00:00Z"), ("002", "2026-08-04T00:00:00Z")]
+
+def test_scanner_bufferOnlyHoldsCurrentCampsite():
+	scanner = CampsiteScanner()
+	assert scanner.feed('{"campsites": {"1": {"site": "001"}, "2": {"si') == ['{"site": "001"}']
+	assert scanner.buffer == '{"si'
+	assert scanner.feed('te": "002"}}}') == ['{"site": "002"}']
+	assert not scanner.buffer
+
+def test_iterAvailable_emptyCampsites():
+	assert not list(iter_available([b'{"campsites" : {}}'], in_first_loop))
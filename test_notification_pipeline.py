@@ -0,0 +1,112 @@
+from availability import build_notices
+from notification_pipeline import *
+from notifiers import DeliveryResult
+
+class FakeNotifier:
+	channel = "sms"
+
+	def __init__(self, recipients, max_length=None):
+		self.recipients = recipients
+		self.max_length = max_length
+
+	def format(self, subject, message, booking_url):
+		return message + "\n" + booking_url
+
+class FakeDispatcher:
+
+	def __init__(self, notifiers, failing=()):
+		self.notifiers = notifiers
+		self.failing = set(failing)
+		self.sent = []
+
+	def send(self, messages):
+		self.sent.extend(messages)
+		return [DeliveryResult(channel, recipient, recipient not in self.failing, 0.0, 1)
+			for channel, recipient, _, _, _ in messages]
+
+def make_pipeline(max_length=None, failing=(), **kwargs):
+	dispatcher = FakeDispatcher([FakeNotifier(["+1", "+2"], max_length)], failing)
+	return dispatcher, NotificationPipeline(dispatcher, **kwargs)
+
+def test_digestPerRecipient():
+	dispatcher, pipeline = make_pipeline()
+	pipeline.add(build_notices(dispatcher.notifiers, 232199, {"008": [(10, 12)], "003": [(4, 5), (7, 8)]}, "url"))
+	pipeline.flush()
+	assert [(channel, recipient, subject) for channel, recipient, subject, _, _ in dispatcher.sent] == [
+		("sms", "+1", "New availability at campground 232199"),
+		("sms", "+2", "New availability at campground 232199"),
+	]
+	assert dispatcher.sent[0][3] == "\n".join(["Campground 232199. New availability:",
+		"  Site 003 on 01/05", "  Site 003 on 01/08", "  Site 008 on 01/11, 01/12"])
+
+def test_debounce_coalescesGrowingRun():
+	dispatcher, pipeline = make_pipeline(debounce=10, max_delay=60)
+	notifiers = dispatcher.notifiers
+	pipeline.add(build_notices(notifiers, 1, {"003": [(4, 6)]}, "url"), now=0)
+	pipeline.add(build_notices(notifiers, 1, {"003": [(4, 8)]}, "url"), now=5)
+	assert pipeline.next_flush() == 15
+	pipeline.flush(now=14)
+	assert not dispatcher.sent
+	pipeline.flush(now=15)
+	assert len(dispatcher.sent) == 2
+	assert "01/05, 01/06, 01/07, 01/08" in dispatcher.sent[0][3]
+	assert "01/05, 01/06\n" not in dispatcher.sent[0][3] + "\n"
+
+def test_debounce_maxDelay():
+	dispatcher, pipeline = make_pipeline(debounce=10, max_delay=25)
+	for t in range(0, 30, 5):
+		pipeline.add(build_notices(dispatcher.notifiers, 1, {"{:03d}".format(t): [(4, 6)]}, "url"), now=t)
+	assert pipeline.next_flush() == 25
+
+def test_discardClosed():
+	dispatcher, pipeline = make_pipeline(debounce=10)
+	pipeline.add(build_notices(dispatcher.notifiers, 1, {"003": [(4, 6)], "005": [(4, 6)]}, "url"), now=0)
+	pipeline.discard_closed(1, {"005": [5]})
+	pipeline.discard_closed(2, {})
+	pipeline.flush(force=True)
+	assert all("Site 003" not in body and "Site 005" in body for _, _, _, body, _ in dispatcher.sent)
+
+def test_cache_suppressesRepeatsAcrossRuns(tmp_path):
+	path = str(tmp_path / "sent.json")
+	for expected in (2, 0):
+		dispatcher, pipeline = make_pipeline(cache=NotificationCache(path, ttl=60))
+		notices = build_notices(dispatcher.notifiers, 1, {"003": [(4, 6)]}, "url")
+		assert pipeline.add(notices) == expected
+		pipeline.close()
+		assert len(dispatcher.sent) == expected
+	cache = NotificationCache(path, ttl=60)
+	assert not cache.seen(notices[0].key(), now=time.time() + 61)
+
+def test_splitDigest_withinLimit():
+	dispatcher, pipeline = make_pipeline(max_length=100)
+	sites = {"{:03d}".format(s): [(1, 3)] for s in range(1, 11)}
+	pipeline.add(build_notices(dispatcher.notifiers[:1], 1, sites, "http://example.com"))
+	pipeline.flush()
+	mine = [m for m in dispatcher.sent if m[1] == "+1"]
+	assert len(mine) > 1
+	assert mine[0][2] == "New availability at campground 1 (1/{})".format(len(mine))
+	assert all(len(dispatcher.notifiers[0].format(s, body, url)) <= 100 for _, _, s, body, url in mine)
+	assert sum(body.count("  Site") for _, _, _, body, _ in mine) == 10
+
+def test_splitDigest_cutsLongLines():
+	assert split_digest("head", ["a" * 50], limit=20) == ["head\n" + "a" * 12 + "..."]
+	assert split_digest("head", ["a", "b"]) == ["head\na\nb"]
+
+def test_failedDelivery_retriedNotCached(tmp_path):
+	path = str(tmp_path / "sent.json")
+	dispatcher, pipeline = make_pipeline(failing=["+2"], cache=NotificationCache(path, ttl=60), retry_delay=30)
+	notices = build_notices(dispatcher.notifiers, 1, {"003": [(4, 6)]}, "url")
+	pipeline.add(notices, now=0)
+	pipeline.flush(now=0)
+	assert [m[1] for m in dispatcher.sent] == ["+1", "+2"]
+	# Only the delivered one is kept from being sent again
+	cache = NotificationCache(path, ttl=60)
+	assert cache.seen(notices[0].key()) and not cache.seen(notices[1].key())
+	assert pipeline.next_flush() == 30
+	pipeline.flush(now=29)
+	assert len(dispatcher.sent) == 2
+	dispatcher.failing = set()
+	pipeline.flush(now=30)
+	assert [m[1] for m in dispatcher.sent] == ["+1", "+2", "+2"]
+	assert pipeline.next_flush() is None
+	assert NotificationCache(path, ttl=60).seen(notices[1].key())
@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+import smtplib
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from notifiers import *
+from poller import Poller, build_poller_parser
+
+class FakeError(Exception):
+	def __init__(self, status):
+		self.status = status
+
+class FakeNotifier:
+	channel = "fake"
+
+	def __init__(self, recipients, failures=None):
+		self.recipients = recipients
+		self.failures = failures or {}
+		self.sent = []
+		self.lock = threading.Lock()
+
+	def format(self, subject, message, booking_url):
+		return message + " " + booking_url
+
+	def send(self, recipient, subject, body):
+		with self.lock:
+			errors = self.failures.get(recipient, [])
+			if errors:
+				raise errors.pop(0)
+			self.sent.append((recipient, subject, body))
+
+	def close(self):
+		pass
+
+def test_dispatch_allRecipients():
+	notifier = FakeNotifier(["a", "b", "c"])
+	dispatcher = NotificationDispatcher([notifier], backoff=0)
+	results = dispatcher.dispatch("subject", "message", "url")
+	dispatcher.close()
+	assert all(r.ok for r in results)
+	assert sorted(notifier.sent) == [(r, "subject", "message url") for r in ["a", "b", "c"]]
+
+def test_dispatch_retriesTransientErrors():
+	notifier = FakeNotifier(["a"], failures={"a": [FakeError(503), FakeError(429)]})
+	dispatcher = NotificationDispatcher([notifier], retries=3, backoff=0)
+	results = dispatcher.dispatch("subject", "message", "url")
+	dispatcher.close()
+	assert results[0].ok
+	assert results[0].attempts == 3
+
+def test_dispatch_noRetryOnPermanentError():
+	notifier = FakeNotifier(["a", "b"], failures={"a": [FakeError(400)]})
+	dispatcher = NotificationDispatcher([notifier], retries=3, backoff=0)
+	results = dispatcher.dispatch("subject", "message", "url")
+	dispatcher.close()
+	assert not results[0].ok
+	assert results[0].attempts == 1
+	assert results[1].ok
+
+def test_dispatch_givesUpAfterRetries():
+	notifier = FakeNotifier(["a"], failures={"a": [ConnectionError()] * 5})
+	dispatcher = NotificationDispatcher([notifier], retries=2, backoff=0)
+	results = dispatcher.dispatch("subject", "message", "url")
+	dispatcher.close()
+	assert not results[0].ok
+	assert results[0].attempts == 3
+
+def test_send_personalizedMessages():
+	notifier = FakeNotifier([])
+	dispatcher = NotificationDispatcher([notifier], backoff=0)
+	results = dispatcher.send([("fake", "a", "s", "for a", "url"), ("sms", "b", "s", "for b", "url")])
+	dispatcher.close()
+	assert len(results) == 1
+	assert notifier.sent == [("a", "s", "for a url")]
+
+def test_registry_buildsOnlyEnabledChannels(tmp_path):
+	parser = argparse.ArgumentParser()
+	add_notifier_args(parser)
+	path = str(tmp_path / "notifications.jsonl")
+	args = parser.parse_args(["--enable_file", "--notify_file", path, "--phone_to", "+15555550100"])
+	check_notifier_args(args)
+	notifiers = build_notifiers(args)
+	assert [n.channel for n in notifiers] == ["file"]
+	dispatcher = NotificationDispatcher(notifiers, backoff=0)
+	dispatcher.dispatch("subject", "message", "url")
+	dispatcher.close()
+	with open(path) as f:
+		lines = [json.loads(line) for line in f]
+	assert [(l["subject"], l["message"]) for l in lines] == [("subject", "message\nurl")]
+
+def test_registry_missingOptions():
+	parser = argparse.ArgumentParser()
+	add_notifier_args(parser)
+	with pytest.raises(ValueError, match="--twilio_sid"):
+		check_notifier_args(parser.parse_args(["--enable_sms", "--phone_to", "+15555550100"]))
+
+def test_poller_notifiersHaveTheirOwnSession():
+	args = build_poller_parser().parse_args(["--config", "watches.json", "--enable_pushover",
+		"--pushover_user_key", "user", "--pushover_api_token", "token", "--enable_webhook", "--webhook_url", "http://example.com/"])
+	poller = Poller([], args)
+	try:
+		for notifier in poller.dispatcher.notifiers:
+			assert notifier.session is not poller.session
+			assert notifier.own_session
+	finally:
+		poller.close()
+
+def test_twilioNotImportedUntilEnabled():
+	result = subprocess.run([sys.executable, "-c", "import poller, sys; print('twilio' in sys.modules)"],
+		cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True)
+	assert result.stdout.strip() == "False"
+
+class FakeSMTP:
+	def __init__(self, error=None):
+		self.error = error
+		self.quit_called = False
+
+	def sendmail(self, sender, recipient, message):
+		if self.error is not None:
+			raise self.error
+
+	def quit(self):
+		self.quit_called = True
+
+def test_email_keepsConnectionOnRefusal(monkeypatch):
+	notifier = EmailNotifier("from@example.com", "password", ["a@example.com"])
+	refused = FakeSMTP(smtplib.SMTPRecipientsRefused({"a@example.com": (550, b"No such user")}))
+	monkeypatch.setattr(notifier, "connect", lambda: refused)
+	with pytest.raises(smtplib.SMTPRecipientsRefused):
+		notifier.send("a@example.com", "subject", "body")
+	assert notifier.idle.get_nowait() is refused
+
+	dropped = FakeSMTP(smtplib.SMTPServerDisconnected())
+	monkeypatch.setattr(notifier, "connect", lambda: dropped)
+	with pytest.raises(smtplib.SMTPServerDisconnected):
+		notifier.send("a@example.com", "subject", "body")
+	assert dropped.quit_called and notifier.idle.empty()
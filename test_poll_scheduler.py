@@ -0,0 +1,114 @@
+import time
+
+import pytest
+
+import availability
+from availability import FetchError, fetch_months, make_session, set_base_url
+from fake_recreation_server import start_server
+from poll_scheduler import *
+from poller import Poller, Watch, build_poller_parser
+from rate_limit import *
+
+class FakeWatch:
+	def __init__(self, months, interval=60):
+		self.months = months
+		self.interval = interval
+		self.release_times = []
+		self.release_window = 600
+
+def test_tokenBucket_limitsRate():
+	bucket = TokenBucket(rate=50, burst=1)
+	start = time.monotonic()
+	for _ in range(6):
+		bucket.acquire()
+	assert time.monotonic() - start >= 0.09
+
+def test_tokenBucket_backOff():
+	bucket = TokenBucket(rate=1000, burst=10)
+	assert bucket.back_off(0.05) == 0.05
+	start = time.monotonic()
+	bucket.acquire()
+	assert time.monotonic() - start >= 0.04
+	assert bucket.back_off() == DEFAULT_BACKOFF * 2
+
+def test_nextInterval():
+	assert next_interval(60, 2.0, 0, 15, 900) == 20
+	assert next_interval(60, 0.0, 2, 15, 900) == 135
+	assert next_interval(60, 0.0, 20, 15, 900) == 900
+
+def test_countMonthChanges():
+	july, aug = datetime(2026, 7, 1), datetime(2026, 8, 1)
+	day = month_day_range(aug)[0]
+	changes = ({"001": [day, day + 1]}, {"002": [day - 1]})
+	assert count_month_changes(changes, [july, aug]) == {july: 1, aug: 2}
+
+def test_releaseWindow():
+	now = datetime(2026, 7, 1, 6, 30)
+	start, end = release_window(["07:00"], 600, now)
+	assert datetime.fromtimestamp(start) == datetime(2026, 7, 1, 6, 59)
+	assert end - start == 660
+	start, end = release_window(["07:00"], 600, datetime(2026, 7, 1, 8, 0))
+	assert datetime.fromtimestamp(start) == datetime(2026, 7, 2, 6, 59)
+
+def test_scheduler_hotMonthsPolledSooner():
+	july, aug = datetime(2026, 7, 1), datetime(2026, 8, 1)
+	watch = FakeWatch([july, aug])
+	scheduler = PollScheduler([watch], min_interval=10, max_interval=600)
+	due, polled, months = scheduler.next_poll()
+	assert polled is watch and months == [july, aug]
+	for _ in range(3):
+		scheduler.record(watch, months, {july: 5, aug: 0}, now=0, now_wall=datetime(2026, 6, 1).timestamp())
+	due, polled, months = scheduler.next_poll()
+	assert months == [july]
+	assert due < 20
+
+def test_watchMerge_keepsOtherMonths():
+	july, aug = datetime(2026, 7, 1), datetime(2026, 8, 1)
+	watch = Watch(1, [july, aug])
+	july_day, aug_day = month_day_range(july)[0], month_day_range(aug)[0]
+	watch.previous = {"001": [july_day, aug_day], "002": [aug_day]}
+	assert watch.merge({"003": [aug_day + 1]}, [aug]) == {"001": [july_day], "003": [aug_day + 1]}
+
+def test_fetch_429RaisesWithRetryAfter():
+	server = start_server(port=0, latency=0, jitter=0, rate_429=1.0, retry_after=0)
+	set_base_url(server.base_url)
+	try:
+		bucket = TokenBucket(rate=100, burst=1)
+		with pytest.raises(FetchError) as e:
+			fetch_months([(1, datetime(2030, 7, 1))], session=make_session(1, bucket=bucket))
+		assert e.value.status == 429
+		assert e.value.retry_after == 0
+		assert bucket.failures == 1
+	finally:
+		set_base_url("https://www.recreation.gov/")
+		server.shutdown()
+		server.server_close()
+
+class FailingEvents:
+	def publish(self, events):
+		raise OSError("No space left on device")
+
+	def close(self):
+		pass
+
+def test_poll_commitsStoreBeforeSideEffects(tmp_path):
+	server = start_server(port=0, latency=0, jitter=0, churn=0.5, churn_interval=0)
+	set_base_url(server.base_url)
+	args = build_poller_parser().parse_args(["--config", "watches.json"])
+	watch = Watch(1, [datetime(2030, 7, 1)], store=str(tmp_path / "store"), max_site=100)
+	poller = Poller([watch], args)
+	poller.events.close()
+	poller.events = FailingEvents()
+	try:
+		for _ in range(3):
+			with pytest.raises(OSError):
+				poller.poll(watch)
+			# Every cycle the watch moved on from is in the history
+			assert watch.store.load() == watch.previous
+			assert watch.store.replay()[0] == watch.previous
+		assert watch.store.cycle() == 3
+	finally:
+		poller.close()
+		set_base_url("https://www.recreation.gov/")
+		server.shutdown()
+		server.server_close()
@@ -0,0 +1,66 @@
+import time
+from email.utils import formatdate
+
+import pytest
+
+from release_timer import *
+
+class FakeResponse:
+	def __init__(self, headers):
+		self.headers = headers
+
+class SkewedSession:
+	# A server whose clock is 'offset' seconds ahead of ours
+	def __init__(self, offset, delay=0.005):
+		self.offset = offset
+		self.delay = delay
+
+	def head(self, url):
+		time.sleep(self.delay)
+		date = formatdate(time.time() + self.offset, usegmt=True)
+		time.sleep(self.delay)
+		return FakeResponse({"Date": date})
+
+def test_synced_findsOffset():
+	timer = ReleaseTimer.synced(SkewedSession(2.3), "http://example.com/", probes=5)
+	assert abs(timer.offset - 2.3) <= timer.uncertainty + 0.02
+	assert timer.uncertainty < 0.2
+	assert 0.002 < timer.one_way < 0.05
+
+def test_sendTime():
+	timer = ReleaseTimer(offset=1.5, one_way=0.1, lead=0.05)
+	assert abs(timer.send_time(1000.0) - 998.35) < 1e-9
+
+class FakeClock:
+	# Every sleep runs 'oversleep' long and reading the clock takes a microsecond
+	def __init__(self, oversleep=0.0001):
+		self.now = 100.0
+		self.oversleep = oversleep
+		self.sleeps = []
+
+	def perf_counter(self):
+		self.now += 1e-6
+		return self.now
+
+	def sleep(self, seconds):
+		self.sleeps.append(seconds)
+		self.now += seconds + self.oversleep
+
+def test_waitUntilPerf_onTime(monkeypatch):
+	clock = FakeClock()
+	monkeypatch.setattr("release_timer.time", clock)
+	late = wait_until_perf(clock.now + 0.05)
+	assert 0 <= late < BUSY_WINDOW
+	# Slept most of the way, then shorter and shorter sleeps
+	assert clock.sleeps[0] > 0.02
+	assert clock.sleeps == sorted(clock.sleeps, reverse=True)
+
+def test_waitUntilPerf_realClock():
+	target = time.perf_counter() + 0.05
+	late = wait_until_perf(target)
+	assert 0 <= late < 0.05
+
+def test_wait_negative():
+	timer = ReleaseTimer()
+	with pytest.raises(ValueError, match="negative"):
+		timer.wait(time.time() - 1)
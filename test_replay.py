@@ -0,0 +1,77 @@
+import gzip
+from datetime import datetime
+
+from replay import *
+
+JULY = datetime(2026, 7, 1)
+
+def month(available):
+	# {site: [days of July]} -> a month response
+	campsites = {}
+	for i, site in enumerate(["001", "002", "003"]):
+		dates = {"2026-07-{:02d}T00:00:00Z".format(d): "Available" if d in available.get(site, []) else "Reserved" for d in range(1, 8)}
+		campsites[str(100 + i)] = {"site": site, "availabilities": dates}
+	return {"campsites": campsites, "count": 3}
+
+def write_archive(path, timestamps_and_months):
+	writer = ArchiveWriter(path, 232199, [JULY])
+	for t, available in timestamps_and_months:
+		writer.write(t, [month(available)])
+	writer.close()
+
+def test_archive_roundTrip(tmp_path):
+	path = str(tmp_path / "archive.gz")
+	polls = [(0, {"001": [1, 2]}), (15, {"001": [1, 2]}), (30, {"001": [1, 2], "002": [5]})]
+	write_archive(path, polls[:2])
+	# Recording again appends
+	write_archive(path, polls[2:])
+	header, snapshots = read_archive(path)
+	assert header == {"campground": 232199, "months": [JULY]}
+	assert snapshots == [(t, [month(available)]) for t, available in polls]
+	with gzip.open(path, "rt") as f:
+		lines = f.read().splitlines()
+	assert '"months":[null]' in lines[2]
+	# The third poll is in a new member and starts over from the full response
+	assert '"full"' in lines[3]
+
+def test_archive_onlyChangedCampsites(tmp_path):
+	path = str(tmp_path / "archive.gz")
+	write_archive(path, [(0, {"001": [1, 2]}), (15, {"001": [1, 2], "002": [5]})])
+	with gzip.open(path, "rt") as f:
+		last = json.loads(f.read().splitlines()[-1])
+	assert list(last["months"][0]["patch"]) == ["101"]
+	assert read_archive(path)[1][1][1] == [month({"001": [1, 2], "002": [5]})]
+
+def test_simulation_latencies(tmp_path):
+	path = str(tmp_path / "archive.gz")
+	write_archive(path, [
+		(0, {}),
+		(10, {"001": [3]}),
+		(20, {"001": [3]}),
+		(30, {"001": [3], "002": [5]}),
+		# Gone before a 60s poll sees it
+		(40, {"001": [3]}),
+		(50, {"001": [3]}),
+		(60, {"001": [3]}),
+	])
+	header, snapshots = read_archive(path)
+	states = [(t, load_latest_available(jsons)) for t, jsons in snapshots]
+	cancellations = find_cancellations(states, 1)
+	day = (JULY - REF_DATE).days
+	assert cancellations == [(10, "001", day + 2), (30, "002", day + 4)]
+
+	summary = Simulation(header, states, cancellations, "fixed", 10).run().summary()
+	assert (summary["detected"], summary["missed"], summary["max"]) == (2, 0, 0)
+	summary = Simulation(header, states, cancellations, "fixed", 25).run().summary()
+	assert (summary["detected"], summary["missed"], summary["median"]) == (1, 1, 15)
+	summary = Simulation(header, states, cancellations, "adaptive", 25, min_interval=5, max_interval=25).run().summary()
+	assert summary["detected"] + summary["missed"] == 2
+
+def test_replay_synthesized(tmp_path):
+	path = str(tmp_path / "archive.gz")
+	synthesize(path, 232199, [JULY], 50, 15, sites=20, churn=0.01, start=0)
+	summaries = replay(path, [15, 60], min_stay_length=1)
+	fixed = {s["interval"]: s for s in summaries if s["policy"] == "fixed"}
+	assert fixed[15]["missed"] == 0
+	assert fixed[15]["detected"] > 0
+	assert fixed[60]["requests"] < fixed[15]["requests"]
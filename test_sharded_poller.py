@@ -0,0 +1,92 @@
+import json
+import queue
+import time
+
+from fake_recreation_server import start_server
+from poller import build_poller_parser
+from sharded_poller import *
+from sqlite_store import StateDB
+
+def test_hashRing_balancedAndStable():
+	keys = list(range(1000))
+	ring = HashRing(["worker-1", "worker-2", "worker-3", "worker-4"])
+	before = ring.assign(keys)
+	assert sorted(before) == ["worker-1", "worker-2", "worker-3", "worker-4"]
+	assert all(150 < len(v) < 350 for v in before.values())
+
+	ring.add("worker-5")
+	after = ring.assign(keys)
+	owners = {k: w for w, ks in before.items() for k in ks}
+	moved = [k for w, ks in after.items() for k in ks if owners[k] != w]
+	# Only what the new worker takes moves
+	assert sorted(moved) == sorted(after["worker-5"])
+	assert 100 < len(moved) < 300
+
+	ring.remove("worker-2")
+	again = ring.assign(keys)
+	owners = {k: w for w, ks in after.items() for k in ks}
+	assert all(owners[k] in (w, "worker-2") for w, ks in again.items() for k in ks)
+
+def test_workerPath():
+	assert worker_path("metrics.prom", "worker-1") == "metrics.worker-1.prom"
+	assert worker_path(None, "worker-1") is None
+
+def test_coordinator_splitsRateOverCurrentWorkers(tmp_path):
+	config = str(tmp_path / "watches.json")
+	with open(config, "w") as f:
+		json.dump({"campgrounds": [{"id": c, "months": ["2030-07"]} for c in [1, 2, 3]]}, f)
+	args = build_poller_parser().parse_args(["--config", config, "--rate", "6"])
+	coordinator = Coordinator(config, args, str(tmp_path / "state.db"), workers=2)
+	try:
+		for worker_id in ["worker-1", "worker-2"]:
+			coordinator.ring.add(worker_id)
+			coordinator.controls[worker_id] = queue.Queue()
+		coordinator.rebalance()
+		assert [coordinator.controls[w].get_nowait()[2] for w in ["worker-1", "worker-2"]] == [3.0, 3.0]
+		# A worker added later splits it three ways, for everyone
+		coordinator.ring.add("worker-3")
+		coordinator.controls["worker-3"] = queue.Queue()
+		coordinator.rebalance()
+		assert [coordinator.controls[w].get_nowait()[2] for w in ["worker-1", "worker-2", "worker-3"]] == [2.0, 2.0, 2.0]
+	finally:
+		coordinator.db.close()
+
+def wait_for(condition, timeout=20):
+	end = time.monotonic() + timeout
+	while not condition():
+		assert time.monotonic() < end
+		time.sleep(0.1)
+
+def test_coordinator_replacesDeadWorker(tmp_path):
+	server = start_server(port=0, latency=0, jitter=0, churn_interval=0)
+	config = str(tmp_path / "watches.json")
+	campgrounds = [232199, 232447, 234059]
+	with open(config, "w") as f:
+		json.dump({"campgrounds": [{"id": c, "months": ["2030-07"], "interval": 1} for c in campgrounds]}, f)
+	db_path = str(tmp_path / "state.db")
+	args = build_poller_parser().parse_args(["--config", config, "--base_url", server.base_url,
+		"--min_interval", "0.2", "--max_interval", "1", "--rate", "100"])
+	args.dedup_window = 60
+	db = StateDB(db_path)
+	coordinator = Coordinator(config, args, db_path, workers=2)
+	try:
+		for _ in range(2):
+			coordinator.start_worker()
+		coordinator.rebalance()
+		wait_for(lambda: all(db.cycle(c) >= 1 for c in campgrounds))
+		assert all(db.load(c) for c in campgrounds)
+
+		victim = next(w for w, cs in coordinator.assignment.items() if cs)
+		coordinator.processes[victim].kill()
+		coordinator.processes[victim].join()
+		coordinator.check()
+		assert victim not in coordinator.processes
+		assert len(coordinator.processes) == 2
+		assert sorted(c for cs in coordinator.assignment.values() for c in cs) == campgrounds
+		cycles = {c: db.cycle(c) for c in campgrounds}
+		wait_for(lambda: all(db.cycle(c) > cycles[c] for c in campgrounds))
+	finally:
+		coordinator.close()
+		db.close()
+		server.shutdown()
+		server.server_close()
@@ -0,0 +1,69 @@
+import os
+
+from snapshot_store import *
+
+def test_emptyStore(tmp_path):
+	store = SnapshotStore(str(tmp_path))
+	assert store.is_empty()
+	assert store.load() == {}
+
+def test_commitAndReopen(tmp_path):
+	store = SnapshotStore(str(tmp_path))
+	store.commit({"001": [-3, 1, 2, 400], "002": [], "010": [7]}, timestamp=100.0)
+	store.close()
+	store = SnapshotStore(str(tmp_path))
+	assert store.cycle() == 1
+	assert store.load() == {"001": [-3, 1, 2, 400], "010": [7]}
+	assert store.site_days("010") == [7]
+	assert store.site_days("003") == []
+
+def test_availabilityAt(tmp_path):
+	store = SnapshotStore(str(tmp_path))
+	store.commit({"001": [1, 2]}, timestamp=100.0)
+	store.commit({"001": [2, 3], "002": [5]}, timestamp=200.0)
+	store.commit({}, timestamp=300.0)
+	assert store.availability_at("001", 50.0) == []
+	assert store.availability_at("001", 150.0) == [1, 2]
+	assert store.availability_at("001", 250.0) == [2, 3]
+	assert store.availability_at("002", 250.0) == [5]
+	assert store.availability_at("001", 300.0) == []
+	assert [cycle for cycle, _, _ in store.history()] == [1, 2, 3]
+
+def test_commitWithChanges(tmp_path):
+	store = SnapshotStore(str(tmp_path))
+	store.commit({"001": [1, 2]}, timestamp=100.0)
+	store.commit({"001": [2, 3]}, timestamp=200.0, changes=({"001": [3]}, {"001": [1]}))
+	assert store.load() == store.replay()[0] == {"001": [2, 3]}
+
+def test_tornHistoryRecordIsDropped(tmp_path):
+	store = SnapshotStore(str(tmp_path))
+	store.commit({"001": [1, 2]}, timestamp=100.0)
+	store.close()
+	with open(os.path.join(str(tmp_path), HISTORY_FILE), "ab") as history:
+		history.write(b"\x40\x00\x00")
+	store = SnapshotStore(str(tmp_path))
+	assert store.load() == {"001": [1, 2]}
+	assert len(list(store.history())) == 1
+
+def test_corruptSnapshotIsRebuilt(tmp_path):
+	store = SnapshotStore(str(tmp_path))
+	store.commit({"001": [1, 2]}, timestamp=100.0)
+	store.commit({"001": [1, 2, 3]}, timestamp=200.0)
+	store.close()
+	with open(os.path.join(str(tmp_path), CURRENT_FILE), "r+b") as current:
+		current.seek(-1, os.SEEK_END)
+		current.write(b"\xff")
+	store = SnapshotStore(str(tmp_path))
+	assert store.load() == {"001": [1, 2, 3]}
+	assert store.cycle() == 2
+
+def test_rollForwardAfterCrashBeforeRename(tmp_path):
+	store = SnapshotStore(str(tmp_path))
+	store.commit({"001": [1]}, timestamp=100.0)
+	store.close()
+	# The history record was written but current.bin wasn't replaced
+	with open(os.path.join(str(tmp_path), HISTORY_FILE), "ab") as history:
+		history.write(encode_record(2, 200.0, {"001": [2]}, {}))
+	store = SnapshotStore(str(tmp_path))
+	assert store.load() == {"001": [1, 2]}
+	assert store.cycle() == 2
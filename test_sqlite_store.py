@@ -0,0 +1,80 @@
+from sqlite_store import *
+
+def test_commitAndFlush_sharedBetweenConnections(tmp_path):
+	path = str(tmp_path / "state.db")
+	worker = StateDB(path)
+	other = StateDB(path)
+	assert worker.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+	assert worker.is_empty(1)
+
+	worker.commit(1, {"001": [1, 2, 3], "002": [5]}, timestamp=10.0)
+	worker.commit(2, {"001": [7]}, timestamp=10.0)
+	# Nothing is written until the batch is flushed
+	assert other.is_empty(1)
+	worker.flush()
+	assert other.load(1) == {"001": [1, 2, 3], "002": [5]}
+	assert other.load(2) == {"001": [7]}
+
+	other.commit(1, {"001": [2, 3, 4]}, timestamp=20.0)
+	other.flush()
+	assert worker.load(1) == {"001": [2, 3, 4]}
+	assert worker.cycle(1) == 2
+	assert worker.site_history(1, "001") == [(10.0, [1, 2, 3], []), (20.0, [4], [1])]
+	assert worker.site_history(1, "002") == [(10.0, [5], []), (20.0, [], [5])]
+	worker.close()
+	other.close()
+
+def test_campgroundStore_withSaveStore(tmp_path):
+	from availability import load_store, save_store
+	db = StateDB(str(tmp_path / "state.db"))
+	store = CampgroundStore(db, 232199)
+	assert load_store(store) == {}
+	save_store(store, {}, {"003": [4, 5]})
+	db.flush()
+	assert not store.is_empty()
+	assert load_store(store) == {"003": [4, 5]}
+	db.close()
+
+def test_claim_dedupsWithinWindow(tmp_path):
+	path = str(tmp_path / "state.db")
+	first = StateDB(path)
+	second = StateDB(path)
+	new_intervals = {"001": [(1, 4)], "002": [(5, 6)]}
+	assert first.claim(1, new_intervals, window=60, now=100.0) == new_intervals
+	assert second.claim(1, {"001": [(1, 4), (8, 9)]}, window=60, now=110.0) == {"001": [(8, 9)]}
+	# Other campgrounds and later reopenings are notified again
+	assert second.claim(2, {"001": [(1, 4)]}, window=60, now=110.0) == {"001": [(1, 4)]}
+	assert second.claim(1, {"001": [(1, 4)]}, window=60, now=200.0) == {"001": [(1, 4)]}
+	first.close()
+	second.close()
+
+def test_claim_nothingTakesNoLock(tmp_path):
+	path = str(tmp_path / "state.db")
+	writer = StateDB(path)
+	other = StateDB(path, timeout=0.1)
+	with writer.write():
+		assert other.claim(1, {}) == {}
+	writer.close()
+	other.close()
+
+def test_saveStore_queuedMonthsDiffAgainstEachOther(tmp_path):
+	from availability import save_store
+	db = StateDB(str(tmp_path / "state.db"))
+	store = CampgroundStore(db, 1)
+	# Two months of a new campground polled in the same round
+	save_store(store, {}, {"001": [1, 2]})
+	assert not store.is_empty()
+	assert store.load() == {"001": [1, 2]}
+	save_store(store, {"001": [1, 2]}, {"001": [1, 2, 40]}, changes=({"001": [40]}, {}))
+	db.flush()
+	assert [(added, removed) for _, added, removed in db.site_history(1, "001")] == [([1, 2], []), ([40], [])]
+	assert db.load(1) == {"001": [1, 2, 40]}
+	db.close()
+
+def test_heartbeats(tmp_path):
+	db = StateDB(str(tmp_path / "state.db"))
+	db.heartbeat("worker-1", 3, now=5.0)
+	db.heartbeat("worker-2", 0, now=6.0)
+	db.remove_worker("worker-1")
+	assert db.heartbeats() == {"worker-2": 6.0}
+	db.close()
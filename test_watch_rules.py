@@ -0,0 +1,55 @@
+from availability import short_date_to_day
+from watch_rules import *
+
+def day(short_date):
+	return short_date_to_day(short_date)
+
+def make_index():
+	return RuleIndex([
+		Rule.from_config({"name": "a", "sites": ["1-3"], "dates": ["2026-07-01", "2026-07-10"], "min_stay_length": 2, "sms": ["+1"]}),
+		Rule.from_config({"name": "b", "sites": [5], "email": ["b@example.com"]}),
+		Rule.from_config({"name": "c", "dates": ["2026-08-01", "2026-08-31"], "min_stay_length": 3, "pushover": ["key"]}),
+	])
+
+def test_parseSites():
+	assert parse_sites(["1-3", 7, "9"]) == {1, 2, 3, 7, 9}
+
+def test_wantsSite():
+	index = RuleIndex([Rule("a", sites={1, 2})])
+	assert index.wants_site("002")
+	assert not index.wants_site("003")
+	assert make_index().wants_site("040")
+
+def test_match_clipsToEachRule():
+	index = make_index()
+	new_intervals = {
+		"002": [(day("7/09"), day("7/14"))],
+		"005": [(day("7/09"), day("7/10"))],
+		"040": [(day("8/30"), day("9/03"))],
+	}
+	matches = index.match(new_intervals)
+	assert matches[0] == {"002": [(day("7/09"), day("7/11"))]}
+	assert matches[1] == {"005": [(day("7/09"), day("7/10"))]}
+	# Only 2 days of it are in August
+	assert 2 not in matches
+
+def test_match_outsideDateWindow():
+	index = make_index()
+	assert index.match({"001": [(day("6/20"), day("6/30"))]}) == {}
+
+def test_match_onlyNewNightsInWindow():
+	index = make_index()
+	# A run from 7/05 grew from 7/09 to 7/14, a's window ends after the night of 7/10
+	grown = {"002": [(day("7/05"), day("7/15"))]}
+	assert index.match(grown, added={"002": list(range(day("7/09"), day("7/15")))})[0] == {"002": [(day("7/05"), day("7/11"))]}
+	# Then to 7/20, all outside the window
+	assert 0 not in index.match({"002": [(day("7/05"), day("7/20"))]}, added={"002": list(range(day("7/15"), day("7/20")))})
+
+def test_notices_perIntervalAndRecipient():
+	index = make_index()
+	notices = index.notices({"002": [(day("7/09"), day("7/14"))], "005": [(day("7/09"), day("7/10"))]}, 232447, "url")
+	assert [(n.channel, n.recipient, n.site, n.name) for n in notices] == [
+		("sms", "+1", "002", "a"),
+		("email", "b@example.com", "005", "b"),
+	]
+	assert notices[0].line == "Site 002 on 07/09, 07/10"
@@ -0,0 +1,143 @@
+from datetime import datetime
+
+from availability import REF_DATE, DEFAULT_MIN_STAY_LENGTH, format_days
+from notification_pipeline import Notice
+
+# Per subscriber rules for what availability they want to hear about.
+#
+# A rule picks sites (numbers or "first-last" ranges, all sites if left out),
+# an inclusive window of nights (all dates if left out), a minimum stay and
+# where to send messages, e.g.
+#
+#   {"name": "jordan", "campground": 232199, "sites": ["1-11", 25],
+#    "dates": ["2026-07-01", "2026-08-15"], "min_stay_length": 3,
+#    "sms": ["+15555550100"], "email": ["jordan@example.com"]}
+#
+# A rule hears about the nights of a new or grown run that fall in its
+# window, and only if some of those nights are new, so a run that grows
+# outside the window isn't sent again.
+#
+# Rules are compiled into a RuleIndex of site -> rules and date bucket ->
+# rules, so matching a cycle's new intervals only looks at the rules for
+# those sites and dates rather than at every rule.
+
+CONFIG_DATE_FORMAT = "%Y-%m-%d"
+DATE_BUCKET_DAYS = 7
+CHANNELS = ("sms", "email", "pushover")
+
+
+def config_date_to_day(datestr):
+        return (datetime.strptime(datestr, CONFIG_DATE_FORMAT) - REF_DATE).days
+
+def parse_sites(sites):
+        # [3, "1-11"] -> {1, 2, ..., 11}
+        numbers = set()
+        for s in sites:
+                first, _, last = str(s).partition("-")
+                numbers.update(range(int(first), int(last or first) + 1))
+        return numbers
+
+class Rule:
+
+        def __init__(self, name, campground=None, sites=None, first_day=None, last_day=None,
+                        min_stay_length=DEFAULT_MIN_STAY_LENGTH, channels=None):
+                self.name = name
+                self.campground = campground
+                # None means any. The window is of nights, the last one
+                # included.
+                self.sites = sites
+                self.first_day = first_day
+                self.last_day = last_day
+                self.min_stay_length = min_stay_length
+                # channel -> recipients
+                self.channels = channels or {}
+
+        @classmethod
+        def from_config(cls, config):
+                sites = parse_sites(config["sites"]) if "sites" in config else None
+                first_day = last_day = None
+                if "dates" in config:
+                        first_day, last_day = [config_date_to_day(d) for d in config["dates"]]
+                channels = {c: list(config[c]) for c in CHANNELS if c in config}
+                return cls(config["name"], config.get("campground"), sites, first_day, last_day,
+                        config.get("min_stay_length", DEFAULT_MIN_STAY_LENGTH), channels)
+
+        def clip(self, start, end):
+                # The part of [start, end) this rule wants, None if it's too short
+                if self.first_day is not None:
+                        start = max(start, self.first_day)
+                if self.last_day is not None:
+                        end = min(end, self.last_day + 1)
+                if end - start < self.min_stay_length:
+                        return None
+                return (start, end)
+
+class RuleIndex:
+
+        def __init__(self, rules):
+                self.rules = list(rules)
+                self.by_site = {}
+                self.any_site = set()
+                self.by_bucket = {}
+                self.any_date = set()
+                for i, rule in enumerate(self.rules):
+                        if rule.sites is None:
+                                self.any_site.add(i)
+                        else:
+                                for site in rule.sites:
+                                        self.by_site.setdefault(site, set()).add(i)
+                        if rule.first_day is None or rule.last_day is None:
+                                # Open ended windows aren't worth bucketing
+                                self.any_date.add(i)
+                        else:
+                                for bucket in range(rule.first_day // DATE_BUCKET_DAYS, rule.last_day // DATE_BUCKET_DAYS + 1):
+                                        self.by_bucket.setdefault(bucket, set()).add(i)
+                self.min_stay_length = min((r.min_stay_length for r in self.rules), default=DEFAULT_MIN_STAY_LENGTH)
+
+        def wants_site(self, site_number):
+                return bool(self.any_site) or int(site_number) in self.by_site
+
+        def date_rules(self, start, end):
+                found = set(self.any_date)
+                for bucket in range(start // DATE_BUCKET_DAYS, (end - 1) // DATE_BUCKET_DAYS + 1):
+                        found |= self.by_bucket.get(bucket, set())
+                return found
+
+        def match(self, new_intervals, added=None):
+                # {site: [(start, end)]} -> {rule index: {site: [(start, end)]}}
+                # with each interval clipped to what that rule asked for. With
+                # the days 'added' this cycle, {site: [days]}, a clipped interval
+                # has to have one of them.
+                matches = {}
+                for site, intervals in new_intervals.items():
+                        site_rules = self.by_site.get(int(site), set()) | self.any_site
+                        if not site_rules:
+                                continue
+                        for start, end in intervals:
+                                for i in site_rules & self.date_rules(start, end):
+                                        clipped = self.rules[i].clip(start, end)
+                                        if clipped is not None and added is not None:
+                                                if not any(clipped[0] <= d < clipped[1] for d in added.get(site, ())):
+                                                        clipped = None
+                                        if clipped is not None:
+                                                matches.setdefault(i, {}).setdefault(site, []).append(clipped)
+                return matches
+
+        def notices(self, new_intervals, campground_id, booking_url, detected=None, added=None):
+                # A Notice per matching interval for every recipient of every
+                # matching subscriber, for NotificationPipeline
+                notices = []
+                for i, site_intervals in sorted(self.match(new_intervals, added).items()):
+                        rule = self.rules[i]
+                        for site, intervals in sorted(site_intervals.items()):
+                                for start, end in intervals:
+                                        line = "Site {} on {}".format(site, format_days(range(start, end)))
+                                        for channel, recipients in sorted(rule.channels.items()):
+                                                for recipient in recipients:
+                                                        notices.append(Notice(channel, recipient, campground_id, site, start, end,
+                                                                line, booking_url, name=rule.name, detected=detected))
+                return notices
+
+def load_rules(subscribers, campground_id):
+        # The rules from a config's "subscribers" that apply to a campground
+        return [Rule.from_config(s) for s in subscribers if s.get("campground") in (None, campground_id)]